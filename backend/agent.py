@@ -0,0 +1,245 @@
+import asyncio
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_STEPS = 5
+DEFAULT_TTL_SECONDS = 1800
+DEFAULT_MAX_SESSIONS = 1000
+# messages kept per session; older turns are dropped whole
+DEFAULT_MAX_MESSAGES = 60
+
+TOOL_SCHEMAS = [
+    {
+        "name": "analyze_text",
+        "description": "Analyzes text for cognitive distortions sentence by sentence",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "text": {
+                    "type": "string",
+                    "description": "The journal entry text to analyze"
+                }
+            },
+            "required": ["text"]
+        }
+    },
+    {
+        "name": "rewrite_text",
+        "description": "Rewrite distorted text in a healthier way using Gemini API",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "text": {"type": "string", "description": "The journal entry text"},
+                "distortions": {
+                    "type": "array",
+                    "description": "List of detected distortions",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "input": {"type": "string"},
+                            "prediction": {"type": "string"},
+                            "confidence": {"type": "number"}
+                        }
+                    }
+                }
+            },
+            "required": ["text", "distortions"]
+        }
+    }
+]
+
+
+class Session:
+    # one conversation with the agent: its messages in the provider-neutral format
+    # the LLM clients' chat() takes, and the tool results computed so far
+    def __init__(self):
+        self.messages = []
+        self.memo = {}
+        self.lock = threading.Lock()
+        self.async_lock = asyncio.Lock()
+        self.touched = time.monotonic()
+
+
+class SessionStore:
+    # per-process agent sessions, dropped after ttl_seconds without a message
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.touched <= self.ttl_seconds:
+                    break
+                del self._sessions[oldest_id]
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session()
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+
+def _memo_key(name, arguments):
+    return name, json.dumps(arguments, sort_keys=True)
+
+
+def _trim_history(messages, max_messages):
+    # drops the oldest turns so at most max_messages remain, cutting only in front of
+    # a user message so no tool result is left without the call that asked for it
+    if len(messages) <= max_messages:
+        return
+    starts = [i for i, message in enumerate(messages) if message["role"] == "user"]
+    keep_from = next((i for i in starts if len(messages) - i <= max_messages), starts[-1] if starts else 0)
+    del messages[:keep_from]
+
+
+def _trim_session(session, max_messages):
+    _trim_history(session.messages, max_messages)
+    # the memo is bounded the same way, oldest results first
+    while len(session.memo) > max_messages:
+        del session.memo[next(iter(session.memo))]
+
+
+def _collect_results(session, keys, pending):
+    # (result, cached) for each call in order, from the memo or from the pending
+    # future of its (deduplicated) key; only successful results are memoized
+    results = []
+    for key in keys:
+        if key in session.memo:
+            results.append((session.memo[key], key not in pending))
+            continue
+        result, ok = pending[key].result()
+        if ok:
+            session.memo[key] = result
+        results.append((result, False))
+    return results
+
+
+class Agent:
+    # the model decides which tools to call; the tools are plain in-process functions
+    # (no HTTP round trips through our own rate-limited routes), calls from the same
+    # turn run concurrently on the executor, and results are memoized per session
+
+    def __init__(self, llm, tools, executor, max_steps=DEFAULT_MAX_STEPS, schemas=TOOL_SCHEMAS, timeout=None,
+                 max_messages=DEFAULT_MAX_MESSAGES):
+        self.llm = llm
+        self.tools = tools
+        self.executor = executor
+        self.max_steps = max_steps
+        self.schemas = schemas
+        self.timeout = timeout
+        self.max_messages = max_messages
+
+    def run(self, session, message):
+        # returns the model's final reply, or reply None when the step budget ran out
+        # before the model stopped calling tools; a turn that raises (e.g. an LLM
+        # timeout) is taken back out of the session so later turns see a clean transcript
+        with session.lock:
+            start = len(session.messages)
+            try:
+                return self._run(session, message)
+            except BaseException:
+                del session.messages[start:]
+                raise
+            finally:
+                _trim_session(session, self.max_messages)
+
+    def _run(self, session, message):
+        session.messages.append({"role": "user", "content": message})
+        steps = []
+        for _ in range(self.max_steps):
+            reply = self.llm.chat(session.messages, self.schemas, timeout=self.timeout)
+            tool_calls = reply.get("tool_calls") or []
+            session.messages.append({"role": "model", "content": reply.get("text", ""), "tool_calls": tool_calls})
+            if not tool_calls:
+                return {"reply": reply.get("text", ""), "steps": steps, "finished": True}
+
+            for call, (result, cached) in zip(tool_calls, self.call_tools(session, tool_calls)):
+                session.messages.append(
+                    {"role": "tool", "tool_call_id": call.get("id"), "name": call["name"], "content": result}
+                )
+                steps.append({"tool": call["name"], "arguments": call.get("arguments", {}), "cached": cached})
+        return {"reply": None, "steps": steps, "finished": False}
+
+    async def arun(self, session, message):
+        # event loop version of run() for asgi.py: LLM turns are awaited, coroutine
+        # tools are awaited directly and plain tools run on the executor
+        async with session.async_lock:
+            start = len(session.messages)
+            try:
+                return await self._arun(session, message)
+            except BaseException:
+                # also covers the request being cancelled mid-turn
+                del session.messages[start:]
+                raise
+            finally:
+                _trim_session(session, self.max_messages)
+
+    async def _arun(self, session, message):
+        session.messages.append({"role": "user", "content": message})
+        steps = []
+        for _ in range(self.max_steps):
+            reply = await self.llm.achat(session.messages, self.schemas, timeout=self.timeout)
+            tool_calls = reply.get("tool_calls") or []
+            session.messages.append({"role": "model", "content": reply.get("text", ""), "tool_calls": tool_calls})
+            if not tool_calls:
+                return {"reply": reply.get("text", ""), "steps": steps, "finished": True}
+
+            for call, (result, cached) in zip(tool_calls, await self.acall_tools(session, tool_calls)):
+                session.messages.append(
+                    {"role": "tool", "tool_call_id": call.get("id"), "name": call["name"], "content": result}
+                )
+                steps.append({"tool": call["name"], "arguments": call.get("arguments", {}), "cached": cached})
+        return {"reply": None, "steps": steps, "finished": False}
+
+    async def acall_tools(self, session, tool_calls):
+        keys = [_memo_key(call["name"], call.get("arguments", {})) for call in tool_calls]
+        pending = {}
+        for call, key in zip(tool_calls, keys):
+            if key not in session.memo and key not in pending:
+                pending[key] = asyncio.ensure_future(self._acall_tool(call["name"], call.get("arguments", {})))
+        if pending:
+            await asyncio.wait(pending.values())
+        return _collect_results(session, keys, pending)
+
+    async def _acall_tool(self, name, arguments):
+        tool = self.tools.get(name)
+        if tool is None:
+            return {"error": f"Unknown tool {name}"}, False
+        try:
+            if inspect.iscoroutinefunction(tool):
+                return await tool(**arguments), True
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, lambda: tool(**arguments)), True
+        except Exception as e:
+            return {"error": str(e)}, False
+
+    def call_tools(self, session, tool_calls):
+        # returns (result, cached) per call, in order; a failing tool becomes an error
+        # result the model can see, so one bad call doesn't sink the whole turn
+        keys = [_memo_key(call["name"], call.get("arguments", {})) for call in tool_calls]
+        pending = {}
+        for call, key in zip(tool_calls, keys):
+            if key not in session.memo and key not in pending:
+                pending[key] = self.executor.submit(self._call_tool, call["name"], call.get("arguments", {}))
+        return _collect_results(session, keys, pending)
+
+    def _call_tool(self, name, arguments):
+        tool = self.tools.get(name)
+        if tool is None:
+            return {"error": f"Unknown tool {name}"}, False
+        try:
+            return tool(**arguments), True
+        except Exception as e:
+            return {"error": str(e)}, False
@@ -1,20 +1,39 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import json
 from flask_cors import CORS
-import joblib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import traceback
-import re
-from database import save_feedback, init_db
+from classifier import split_sentences, split_sentence_spans, classify_embeddings, build_results, classify_entries
+from database import save_feedback, init_db, get_store, get_latest_version, get_feedback_stats
+from feedback_writer import FeedbackWriter, DEFAULT_FLUSH_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL_MS, DEFAULT_MAX_QUEUED_ROWS
+import atexit
+import queue
+from incremental import DocumentStore, RevisionConflict
+from embedding_cache import EmbeddingCache, DEFAULT_MAX_SIZE
+from encoders import load_encoder
+from memory import process_memory
+import metrics
+from metrics import stage, SENTENCES
+from model_artifacts import load_served_model, artifact_paths, pin_version
+from model_reloader import ModelReloader, validate_model
+from llm import load_llm, build_rewrite_prompt, PROMPT_VERSION, DEFAULT_TIMEOUT
+from rewrite_cache import RewriteCache, rewrite_key, DEFAULT_TTL_SECONDS, DEFAULT_MAX_SIZE as DEFAULT_REWRITE_CACHE_SIZE
+from agent import Agent, SessionStore, DEFAULT_MAX_STEPS, DEFAULT_TTL_SECONDS as DEFAULT_SESSION_TTL_SECONDS
+from batching import EncoderBatcher, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+from cascade import CascadeReloader
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from sentence_transformers import SentenceTransformer
 import os
-import google.generativeai as genai                                                                                                                                                                                                                              
 from dotenv import load_dotenv
 load_dotenv(".env.local")
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
 
 app = Flask(__name__)
-CORS(app, origins=["https://reframe-journal.vercel.app/","http://localhost:3000"])  # Enable CORS for frontend requests
+# origins the frontend is served from (asgi.py applies the same list to its routes)
+CORS_ORIGINS = ["https://reframe-journal.vercel.app/","http://localhost:3000"]
+CORS(app, origins=CORS_ORIGINS)  # Enable CORS for frontend requests
 
 # creating a limiter object to reduce the amount of requests made to our API routes
 limiter = Limiter(get_remote_address, app=app)
@@ -22,16 +41,203 @@ limiter = Limiter(get_remote_address, app=app)
 # preventing content over 16kb
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
 
+# limits for /predict/batch, which takes many entries in one request
+MAX_BATCH_ENTRIES = 100
+BATCH_MAX_CONTENT_LENGTH = 1024 * 1024
+# endpoints allowed bigger bodies than the app-wide limit
+CONTENT_LENGTH_LIMITS = {"predict_batch": BATCH_MAX_CONTENT_LENGTH}
+REQUEST_TOO_LARGE = "Request is too large"
+
+# /predict/stream encodes a small first chunk so the first highlight arrives quickly,
+# then doubles the chunk size up to this many sentences
+STREAM_MAX_CHUNK_SIZE = 32
+
+# sentence spans + results of documents being edited live, for /predict/incremental
+documents = DocumentStore(
+    ttl_seconds=float(os.environ.get("DOCUMENT_TTL_SECONDS", 600)),
+    max_documents=int(os.environ.get("MAX_DOCUMENTS", 1000)),
+)
+
 # initalize db on startup of the backend
 init_db()
 
+# FEEDBACK_WRITE_BEHIND=1 answers /feedback as soon as the row is queued and writes
+# queued rows in batches from a background thread
+feedback_writer = None
+if os.environ.get("FEEDBACK_WRITE_BEHIND", "").lower() in ("1", "true", "yes"):
+    feedback_writer = FeedbackWriter(
+        get_store(),
+        batch_size=int(os.environ.get("FEEDBACK_BATCH_SIZE", DEFAULT_FLUSH_BATCH_SIZE)),
+        flush_interval_ms=float(os.environ.get("FEEDBACK_FLUSH_MS", DEFAULT_FLUSH_INTERVAL_MS)),
+        max_queue=int(os.environ.get("FEEDBACK_MAX_QUEUE", DEFAULT_MAX_QUEUED_ROWS)),
+    )
+    # flush whatever is still queued when the worker shuts down
+    atexit.register(feedback_writer.close)
+
+# SERVER_TIMING=1 adds a Server-Timing header with each request's stage timings,
+# which browser dev tools show next to the request
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
 # get API key for cross checking with frontend requests
 API_KEY = os.environ.get("API_KEY")
 
-# Load the trained model
-model = joblib.load(os.path.join(os.path.dirname(__file__), "distortion_model.pkl"))
+# how long a request waits for the background warmup before giving up with a 503
+READY_TIMEOUT = float(os.environ.get("READY_TIMEOUT", 120))
+
+# the model, encoder and embedding cache are loaded by warm_up(), off the import path,
+# so the process can accept liveness checks while MiniLM is still loading
+model = None
+probe_embedding = None
+encoder = None
+encoder_batcher = None
+embedding_cache = None
+cascade = None
+_ready = threading.Event()
+_warmup_done = threading.Event()
+warmup_state = {"status": "pending", "error": None, "timings": {}}
+
+
+def warm_up():
+    global encoder, encoder_batcher, embedding_cache, probe_embedding
+    timings = warmup_state["timings"]
+    warmup_state["status"] = "warming"
+    try:
+        # ENCODER_BACKEND picks between the torch SentenceTransformer and the ONNX Runtime backends
+        start = time.perf_counter()
+        encoder = load_encoder()
+        timings["encoder_load"] = round(time.perf_counter() - start, 3)
+
+        # optionally merge sentences from concurrent requests into shared encoder batches
+        if os.environ.get("ENCODER_BATCHING", "").lower() in ("1", "true", "yes"):
+            encoder_batcher = EncoderBatcher(
+                encoder,
+                max_batch_size=int(os.environ.get("ENCODER_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)),
+                max_wait_ms=float(os.environ.get("ENCODER_BATCH_WAIT_MS", DEFAULT_MAX_WAIT_MS)),
+            )
+
+        # LRU cache of sentence embeddings shared by every route, so re-submitted
+        # sentences skip the encoder
+        embedding_cache = EmbeddingCache(
+            encoder_batcher or encoder,
+            max_size=int(os.environ.get("EMBEDDING_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+        )
+
+        # run one forward pass so the first real request doesn't pay for lazy init
+        start = time.perf_counter()
+        probe = encoder.encode(["warmup"])[0]
+        timings["encoder_warmup"] = round(time.perf_counter() - start, 3)
+
+        # Load the trained model; the probe embedding is also what every reloaded
+        # model is validated against before it can serve
+        start = time.perf_counter()
+        probe_embedding = probe
+        model_reloader.load_current()
+        timings["model_load"] = round(time.perf_counter() - start, 3)
+
+        # CASCADE=1 puts the TF-IDF gate in front of the encoder (see cascade.py)
+        if os.environ.get("CASCADE", "").lower() in ("1", "true", "yes"):
+            start = time.perf_counter()
+            cascade_reloader.load_current()
+            timings["cascade_load"] = round(time.perf_counter() - start, 3)
+
+        warmup_state["status"] = "ready"
+        _ready.set()
+    except Exception as e:
+        traceback.print_exc()
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+    finally:
+        _warmup_done.set()
+
+
+def set_model(served):
+    global model
+    model = served
+
+
+def set_cascade(served_cascade):
+    global cascade
+    cascade = served_cascade
+
+
+# a recalibrated band (or retrained gate) replaces the cascade on the next reload poll
+cascade_reloader = CascadeReloader(on_swap=set_cascade)
+
+
+# the model is reloaded when a new artifact lands (or a rollback pins an earlier
+# version) without restarting the worker; MODEL_RELOAD_INTERVAL=0 turns it off
+model_reloader = ModelReloader(
+    load=load_served_model,
+    get_version=get_latest_version,
+    validate=lambda estimator: validate_model(estimator, probe_embedding),
+    on_swap=set_model,
+    watched_paths=artifact_paths(),
+    poll_interval=float(os.environ.get("MODEL_RELOAD_INTERVAL", 30)),
+    pin=pin_version,
+    also_check=[cascade_reloader.check],
+)
+
+
+def wait_until_ready(timeout=READY_TIMEOUT):
+    # returns False straight away if the warmup failed instead of waiting out the timeout
+    _warmup_done.wait(timeout)
+    return _ready.is_set()
+
+
+def active_cascade(current_model):
+    # the cascade, unless it is off or its band was calibrated against another model version
+    if cascade is not None and cascade.serves(current_model.version):
+        return cascade
+    return None
+
+
+def score_sentences(current_model, current_cache, sentences):
+    # (predictions, confidences, keep) for the sentences; with the cascade on, only the
+    # ones the TF-IDF gate is unsure about are encoded and scored by the model
+    current_cascade = active_cascade(current_model)
+    if current_cascade is not None:
+        return current_cascade.classify(current_model, current_cache, sentences)
+    with stage("encode"):
+        embeddings = current_cache.encode(sentences)
+    with stage("classify"):
+        return classify_embeddings(current_model, embeddings)
+
 
-encoder = SentenceTransformer(os.path.join(os.path.dirname(__file__), "models/all-MiniLM-L6-v2"))
+def not_ready_response():
+    return jsonify({"error": "Model is still loading, please try again shortly", "warmup": warmup_state}), 503
+
+
+# WARMUP=background (the default) loads everything on a daemon thread so the worker
+# starts serving liveness checks right away; WARMUP=eager loads before returning
+if os.environ.get("WARMUP", "background") == "eager":
+    warm_up()
+else:
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+# seconds a rewrite may wait on the LLM before the request fails with a 504
+REWRITE_TIMEOUT = float(os.environ.get("REWRITE_TIMEOUT", DEFAULT_TIMEOUT))
+
+# finished rewrites keyed on (text, distortions, model, prompt version); identical
+# requests in flight at the same time share one upstream call
+rewrite_cache = RewriteCache(
+    ttl_seconds=float(os.environ.get("REWRITE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    max_size=int(os.environ.get("REWRITE_CACHE_SIZE", DEFAULT_REWRITE_CACHE_SIZE)),
+)
+
+llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    # the LLM client is only needed by /rewrite, so it is created on first use and
+    # then reused; LLM_BACKEND=stub swaps Gemini for a local stand-in
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                llm = load_llm(timeout=REWRITE_TIMEOUT)
+    return llm
 
 # route to call the model and predict CD's for each sentence
 @app.route("/predict", methods=["POST"])
@@ -46,35 +252,221 @@ def predict():
         elif len(input_text.strip()) > 5000:
             return jsonify({"error": "Text is too long, please enter a shorter message" }), 400
 
+        if not wait_until_ready():
+            return not_ready_response()
+
         # Split text into sentences (same logic as frontend expects)
-        sentences = re.split(r'(?<=[.!?])\s+', input_text.strip())
-        sentences = [s.strip() for s in sentences if s.strip()]
-
-        # create embeddings from the input sentences
-        embeddings = encoder.encode(sentences)
-        # Make predictions for each sentence
-        results = []
-        for i in range (len(sentences)):
-            prediction = model.predict([embeddings[i]])[0]
-            probs = model.predict_proba([embeddings[i]])[0]
-
-            # Get confidence for the predicted class
-            class_index = list(model.classes_).index(prediction)
-            confidence = float(probs[class_index])
-
-            if confidence > 0.2:
-                results.append({
-                    "input": sentences[i],
-                    "prediction": prediction,
-                    "confidence": round(confidence, 3)
-                })
-
-        return jsonify({"results": results})
+        with stage("split"):
+            sentences = split_sentences(input_text)
+        SENTENCES.observe(len(sentences), endpoint="/predict")
+
+        # encode the sentences and classify them with one predict_proba call over the whole matrix
+        current_model = model
+        results = build_results(sentences, *score_sentences(current_model, embedding_cache, sentences))
+
+        with stage("serialize"):
+            return jsonify({"results": results, "model_version": current_model.version})
+
+    except Exception as e:
+        return (jsonify({"error": str(e)}), 500)
+
+# streaming variant of /predict: sends one NDJSON line per sentence (with its character
+# offsets in the entry) as soon as the chunk it belongs to has been encoded
+@app.route("/predict/stream", methods=["POST"])
+@limiter.limit("20 per minute")
+def predict_stream():
+    try:
+        data = request.get_json()
+        input_text = data.get("text", "")
+
+        if not input_text:
+            return jsonify({"error": "Missing input text"}), 400
+        elif len(input_text.strip()) > 5000:
+            return jsonify({"error": "Text is too long, please enter a shorter message" }), 400
+
+        if not wait_until_ready():
+            return not_ready_response()
+
+    except Exception as e:
+        return (jsonify({"error": str(e)}), 500)
+
+    with stage("split"):
+        spans = split_sentence_spans(input_text)
+    SENTENCES.observe(len(spans), endpoint="/predict/stream")
+    # keep the objects that were live when the request started for the whole stream
+    stream_model, stream_cache = model, embedding_cache
+
+    def generate():
+        try:
+            start, size = 0, 1
+            while start < len(spans):
+                chunk = spans[start:start + size]
+                predictions, confidences, keep = score_sentences(
+                    stream_model, stream_cache, [sentence for sentence, _, _ in chunk]
+                )
+                for i, (sentence, begin, end) in enumerate(chunk):
+                    if keep[i]:
+                        yield json.dumps({
+                            "input": sentence,
+                            "prediction": str(predictions[i]),
+                            "confidence": round(float(confidences[i]), 3),
+                            "start": begin,
+                            "end": end,
+                        }) + "\n"
+                start += size
+                size = min(size * 2, STREAM_MAX_CHUNK_SIZE)
+            yield json.dumps({"done": True, "sentences": len(spans), "model_version": stream_model.version}) + "\n"
+        except Exception as e:
+            # the status line has already been sent, so report errors in-band
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# incremental variant of /predict for as-you-type analysis: the client sends a document
+# id, the revision its edit is based on and the edited text, and gets back only the
+# sentences that were added, removed, changed or moved since that revision.
+# Document state lives in this worker's memory, so a 409 tells the client to resend
+# the full text with base_revision set to null. Behind several gunicorn workers, route
+# each document to one worker (e.g. hash on the document id at the load balancer), or
+# most edits miss the worker's state and pay for a full re-score.
+@app.route("/predict/incremental", methods=["POST"])
+@limiter.limit("120 per minute")
+def predict_incremental():
+    try:
+        data = request.get_json()
+        document_id = data.get("document_id")
+        base_revision = data.get("base_revision")
+        input_text = data.get("text", "")
+
+        if not isinstance(document_id, str) or not document_id or len(document_id) > 128:
+            return jsonify({"error": "Missing document id"}), 400
+        elif base_revision is not None and not isinstance(base_revision, int):
+            return jsonify({"error": "Invalid base revision"}), 400
+        elif not isinstance(input_text, str):
+            return jsonify({"error": "Missing input text"}), 400
+        elif len(input_text.strip()) > 5000:
+            return jsonify({"error": "Text is too long, please enter a shorter message" }), 400
+
+        if not wait_until_ready():
+            return not_ready_response()
+
+        current_model, current_cache = model, embedding_cache
+
+        def classify(sentences):
+            # only the added and changed sentences get here
+            SENTENCES.observe(len(sentences), endpoint="/predict/incremental")
+            return score_sentences(current_model, current_cache, sentences)
+
+        with stage("diff"):
+            delta = documents.update(document_id, base_revision, input_text, classify)
+        delta["model_version"] = current_model.version
+        return jsonify(delta)
+
+    except RevisionConflict as e:
+        return jsonify({"error": str(e), "revision": e.revision}), 409
+    except Exception as e:
+        return (jsonify({"error": str(e)}), 500)
+
+# route to classify many journal entries at once (e.g. importing a back catalogue)
+# every sentence of every entry is encoded and classified in a single pass
+@app.route("/predict/batch", methods=["POST"])
+@limiter.limit("5 per minute")
+def predict_batch():
+    try:
+        data = request.get_json()
+        entries = data.get("entries", [])
+
+        if not entries or not isinstance(entries, list):
+            return jsonify({"error": "Missing entries"}), 400
+        elif len(entries) > MAX_BATCH_ENTRIES:
+            return jsonify({"error": f"Too many entries, please send at most {MAX_BATCH_ENTRIES}"}), 400
+        elif any(not isinstance(text, str) or len(text.strip()) > 5000 for text in entries):
+            return jsonify({"error": "Text is too long, please enter a shorter message"}), 400
+
+        if not wait_until_ready():
+            return not_ready_response()
+
+        current_model = model
+        with stage("classify_entries"):
+            results = classify_entries(current_model, embedding_cache, entries, cascade=active_cascade(current_model))
+
+        with stage("serialize"):
+            return jsonify({"results": results, "model_version": current_model.version})
 
     except Exception as e:
         return (jsonify({"error": str(e)}), 500)
 
+# start the model reload poller in whichever process ends up serving requests
+@app.before_request
+def start_model_reloader():
+    model_reloader.ensure_started()
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+
+# answer an oversized body with a 413 up front; left to get_json, the routes'
+# catch-all handlers would turn werkzeug's 413 into a 500 (asgi.py does the same)
+@app.before_request
+def refuse_large_bodies():
+    request.max_content_length = CONTENT_LENGTH_LIMITS.get(request.endpoint, app.config["MAX_CONTENT_LENGTH"])
+    if request.content_length is not None and request.content_length > request.max_content_length:
+        return jsonify({"error": REQUEST_TOO_LARGE}), 413
+
+# count every request and record its latency; streamed responses are timed up to
+# the point the body starts streaming
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    stages = metrics.finish_request(g.metrics_token)
+    # label by route pattern, not the raw path, to keep the series count bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(stages, total=elapsed)
+    return response
+
+# which model version is serving, plus the versions available for rollback
+@app.route("/model", methods=["GET"])
+def model_status():
+    return jsonify(model_reloader.status())
+
+# swap back to the previously served model without a restart; the version is
+# pinned on disk, so every worker switches to it on its next poll
+@app.route("/model/rollback", methods=["POST"])
+def model_rollback():
+    if request.headers.get("X-API-Key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        model_reloader.rollback()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(model_reloader.status())
+
 # route to post feedback to our SQL db
+def invalid_feedback(data):
+    # the error message for a feedback payload the feedback table would reject, or None;
+    # checked before the row is queued, since a write-behind client already has its id
+    if not isinstance(data, dict):
+        return "Feedback must be a JSON object"
+    text = data.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return "Feedback needs the sentence text"
+    for name in ("predicted_distortion", "user_correction"):
+        if not isinstance(data.get(name), (str, type(None))):
+            return f"{name} must be a string"
+    if not isinstance(data.get("is_accepted"), (bool, type(None))):
+        return "is_accepted must be true or false"
+    confidence = data.get("confidence")
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float, type(None))):
+        return "confidence must be a number"
+    return None
+
+
 @app.route("/feedback", methods=["POST"])
 @limiter.limit("10 per minute")
 def feedback():
@@ -83,15 +475,26 @@ def feedback():
         if request_key != API_KEY:
             return jsonify({"error": "Unauthorized"}), 401
         data = request.get_json()
-        if len(data.get("text", "").strip()) > 500:
+        error = invalid_feedback(data)
+        if error:
+            return jsonify({"error": error}), 400
+        if len(data["text"].strip()) > 500:
             return jsonify({"error": "Sentence is too long for feedback"}), 400
-        feedback_id = save_feedback(
+        fields = dict(
             text=data.get("text"),
             predicted_distortion=data.get("predicted_distortion"),
             user_correction=data.get("user_correction"),
             is_accepted=data.get("is_accepted"),
             confidence=data.get("confidence")
         )
+        with stage("feedback_write"):
+            if feedback_writer is not None:
+                feedback_id = feedback_writer.submit(**fields)
+            else:
+                feedback_id = save_feedback(**fields)
+    except queue.Full:
+        # the write-behind queue is full, ask the client to back off
+        return jsonify({"error": "Too much feedback right now, please try again shortly"}), 503
     except Exception as e:
         return (jsonify({"error": str(e)}), 500)
         
@@ -99,85 +502,208 @@ def feedback():
 
     return (jsonify({"feedback_id": feedback_id}))
 
+# per-label acceptance rates and the predicted vs corrected confusion matrix for the
+# dashboard, read from aggregate tables the database keeps up to date on every write
+@app.route("/feedback/stats", methods=["GET"])
+@limiter.limit("30 per minute")
+def feedback_stats():
+    if request.headers.get("X-API-Key") != API_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        with stage("feedback_stats"):
+            return jsonify(get_feedback_stats())
+    except Exception as e:
+        return (jsonify({"error": str(e)}), 500)
+
 # route to call the Gemini API to rewrite the journal entry in a healthier way
+def rewrite_entry(text, distortions):
+    # shared by /rewrite and the agent's rewrite_text tool
+    # 1. build the prompt and look for an earlier rewrite of the same entry
+    client = get_llm()
+    prompt = build_rewrite_prompt(text, distortions)
+    key = rewrite_key(text, distortions, client.model_name, PROMPT_VERSION)
+    # 2. call the LLM (once, however many identical requests are waiting)
+    with stage("llm"):
+        return rewrite_cache.get_or_compute(
+            key, lambda: client.generate(prompt, timeout=REWRITE_TIMEOUT), timeout=REWRITE_TIMEOUT
+        )
+
 @app.route('/rewrite', methods=['POST'])
 def rewrite():
     try:
         data = request.get_json()
-        # 1. extract text and distortions
+        # extract text and distortions
         text = data["text"]
         distortions = data["distortions"]
-        distortion_lines = "\n".join(
-            f'"{d["input"]}" → {d["prediction"]} ({d["confidence"]})'
-            for d in distortions
-        )
-        # 2. build the prompt       
-        prompt = f""" You are a therapist specializing in cognitive behavioral therapy.                                                                                    
-        The following journal entry has been analyzed for cognitive distortions.
-                                                                                                                                                        
-        Original entry:
-        {text}                                                                                                                                               
-                    
-        Detected distortions by sentence:                                                                                                                    
-        {distortion_lines}
-                                                                                                                                                        
-        Rewrite the full journal entry with healthier thought patterns, preserving the original meaning and tone.
-        Return only the rewritten entry, with no explanation or commentary."""                                                                                                                     
-    # 3. call Gemini
-        gemini_model = genai.GenerativeModel("gemini-3-flash-preview")
-        response = gemini_model.generate_content(prompt) 
-    # 4. return the result 
-        return jsonify({ "rewritten": response.text }) 
+        rewritten = rewrite_entry(text, distortions)
+        return jsonify({ "rewritten": rewritten }) 
+    except TimeoutError:
+        return jsonify({"error": "Rewrite took too long, please try again"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# streaming variant of /rewrite: forwards the rewrite as server-sent events while the
+# model is still generating it ("token" events, then one "done" event with the full
+# text, or an "error" event). If the client disconnects the server closes the
+# generator, which stops reading from the model and cancels the upstream stream.
+@app.route('/rewrite/stream', methods=['POST'])
+def rewrite_stream():
+    try:
+        data = request.get_json()
+        text = data["text"]
+        distortions = data["distortions"]
+        client = get_llm()
+        prompt = build_rewrite_prompt(text, distortions)
+        key = rewrite_key(text, distortions, client.model_name, PROMPT_VERSION)
+        cached = rewrite_cache.get(key)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        if cached is not None:
+            yield event("token", {"text": cached})
+            yield event("done", {"rewritten": cached, "cached": True})
+            return
+
+        start = time.perf_counter()
+        tokens = client.stream(prompt, timeout=REWRITE_TIMEOUT)
+        parts = []
+        try:
+            for token in tokens:
+                if not parts:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+                parts.append(token)
+                yield event("token", {"text": token})
+                if time.perf_counter() - start > REWRITE_TIMEOUT:
+                    raise TimeoutError
+            rewritten = "".join(parts)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+            rewrite_cache.put(key, rewritten)
+            yield event("done", {"rewritten": rewritten})
+        except TimeoutError:
+            yield event("error", {"error": "Rewrite took too long, please try again"})
+        except Exception as e:
+            # the status line has already been sent, so report errors in-band
+            yield event("error", {"error": str(e)})
+        finally:
+            tokens.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# agent tools call straight into the classifier and the rewrite path in this process
+def analyze_text(text):
+    if len(text.strip()) > 5000:
+        raise ValueError("Text is too long, please enter a shorter message")
+    if not wait_until_ready():
+        raise RuntimeError("Model is still loading, please try again shortly")
+    with stage("split"):
+        sentences = split_sentences(text)
+    current_model = model
+    results = build_results(sentences, *score_sentences(current_model, embedding_cache, sentences))
+    return {"results": results, "model_version": current_model.version}
+
+def rewrite_text(text, distortions):
+    return {"rewritten": rewrite_entry(text, distortions)}
+
+AGENT_TOOLS = {"analyze_text": analyze_text, "rewrite_text": rewrite_text}
+
+# how many model turns one /agent request may take before it gives up
+AGENT_MAX_STEPS = int(os.environ.get("AGENT_MAX_STEPS", DEFAULT_MAX_STEPS))
+# runs the tool calls of one turn concurrently; threads are only started on first use
+agent_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("AGENT_MAX_WORKERS", 4)), thread_name_prefix="agent-tool")
+# conversations and their memoized tool results, kept in this worker's memory
+agent_sessions = SessionStore(ttl_seconds=float(os.environ.get("AGENT_SESSION_TTL", DEFAULT_SESSION_TTL_SECONDS)))
+
+# route to let the LLM analyze and rewrite an entry by calling the tools above;
+# send the returned session_id back to continue the conversation
 @app.route('/agent', methods=["POST"])
+@limiter.limit("10 per minute")
 def agent():
-    tools = [
-        {
-            "name": "analyze_text",
-            "description": "Analyzes text for cognitive distortions sentence by sentence",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "text": {
-                        "type": "string",
-                        "description": "The journal entry text to analyze"
-                    }
-                },
-                "required": ["text"]
-            }
-        },
-        {
-            "name": "rewrite_text",
-            "description": "Rewrite distorted text in a healthier way using Gemini API",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "text": {"type": "string", "description": "The journal entry text"},
-                    "distortions": {
-                        "type": "array",
-                        "description": "List of detected distortions",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "input": {"type": "string"},
-                                "prediction": {"type": "string"},
-                                "confidence": {"type": "number"}
-                            }
-                        }
-                    }
-                },
-                "required": ["text", "distortions"]
-            }
-        }
-    ]
+    try:
+        data = request.get_json()
+        message = data.get("message", "")
+        session_id = data.get("session_id") or uuid.uuid4().hex
+
+        if not isinstance(message, str) or not message.strip():
+            return jsonify({"error": "Missing message"}), 400
+        elif len(message.strip()) > 5000:
+            return jsonify({"error": "Text is too long, please enter a shorter message" }), 400
+        elif not isinstance(session_id, str) or len(session_id) > 128:
+            return jsonify({"error": "Invalid session id"}), 400
+
+        runner = Agent(get_llm(), AGENT_TOOLS, agent_executor, max_steps=AGENT_MAX_STEPS, timeout=REWRITE_TIMEOUT)
+        with stage("agent"):
+            result = runner.run(agent_sessions.get(session_id), message)
+        result["session_id"] = session_id
+        return jsonify(result)
+    except TimeoutError:
+        return jsonify({"error": "The agent took too long, please try again"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+# the frontend pings /health to wake the backend up, so it waits for the warmup to
+# finish, but it never runs the encoder itself
 @app.route('/health', methods=["GET"])
 def health():
-    encoder.encode(["warmup"])
+    if not wait_until_ready():
+        return not_ready_response()
+    stats = {"status": "ok", "embedding_cache": embedding_cache.stats(), "memory": process_memory()}
+    if encoder_batcher is not None:
+        stats["encoder_batcher"] = encoder_batcher.stats()
+    if feedback_writer is not None:
+        stats["feedback_writer"] = feedback_writer.stats()
+    stats["rewrite_cache"] = rewrite_cache.stats()
+    return jsonify(stats)
+
+# gauges read from the live objects whenever /metrics is scraped
+metrics.registry.gauge("reframe_ready", "1 once the warmup has finished", lambda: int(_ready.is_set()))
+metrics.registry.gauge("reframe_model_version", "Model version being served", lambda: model.version if model else None)
+metrics.registry.gauge(
+    "reframe_embedding_cache", "Embedding cache counters",
+    lambda: embedding_cache and {k: v for k, v in embedding_cache.stats().items() if k != "max_size"},
+    labelnames=("stat",),
+)
+metrics.registry.gauge(
+    "reframe_encoder_batcher", "Encoder micro-batching counters",
+    lambda: encoder_batcher and encoder_batcher.stats(),
+    labelnames=("stat",),
+)
+metrics.registry.gauge(
+    "reframe_rewrite_cache", "Rewrite cache counters",
+    lambda: {k: v for k, v in rewrite_cache.stats().items() if k != "max_size"},
+    labelnames=("stat",),
+)
+metrics.registry.gauge(
+    "reframe_feedback_writer", "Feedback write-behind counters",
+    lambda: feedback_writer and feedback_writer.stats(),
+    labelnames=("stat",),
+)
+
+# per-worker metrics in the Prometheus text format
+@app.route('/metrics', methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+# liveness: the process is up and serving requests
+@app.route('/livez', methods=["GET"])
+def livez():
     return jsonify({"status": "ok"})
 
+# readiness: the model and encoder have finished warming up
+@app.route('/readyz', methods=["GET"])
+def readyz():
+    if not _ready.is_set():
+        return jsonify(warmup_state), 503
+    return jsonify(warmup_state)
+
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
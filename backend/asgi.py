@@ -0,0 +1,231 @@
+# ASGI serving mode: `uvicorn asgi:app --workers 4` (instead of `gunicorn app:app`).
+# /rewrite, /rewrite/stream and /agent spend nearly all their time waiting on the LLM,
+# so here they are served on the event loop, where a slow Gemini call doesn't hold a
+# worker. Every other route is the unchanged Flask app, run through a2wsgi on a
+# bounded thread pool, so /predict keeps its CPU-bound encoding off the loop.
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import app as wsgi
+import metrics
+from agent import Agent
+from llm import build_rewrite_prompt, PROMPT_VERSION
+from metrics import stage
+from rewrite_cache import rewrite_key
+
+# threads running the Flask routes, and so how many /predict requests encode at once
+WSGI_WORKERS = int(os.environ.get("ASGI_WSGI_WORKERS", 8))
+# threads the agent's CPU-bound tool (analyze_text) runs on
+CPU_WORKERS = int(os.environ.get("ASGI_CPU_WORKERS", 4))
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="asgi-cpu")
+
+# same limits as the Flask routes (which flask_limiter enforces for the mounted app)
+rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+AGENT_LIMIT = parse("10 per minute")
+
+# asyncio.wait_for raises asyncio.TimeoutError, which is only TimeoutError from 3.11 on
+TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def read_json(request):
+    # request.json() buffers a body of any size; this stops at the Flask app's
+    # MAX_CONTENT_LENGTH, whether or not the client sent a content-length
+    limit = wsgi.app.config["MAX_CONTENT_LENGTH"]
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise RequestTooLarge
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise RequestTooLarge
+    return json.loads(body)
+
+
+def too_large_response():
+    return JSONResponse({"error": wsgi.REQUEST_TOO_LARGE}, 413)
+
+
+def instrumented(handler):
+    # the request counters, latency histogram and Server-Timing header that app.py's
+    # before/after_request hooks give the Flask routes
+    async def route(request):
+        start = time.perf_counter()
+        token = metrics.start_request()
+        try:
+            response = await handler(request)
+        finally:
+            stages = metrics.finish_request(token)
+        elapsed = time.perf_counter() - start
+        endpoint = request.url.path
+        metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        if wsgi.SERVER_TIMING:
+            response.headers["Server-Timing"] = metrics.server_timing(stages, total=elapsed)
+        return response
+    return route
+
+
+async def arewrite_entry(text, distortions):
+    # async counterpart of app.rewrite_entry, sharing its cache and LLM client
+    client = wsgi.get_llm()
+    prompt = build_rewrite_prompt(text, distortions)
+    key = rewrite_key(text, distortions, client.model_name, PROMPT_VERSION)
+    with stage("llm"):
+        return await wsgi.rewrite_cache.aget_or_compute(
+            key, lambda: client.agenerate(prompt, timeout=wsgi.REWRITE_TIMEOUT), timeout=wsgi.REWRITE_TIMEOUT
+        )
+
+
+@instrumented
+async def rewrite(request):
+    try:
+        data = await read_json(request)
+        text = data["text"]
+        distortions = data["distortions"]
+        rewritten = await arewrite_entry(text, distortions)
+        return JSONResponse({"rewritten": rewritten})
+    except RequestTooLarge:
+        return too_large_response()
+    except TIMEOUT_ERRORS:
+        return JSONResponse({"error": "Rewrite took too long, please try again"}, 504)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+@instrumented
+async def rewrite_stream(request):
+    # same events as app.rewrite_stream; when the client disconnects Starlette cancels
+    # the response, which closes the token stream and the upstream call with it
+    try:
+        data = await read_json(request)
+        text = data["text"]
+        distortions = data["distortions"]
+        client = wsgi.get_llm()
+        prompt = build_rewrite_prompt(text, distortions)
+        key = rewrite_key(text, distortions, client.model_name, PROMPT_VERSION)
+        cached = wsgi.rewrite_cache.get(key)
+    except RequestTooLarge:
+        return too_large_response()
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+    def event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+    async def generate():
+        if cached is not None:
+            yield event("token", {"text": cached})
+            yield event("done", {"rewritten": cached, "cached": True})
+            return
+
+        start = time.perf_counter()
+        tokens = client.astream(prompt, timeout=wsgi.REWRITE_TIMEOUT)
+        parts = []
+        # one deadline for the whole stream (asyncio.timeout() needs 3.11, CI runs 3.10)
+        deadline = asyncio.get_running_loop().time() + wsgi.REWRITE_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    raise TimeoutError
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                if not parts:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+                parts.append(token)
+                yield event("token", {"text": token})
+            rewritten = "".join(parts)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+            wsgi.rewrite_cache.put(key, rewritten)
+            yield event("done", {"rewritten": rewritten})
+        except TIMEOUT_ERRORS:
+            yield event("error", {"error": "Rewrite took too long, please try again"})
+        except Exception as e:
+            yield event("error", {"error": str(e)})
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        generate(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def arewrite_text(text, distortions):
+    return {"rewritten": await arewrite_entry(text, distortions)}
+
+
+# analyze_text is CPU-bound and runs on cpu_executor; rewrite_text is awaited on the loop
+AGENT_TOOLS = {"analyze_text": wsgi.analyze_text, "rewrite_text": arewrite_text}
+
+
+@instrumented
+async def agent(request):
+    client_address = request.client.host if request.client else "127.0.0.1"
+    if not rate_limiter.hit(AGENT_LIMIT, "agent", client_address):
+        return JSONResponse({"error": "Too many requests, please try again shortly"}, 429)
+    try:
+        data = await read_json(request)
+        message = data.get("message", "")
+        session_id = data.get("session_id") or uuid.uuid4().hex
+
+        if not isinstance(message, str) or not message.strip():
+            return JSONResponse({"error": "Missing message"}, 400)
+        elif len(message.strip()) > 5000:
+            return JSONResponse({"error": "Text is too long, please enter a shorter message"}, 400)
+        elif not isinstance(session_id, str) or len(session_id) > 128:
+            return JSONResponse({"error": "Invalid session id"}, 400)
+
+        runner = Agent(wsgi.get_llm(), AGENT_TOOLS, cpu_executor, max_steps=wsgi.AGENT_MAX_STEPS, timeout=wsgi.REWRITE_TIMEOUT)
+        with stage("agent"):
+            result = await runner.arun(wsgi.agent_sessions.get(session_id), message)
+        result["session_id"] = session_id
+        return JSONResponse(result)
+    except RequestTooLarge:
+        return too_large_response()
+    except TIMEOUT_ERRORS:
+        return JSONResponse({"error": "The agent took too long, please try again"}, 504)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+ASYNC_ROUTES = [
+    Route("/rewrite", rewrite, methods=["POST"]),
+    Route("/rewrite/stream", rewrite_stream, methods=["POST"]),
+    Route("/agent", agent, methods=["POST"]),
+]
+ASYNC_PATHS = {route.path for route in ASYNC_ROUTES}
+
+async_app = Starlette(
+    routes=ASYNC_ROUTES,
+    # flask_cors' defaults: any method and header from the allowed origins
+    middleware=[Middleware(CORSMiddleware, allow_origins=wsgi.CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"])],
+)
+wsgi_app = WSGIMiddleware(wsgi.app, workers=WSGI_WORKERS)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] not in ASYNC_PATHS:
+        await wsgi_app(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import time
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5
+
+
+class _PendingRequest:
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+class EncoderBatcher:
+    # collects sentences from concurrent requests for a short window (or until a
+    # batch is full) and runs them through the encoder in one forward pass, then
+    # hands every request back its own slice of the embeddings
+
+    def __init__(self, encoder, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._owner_pid = None
+        self.batches = 0
+        self.sentences = 0
+        self.largest_batch = 0
+
+    def encode(self, sentences):
+        sentences = list(sentences)
+        if not sentences:
+            return self.encoder.encode(sentences)
+
+        self._ensure_worker()
+        pending = _PendingRequest(sentences)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.embeddings
+
+    def _ensure_worker(self):
+        # the worker thread is started lazily (and restarted after a fork) so each
+        # gunicorn worker gets its own scheduler
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._owner_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._owner_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="encoder-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        # block for the first request, then keep taking requests until the window
+        # closes or the batch is full
+        batch = [self._queue.get()]
+        size = len(batch[0].sentences)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.sentences)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            try:
+                embeddings = self.encoder.encode([s for pending in batch for s in pending.sentences])
+                start = 0
+                for pending in batch:
+                    end = start + len(pending.sentences)
+                    pending.embeddings = embeddings[start:end]
+                    start = end
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                with self._lock:
+                    self.batches += 1
+                    self.sentences += size
+                    self.largest_batch = max(self.largest_batch, size)
+                for pending in batch:
+                    pending.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "sentences": self.sentences,
+                "mean_batch_size": round(self.sentences / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,118 @@
+import argparse
+import os
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# the same number of worker processes in both modes
+SERVERS = {
+    "wsgi": lambda port, workers: ["gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"],
+    "asgi": lambda port, workers: ["uvicorn", "asgi:app", "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, workers, llm_delay_ms):
+    port = free_port()
+    env = dict(
+        os.environ,
+        LLM_BACKEND="stub",
+        STUB_LLM_DELAY_MS=str(llm_delay_ms),
+        # the benchmark only needs the routes, not the model
+        WARMUP="background",
+        MODEL_RELOAD_INTERVAL="0",
+    )
+    process = subprocess.Popen(
+        SERVERS[mode](port, workers), cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/livez", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{mode} server didn't start")
+
+
+def percentiles(latencies):
+    if not latencies:
+        return "n/a"
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return f"p50 {p50:7.1f}ms  p95 {p95:7.1f}ms"
+
+
+def run_load(url, rewrites, concurrency):
+    # fires `rewrites` distinct /rewrite requests (no cache hits) from `concurrency`
+    # clients while a separate client keeps probing a fast route, to see whether slow
+    # LLM calls starve everything else
+    rewrite_latencies, probe_latencies = [], []
+    done = threading.Event()
+
+    def rewrite(i):
+        start = time.perf_counter()
+        response = httpx.post(
+            f"{url}/rewrite", json={"text": f"benchmark entry {i} {time.time_ns()}", "distortions": []}, timeout=120
+        )
+        response.raise_for_status()
+        rewrite_latencies.append(time.perf_counter() - start)
+
+    def probe():
+        with httpx.Client(timeout=120) as client:
+            while not done.is_set():
+                start = time.perf_counter()
+                client.get(f"{url}/livez")
+                probe_latencies.append(time.perf_counter() - start)
+                time.sleep(0.05)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(rewrite, range(rewrites)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+    return elapsed, rewrite_latencies, probe_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync gunicorn workers with the ASGI mode under slow LLM calls")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--rewrites", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-delay-ms", type=float, default=500, help="how long the stub LLM takes per call")
+    args = parser.parse_args()
+
+    print(f"{args.rewrites} rewrites, {args.concurrency} concurrent clients, "
+          f"{args.workers} workers, stub LLM answering in {args.llm_delay_ms:.0f}ms")
+    for mode in args.modes.split(","):
+        process, url = start_server(mode, args.workers, args.llm_delay_ms)
+        try:
+            elapsed, rewrite_latencies, probe_latencies = run_load(url, args.rewrites, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{mode}: {args.rewrites / elapsed:6.1f} rewrites/s")
+        print(f"  /rewrite  {percentiles(rewrite_latencies)}")
+        print(f"  /livez    {percentiles(probe_latencies)}  (while rewrites are in flight)")
+
+
+if __name__ == "__main__":
+    main()
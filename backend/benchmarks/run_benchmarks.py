@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_TOLERANCE = 0.25
+
+SENTENCE_COUNTS = (1, 10, 50, 200)
+# short, distinct sentences so 200 of them still fit under /predict's 5000 character limit
+SENTENCE_TEMPLATES = (
+    "I failed test {}.",
+    "Nobody called {}.",
+    "I ruin day {}.",
+    "It rained on {}.",
+)
+
+
+def make_sentences(count, offset=0):
+    return [SENTENCE_TEMPLATES[i % len(SENTENCE_TEMPLATES)].format(offset + i) for i in range(count)]
+
+
+def summarize(latencies, items_per_call=1):
+    latencies = np.asarray(latencies)
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "per_sec": round(items_per_call * len(latencies) / float(latencies.sum()), 1),
+    }
+
+
+def timed(fn, runs, warmup=2):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_predict(runs):
+    # end to end through the Flask test client, with the embedding cache cleared
+    # before every request so each run pays for encoding
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    if not app_module.wait_until_ready():
+        raise SystemExit(f"App failed to warm up: {app_module.warmup_state}")
+    client = app_module.app.test_client()
+
+    results = {}
+    for count in SENTENCE_COUNTS:
+        text = " ".join(make_sentences(count))
+
+        def request():
+            app_module.embedding_cache.clear()
+            response = client.post("/predict", json={"text": text})
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        results[f"predict_{count}_sentences"] = summarize(timed(request, runs), items_per_call=count)
+    return results
+
+
+def bench_encoder(runs, batch_size=64):
+    from encoders import load_encoder
+
+    encoder = load_encoder()
+    batches = [make_sentences(batch_size, offset=i * batch_size) for i in range(runs + 2)]
+    it = iter(batches)
+    return {"encoder_batch_64": summarize(timed(lambda: encoder.encode(next(it)), runs), items_per_call=batch_size)}
+
+
+def bench_classifier(runs, rows=200):
+    from classifier import classify_embeddings
+    from model_artifacts import load_model
+
+    model = load_model()
+    embeddings = np.random.RandomState(0).randn(rows, model.coef_.shape[1]).astype(np.float32)
+    return {"classifier_200_rows": summarize(timed(lambda: classify_embeddings(model, embeddings), runs), items_per_call=rows)}
+
+
+def bench_storage(runs):
+    from database import get_store, init_db, save_feedback
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        init_db(path)
+        # single inserts are cheap, so take more samples for stable percentiles
+        latencies = timed(lambda: save_feedback("I always fail", "Overgeneralization", None, True, 0.8, path=path), runs * 10)
+        get_store(path).close()
+        return {"save_feedback": summarize(latencies)}
+
+
+BENCHMARKS = {
+    "predict": bench_predict,
+    "encoder": bench_encoder,
+    "classifier": bench_classifier,
+    "storage": bench_storage,
+}
+
+
+def missing_baselines(results, baselines):
+    # benchmarks that compare() would have nothing to check against
+    return [name for name in results if name not in baselines]
+
+
+def compare(results, baselines, tolerance):
+    # a benchmark regresses when its p95 latency grows, or its throughput drops,
+    # by more than the tolerance relative to the stored baseline (see missing_baselines)
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result["p95_ms"] > baseline["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {baseline['p95_ms']}ms")
+        if result["per_sec"] < baseline["per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['per_sec']}/s vs baseline {baseline['per_sec']}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmarks for the inference and storage hot paths")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated subset of " + ", ".join(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative regression before the run fails (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--no-compare", action="store_true", help="only print the results, don't check them against a baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only.split(","):
+        results.update(BENCHMARKS[name.strip()](args.runs))
+
+    print(f"{'benchmark':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per sec':>12}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result['per_sec']:>12}")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.update_baseline:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+    if args.no_compare:
+        return
+
+    # a benchmark without a baseline can't regress, so the run would pass no matter what
+    missing = missing_baselines(results, baselines)
+    if missing:
+        raise SystemExit(
+            f"No baseline in {args.baseline} for {', '.join(missing)}: record one on the reference "
+            "machine with --update-baseline, or pass --no-compare"
+        )
+
+    regressions = compare(results, baselines, args.tolerance)
+    if regressions:
+        print("Regressions beyond tolerance:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+    print("No regressions beyond tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# Offline re-scoring of a whole journal corpus, e.g. after a model update:
+#
+#   python bulk_score.py entries.csv scores/ --workers 4
+#
+# Entries are read from a .csv or .jsonl file chunk by chunk. Each chunk's sentences are
+# sorted by length and cut into large batches (so little padding is encoded), which a
+# pool of worker processes encode and classify, each loading the encoder and model once.
+# Every chunk is written as its own parquet part in the output directory (read the
+# directory with pandas.read_parquet / pyarrow.dataset), and a checkpoint records how
+# many chunks are done, so rerunning the same command after an interruption resumes.
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from classifier import classify_embeddings, split_sentence_spans
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_BATCH_SIZE = 256
+# leading "_" and "." keep pyarrow from reading these as parts of the dataset
+CHECKPOINT_NAME = "_checkpoint.json"
+
+# set in each worker process by init_worker
+_worker = {}
+
+
+def _write_atomically(path, write):
+    # a part or checkpoint is either fully written or not there at all
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp-{os.getpid()}")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _output_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("entry_id", pa.string()),
+        ("sentence_index", pa.int32()),
+        ("start", pa.int32()),
+        ("end", pa.int32()),
+        ("sentence", pa.string()),
+        ("prediction", pa.string()),
+        ("confidence", pa.float32()),
+        ("model_version", pa.int64()),
+    ])
+
+
+def read_entries(path, text_column="text", id_column=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # yields lists of at most chunk_size (entry_id, text) pairs; without an id column the
+    # entry's row number in the file is its id
+    row = 0
+    if path.endswith(".jsonl"):
+        chunk = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                entry_id = record.get(id_column) if id_column else row
+                chunk.append((str(entry_id), record.get(text_column) or ""))
+                row += 1
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    import pandas as pd
+
+    columns = [text_column] + ([id_column] if id_column else [])
+    for frame in pd.read_csv(path, usecols=columns, chunksize=chunk_size, dtype={text_column: str}):
+        texts = frame[text_column].fillna("").tolist()
+        ids = frame[id_column].astype(str).tolist() if id_column else [str(i) for i in range(row, row + len(frame))]
+        row += len(frame)
+        yield list(zip(ids, texts))
+
+
+def length_sorted_batches(sentences, batch_size):
+    # index batches over sentences of similar length, longest first, so each encoder
+    # batch pads to about its own length instead of the chunk's longest sentence
+    order = np.argsort([-len(s) for s in sentences], kind="stable")
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def load_scoring_models(encoder_backend=None, cascade=False):
+    from encoders import load_encoder
+    from model_artifacts import load_served_model
+
+    if cascade:
+        from cascade import load_cascade
+        return load_encoder(encoder_backend), load_served_model(), load_cascade()
+    return load_encoder(encoder_backend), load_served_model(), None
+
+
+def served_model_version():
+    # the version stored in the artifact the workers will load; the database's latest
+    # version is bumped by a training run before its model is published
+    from database import get_latest_version
+    from model_artifacts import artifact_version, load_served_model
+
+    version = artifact_version(load_served_model())
+    return version if version is not None else get_latest_version()
+
+
+def init_worker(loader, loader_args, threads, model_version=None):
+    # each process loads the encoder and model once and keeps them for every batch;
+    # torch would otherwise start one thread per core in every worker
+    from model_artifacts import artifact_version
+
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker["encoder"], _worker["model"], _worker["cascade"] = loader(*loader_args)
+    # a model published after the run started must not be written out under the old version
+    version = artifact_version(_worker["model"])
+    if None not in (version, model_version) and version != model_version:
+        raise RuntimeError(f"Loaded model version {version} instead of {model_version}, rerun with --restart")
+    _worker["model_version"] = model_version if model_version is not None else version
+
+
+def score_batch(sentences):
+    # runs in a worker: (predictions, confidences) for one length-sorted batch
+    encoder, model, cascade = _worker["encoder"], _worker["model"], _worker["cascade"]
+    if cascade is not None and cascade.serves(_worker["model_version"]):
+        predictions, confidences, _ = cascade.classify(model, encoder, sentences)
+    else:
+        embeddings = encoder.encode(sentences, batch_size=len(sentences))
+        predictions, confidences, _ = classify_embeddings(model, embeddings)
+    return predictions.astype(str), confidences.astype(np.float32)
+
+
+def score_chunk(entries, map_batches, batch_size, model_version):
+    # segments a chunk of entries and scores all of its sentences; returns the columns
+    # of its output part, one row per sentence in entry order
+    columns = {name: [] for name in ("entry_id", "sentence_index", "start", "end", "sentence")}
+    for entry_id, text in entries:
+        for index, (sentence, start, end) in enumerate(split_sentence_spans(text)):
+            columns["entry_id"].append(entry_id)
+            columns["sentence_index"].append(index)
+            columns["start"].append(start)
+            columns["end"].append(end)
+            columns["sentence"].append(sentence)
+
+    sentences = columns["sentence"]
+    predictions = np.empty(len(sentences), dtype=object)
+    confidences = np.empty(len(sentences), dtype=np.float32)
+    batches = length_sorted_batches(sentences, batch_size)
+    for batch, (batch_predictions, batch_confidences) in zip(
+        batches, map_batches(score_batch, [[sentences[i] for i in batch] for batch in batches])
+    ):
+        predictions[batch] = batch_predictions
+        confidences[batch] = batch_confidences
+
+    columns["prediction"] = predictions.tolist()
+    columns["confidence"] = confidences
+    columns["model_version"] = [model_version] * len(sentences)
+    return columns
+
+
+def write_part(path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table(columns, schema=_output_schema())
+    _write_atomically(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+
+def load_checkpoint(output_dir, run):
+    # the checkpoint of an earlier run of the same job, or a fresh one; a checkpoint
+    # for a different input, chunk size or model version would mix results, so it's an error
+    path = os.path.join(output_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return dict(run, chunks_done=0, entries=0, sentences=0)
+    with open(path) as f:
+        checkpoint = json.load(f)
+    mismatched = [key for key in run if checkpoint.get(key) != run[key]]
+    if mismatched:
+        raise ValueError(
+            f"{path} belongs to a different run ({', '.join(mismatched)} changed), "
+            "use another output directory or pass --restart"
+        )
+    return checkpoint
+
+
+def save_checkpoint(output_dir, checkpoint):
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f, indent=2)
+    _write_atomically(os.path.join(output_dir, CHECKPOINT_NAME), write)
+
+
+def score_file(input_path, output_dir, workers=os.cpu_count(), chunk_size=DEFAULT_CHUNK_SIZE,
+               batch_size=DEFAULT_BATCH_SIZE, text_column="text", id_column=None, model_version=None,
+               loader=load_scoring_models, loader_args=(), restart=False, progress=print):
+    # scores every entry of input_path into parquet parts under output_dir, skipping
+    # the chunks an earlier interrupted run already wrote; workers=0 scores in-process.
+    # Returns the checkpoint, with entry and sentence totals
+    os.makedirs(output_dir, exist_ok=True)
+    run = {
+        "input": os.path.abspath(input_path),
+        "chunk_size": chunk_size,
+        "text_column": text_column,
+        "id_column": id_column,
+        "model_version": model_version,
+    }
+    if restart:
+        # parts of the earlier run that this one won't overwrite would be read along with it
+        for name in os.listdir(output_dir):
+            if name == CHECKPOINT_NAME or (name.startswith("part-") and name.endswith(".parquet")):
+                os.remove(os.path.join(output_dir, name))
+    checkpoint = load_checkpoint(output_dir, run)
+    if checkpoint["chunks_done"]:
+        progress(f"Resuming after chunk {checkpoint['chunks_done']} "
+                 f"({checkpoint['entries']} entries, {checkpoint['sentences']} sentences already scored)")
+
+    executor = None
+    if workers:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(loader, loader_args, threads, model_version))
+        map_batches = executor.map
+    else:
+        init_worker(loader, loader_args, None, model_version)
+        map_batches = map
+
+    start = time.perf_counter()
+    scored = 0
+    try:
+        for number, entries in enumerate(read_entries(input_path, text_column, id_column, chunk_size)):
+            if number < checkpoint["chunks_done"]:
+                continue
+            columns = score_chunk(entries, map_batches, batch_size, model_version)
+            write_part(os.path.join(output_dir, f"part-{number:05d}.parquet"), columns)
+
+            checkpoint["chunks_done"] = number + 1
+            checkpoint["entries"] += len(entries)
+            checkpoint["sentences"] += len(columns["sentence"])
+            save_checkpoint(output_dir, checkpoint)
+
+            scored += len(columns["sentence"])
+            elapsed = time.perf_counter() - start
+            progress(f"chunk {number}: {checkpoint['entries']} entries, {checkpoint['sentences']} sentences "
+                     f"({scored / elapsed:,.0f} sentences/s)")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    checkpoint["elapsed_seconds"] = round(elapsed, 3)
+    checkpoint["sentences_per_second"] = round(scored / elapsed, 1) if elapsed else None
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a corpus of journal entries with the current model")
+    parser.add_argument("input", help=".csv or .jsonl file with one entry per row")
+    parser.add_argument("output_dir", help="directory for the parquet parts and _checkpoint.json")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--id-column", help="column to copy into entry_id (default: the row number)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, 0 scores in-process")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="entries read (and checkpointed) at a time")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="sentences per encoder batch")
+    parser.add_argument("--encoder-backend", help="torch, onnx or onnx-int8 (default: ENCODER_BACKEND)")
+    parser.add_argument("--cascade", action="store_true", help="only encode the sentences the TF-IDF gate is unsure about")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and score from the start")
+    args = parser.parse_args()
+
+    result = score_file(
+        args.input, args.output_dir, workers=args.workers, chunk_size=args.chunk_size,
+        batch_size=args.batch_size, text_column=args.text_column, id_column=args.id_column,
+        model_version=served_model_version(), loader_args=(args.encoder_backend, args.cascade),
+        restart=args.restart,
+    )
+    print(f"Scored {result['entries']} entries, {result['sentences']} sentences into {args.output_dir} "
+          f"({result['sentences_per_second']} sentences/s this run)")
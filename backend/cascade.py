@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import traceback
+
+import joblib
+import numpy as np
+
+from classifier import CONFIDENCE_THRESHOLD, classify_embeddings
+from metrics import CASCADE_SENTENCES, stage
+from model_reloader import file_signature
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+GATE_PATH = os.path.join(BACKEND_DIR, "tfidf_gate.pkl")
+# the calibrated uncertainty band, the model version it was calibrated against and
+# the held-out metrics it was picked with
+BAND_PATH = os.path.join(BACKEND_DIR, "cascade_band.json")
+
+# escalate everything the gate is less than 90% sure of until a band is calibrated
+DEFAULT_BAND = (0.0, 0.9)
+# the most held-out accuracy calibration may give up to escalate fewer sentences
+DEFAULT_MAX_ACCURACY_DROP = 0.01
+BAND_GRID = np.round(np.arange(0.0, 1.0001, 0.05), 2)
+
+
+def top_class(probs, classes):
+    best = np.argmax(probs, axis=1)
+    return np.asarray(classes)[best], probs[np.arange(len(best)), best]
+
+
+def escalation_mask(confidences, low, high):
+    # sentences the gate is unsure about go on to the encoder + embedding model
+    return (confidences >= low) & (confidences < high)
+
+
+class CascadeClassifier:
+    # a small TF-IDF + LogisticRegression gate scores every sentence from its words
+    # alone; only sentences whose top gate probability falls in [low, high) are
+    # encoded and classified by the embedding model, the rest keep the gate's answer
+
+    def __init__(self, gate, low=DEFAULT_BAND[0], high=DEFAULT_BAND[1], model_version=None):
+        self.gate = gate
+        self.low = low
+        self.high = high
+        self.model_version = model_version
+        self._refused = set()
+
+    def serves(self, model_version):
+        # a band calibrated against one model says nothing about the accuracy of another,
+        # so after a model swap the cascade steps aside until it is recalibrated
+        if self.model_version is None or model_version == self.model_version:
+            return True
+        if model_version not in self._refused:
+            self._refused.add(model_version)
+            logger.warning(
+                "Cascade band was calibrated for model version %s, not %s; encoding every sentence "
+                "until `python cascade.py calibrate` is rerun (running workers pick the new band up "
+                "on their next reload poll)", self.model_version, model_version,
+            )
+        return False
+
+    def classify(self, model, encoder, sentences, threshold=CONFIDENCE_THRESHOLD):
+        # same (predictions, confidences, keep) as classifier.classify_embeddings
+        if not sentences:
+            return np.empty(0, dtype=object), np.empty(0), np.empty(0, dtype=bool)
+
+        with stage("gate"):
+            predictions, confidences = top_class(self.gate.predict_proba(sentences), self.gate.classes_)
+        predictions = predictions.astype(object)
+        escalated = np.flatnonzero(escalation_mask(confidences, self.low, self.high))
+
+        if len(escalated):
+            with stage("encode"):
+                embeddings = encoder.encode([sentences[i] for i in escalated])
+            with stage("classify"):
+                model_predictions, model_confidences, _ = classify_embeddings(model, embeddings, threshold)
+            predictions[escalated] = model_predictions
+            confidences[escalated] = model_confidences
+
+        CASCADE_SENTENCES.inc(len(sentences) - len(escalated), path="gate")
+        CASCADE_SENTENCES.inc(len(escalated), path="encoder")
+        return predictions, confidences, confidences > threshold
+
+
+def load_cascade(gate_path=GATE_PATH, band_path=BAND_PATH):
+    # CASCADE_BAND="low,high" overrides the calibrated band (for whichever model is serving)
+    if not os.path.exists(gate_path):
+        raise FileNotFoundError(f"No TF-IDF gate at {gate_path}, run python cascade.py train first")
+    low, high = DEFAULT_BAND
+    model_version = None
+    if os.path.exists(band_path):
+        with open(band_path) as f:
+            band = json.load(f)
+        low, high, model_version = band["low"], band["high"], band.get("model_version")
+    if os.environ.get("CASCADE_BAND"):
+        low, high = (float(value) for value in os.environ["CASCADE_BAND"].split(","))
+        model_version = None
+    return CascadeClassifier(joblib.load(gate_path), low, high, model_version)
+
+
+class CascadeReloader:
+    # swaps in a new gate and band when `python cascade.py train` or `calibrate` rewrites
+    # them, so recalibrating after a model reload doesn't need a restart; polled from the
+    # model reloader's thread (see ModelReloader's also_check)
+
+    def __init__(self, on_swap, load=load_cascade, watched_paths=(GATE_PATH, BAND_PATH)):
+        self.on_swap = on_swap
+        self.load = load
+        self.watched_paths = watched_paths
+        self.current = None
+        self.last_error = None
+        self._seen = None
+        self._lock = threading.Lock()
+
+    def load_current(self):
+        # initial load, done by the app's warmup when the cascade is on
+        with self._lock:
+            signature = file_signature(self.watched_paths)
+            self.current = self.load()
+            self._seen = signature
+            self.on_swap(self.current)
+            return self.current
+
+    def check(self):
+        # returns True if a new gate or band was swapped in
+        with self._lock:
+            if self.current is None:
+                return False
+            signature = file_signature(self.watched_paths)
+            if signature == self._seen:
+                return False
+            try:
+                cascade = self.load()
+            except Exception as e:
+                # keep the current cascade; a half-written band is retried on the next poll
+                traceback.print_exc()
+                self.last_error = str(e)
+                return False
+            self._seen = signature
+            self.last_error = None
+            self.current = cascade
+            self.on_swap(cascade)
+            return True
+
+
+def evaluate_band(gate_predictions, gate_confidences, model_predictions, y_true, low, high):
+    escalate = escalation_mask(gate_confidences, low, high)
+    predictions = np.where(escalate, model_predictions, gate_predictions)
+    return {
+        "low": float(low),
+        "high": float(high),
+        "escalation_rate": round(float(escalate.mean()), 4),
+        "accuracy": round(float((predictions == y_true).mean()), 4),
+    }
+
+
+def calibrate_band(gate_predictions, gate_confidences, model_predictions, y_true,
+                   max_accuracy_drop=DEFAULT_MAX_ACCURACY_DROP, grid=BAND_GRID):
+    # tries every [low, high) band on the grid and keeps the one that escalates the
+    # fewest sentences while staying within max_accuracy_drop of the embedding model
+    # on its own; escalating everything is always a candidate, so there is an answer
+    full_accuracy = float((np.asarray(model_predictions) == np.asarray(y_true)).mean())
+    candidates = [
+        evaluate_band(gate_predictions, gate_confidences, model_predictions, y_true, low, high)
+        for low in grid for high in grid if low < high
+    ]
+    candidates.append(evaluate_band(gate_predictions, gate_confidences, model_predictions, y_true, 0.0, np.inf))
+    good_enough = [c for c in candidates if c["accuracy"] >= full_accuracy - max_accuracy_drop]
+    best = min(good_enough, key=lambda c: (c["escalation_rate"], -c["accuracy"], c["high"] - c["low"]))
+    return best, candidates
+
+
+def serving_model():
+    # the model the app serves right now (a pinned rollback included) and its version
+    from database import get_latest_version
+    from model_artifacts import artifact_version, load_served_model
+
+    model = load_served_model()
+    version = artifact_version(model)
+    return model, version if version is not None else get_latest_version()
+
+
+def calibrate(gate, X_test, y_test, X_test_embedded, max_accuracy_drop):
+    model, model_version = serving_model()
+    gate_predictions, gate_confidences = top_class(gate.predict_proba(X_test), gate.classes_)
+    full_predictions = classify_embeddings(model, X_test_embedded)[0].astype(str)
+    best, candidates = calibrate_band(gate_predictions, gate_confidences, full_predictions, y_test, max_accuracy_drop)
+
+    full_accuracy = float((full_predictions == y_test).mean())
+    gate_accuracy = float((gate_predictions == y_test).mean())
+    print(f"Held-out accuracy: embedding model {full_accuracy:.2%}, TF-IDF gate alone {gate_accuracy:.2%}")
+    print(f"{'band':<14}{'escalated':>10}{'accuracy':>10}")
+    for c in sorted(candidates, key=lambda c: c["escalation_rate"])[::max(1, len(candidates) // 15)]:
+        print(f"[{c['low']:.2f}, {c['high']:.2f}){c['escalation_rate']:>10.1%}{c['accuracy']:>10.2%}")
+    print(f"Chosen band [{best['low']:.2f}, {best['high']:.2f}): escalates {best['escalation_rate']:.1%} "
+          f"of sentences at {best['accuracy']:.2%} accuracy")
+
+    band = dict(best, model_version=model_version, model_accuracy=round(full_accuracy, 4),
+                gate_accuracy=round(gate_accuracy, 4), max_accuracy_drop=max_accuracy_drop, test_size=len(y_test))
+    from model_artifacts import save_band
+    save_band(band, BAND_PATH)
+    print(f"Band for model version {model_version} saved to {BAND_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and calibrate the TF-IDF gate in front of the embedding model")
+    parser.add_argument("command", choices=["train", "calibrate"],
+                        help="train fits the gate and then calibrates it, calibrate reuses the saved gate")
+    parser.add_argument("--max-accuracy-drop", type=float, default=DEFAULT_MAX_ACCURACY_DROP)
+    args = parser.parse_args()
+
+    from dataset import held_out_split
+
+    X_train, X_test, y_train, y_test, X_test_embedded = held_out_split()
+    if args.command == "train":
+        from model_artifacts import save_gate
+        from tune_model import build_tfidf_pipeline
+
+        gate = build_tfidf_pipeline()
+        gate.fit(X_train, y_train)
+        save_gate(gate, GATE_PATH)
+        print(f"Gate trained on {len(y_train)} sentences and saved to {GATE_PATH}")
+    else:
+        gate = joblib.load(GATE_PATH)
+    calibrate(gate, X_test, y_test, X_test_embedded, args.max_accuracy_drop)
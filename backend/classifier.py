@@ -0,0 +1,93 @@
+import re
+
+import numpy as np
+
+# sentences below this confidence are not returned to the frontend
+CONFIDENCE_THRESHOLD = 0.2
+
+# same sentence boundary the frontend and the training scripts use
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text):
+    # split an entry into sentences, dropping empty pieces
+    sentences = SENTENCE_BOUNDARY.split(text.strip())
+    return [s.strip() for s in sentences if s.strip()]
+
+
+def split_sentence_spans(text):
+    # like split_sentences, but also returns each sentence's [start, end) character
+    # offsets in the original text so the frontend can highlight it in place
+    spans = []
+    start = 0
+    for boundary in list(SENTENCE_BOUNDARY.finditer(text)) + [None]:
+        end = boundary.start() if boundary else len(text)
+        piece = text[start:end]
+        stripped = piece.strip()
+        if stripped:
+            offset = start + (len(piece) - len(piece.lstrip()))
+            spans.append((stripped, offset, offset + len(stripped)))
+        if boundary:
+            start = boundary.end()
+    return spans
+
+
+def classify_embeddings(model, embeddings, threshold=CONFIDENCE_THRESHOLD):
+    # score every row of the embedding matrix with a single predict_proba call
+    # and pick the winning class + its probability with numpy, instead of calling
+    # predict and predict_proba once per sentence
+    embeddings = np.asarray(embeddings)
+    if len(embeddings) == 0:
+        return np.empty(0, dtype=object), np.empty(0), np.empty(0, dtype=bool)
+
+    probs = model.predict_proba(embeddings)
+    best = np.argmax(probs, axis=1)
+    predictions = np.asarray(model.classes_)[best]
+    confidences = probs[np.arange(len(best)), best]
+
+    # vectorized version of the old "if confidence > 0.2" check
+    keep = confidences > threshold
+    return predictions, confidences, keep
+
+
+def build_results(sentences, predictions, confidences, keep):
+    # turn the classifier output into the JSON rows the frontend expects
+    return [
+        {
+            "input": sentences[i],
+            "prediction": str(predictions[i]),
+            "confidence": round(float(confidences[i]), 3),
+        }
+        for i in np.flatnonzero(keep)
+    ]
+
+
+def classify_sentences(model, sentences, embeddings, threshold=CONFIDENCE_THRESHOLD):
+    predictions, confidences, keep = classify_embeddings(model, embeddings, threshold)
+    return build_results(sentences, predictions, confidences, keep)
+
+
+def classify_entries(model, encoder, entries, threshold=CONFIDENCE_THRESHOLD, cascade=None):
+    # segment every entry, encode all of their sentences in one pass and
+    # classify the whole matrix at once, then hand each entry back its own rows;
+    # a cascade.CascadeClassifier only sends the sentences its gate is unsure about to the encoder
+    entry_sentences = [split_sentences(text) for text in entries]
+    all_sentences = [s for sentences in entry_sentences for s in sentences]
+    if not all_sentences:
+        return [[] for _ in entries]
+
+    if cascade is not None:
+        predictions, confidences, keep = cascade.classify(model, encoder, all_sentences, threshold)
+    else:
+        embeddings = encoder.encode(all_sentences)
+        predictions, confidences, keep = classify_embeddings(model, embeddings, threshold)
+
+    results = []
+    start = 0
+    for sentences in entry_sentences:
+        end = start + len(sentences)
+        results.append(
+            build_results(sentences, predictions[start:end], confidences[start:end], keep[start:end])
+        )
+        start = end
+    return results
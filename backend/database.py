@@ -1,137 +1,378 @@
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-DATABASE_PATH = "feedback.db"
-
+from metrics import stage
 
-def init_db(path=DATABASE_PATH):
-    # create a connection to the db
-    conn = sqlite3.connect(path)
+DATABASE_PATH = "feedback.db"
 
-    # create cursor
-    cursor = conn.cursor()
+# how long a writer waits for another connection's lock before giving up
+BUSY_TIMEOUT_MS = 5000
 
-    # create feedback table if it doesn't exist
-    cursor.execute(
-        """ CREATE TABLE IF NOT EXISTS feedback (
+# statements are kept as module constants so every call passes sqlite3 the exact
+# same string and it reuses the connection's cached prepared statement
+CREATE_FEEDBACK_TABLE = """ CREATE TABLE IF NOT EXISTS feedback (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                    text TEXT NOT NULL,
-                   predicted_distortion TEXT, 
-                   user_correction TEXT, 
+                   predicted_distortion TEXT,
+                   user_correction TEXT,
                    is_accepted BOOLEAN,
                    confidence REAL,
                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                    used_in_training BOOLEAN DEFAULT FALSE)
                    """
-    )
-    # create model_versions table if it doesn't exist
-    cursor.execute(
-        """ CREATE TABLE IF NOT EXISTS model_versions (
+CREATE_MODEL_VERSIONS_TABLE = """ CREATE TABLE IF NOT EXISTS model_versions (
                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                    version_number INTEGER,
                    training_samples INTEGER,
                    accuracy REAL,
                    notes TEXT
                    )"""
-    )
-
-    # save the changes via
-    conn.commit()
+INSERT_FEEDBACK = """ INSERT INTO feedback (text, predicted_distortion, user_correction, is_accepted, confidence)
+                   VALUES (?,?,?,?,?)"""
+INSERT_FEEDBACK_WITH_ID = """ INSERT INTO feedback (id, text, predicted_distortion, user_correction, is_accepted, confidence)
+                   VALUES (?,?,?,?,?,?)"""
+SELECT_FEEDBACK_SEQUENCE = "SELECT seq FROM sqlite_sequence WHERE name='feedback'"
+SELECT_MAX_FEEDBACK_ID = "SELECT COALESCE(MAX(id), 0) FROM feedback"
+INSERT_FEEDBACK_SEQUENCE = "INSERT INTO sqlite_sequence (name, seq) VALUES ('feedback', ?)"
+UPDATE_FEEDBACK_SEQUENCE = "UPDATE sqlite_sequence SET seq=? WHERE name='feedback'"
+SELECT_FEEDBACK = """ SELECT * FROM feedback """
+FEEDBACK_COLUMNS = (
+    "id", "text", "predicted_distortion", "user_correction", "is_accepted",
+    "confidence", "timestamp", "used_in_training",
+)
+# keyset pagination: each page starts after the last id of the previous one, so every
+# page is an index range scan on the primary key however deep into the table it is
+SELECT_FEEDBACK_PAGE = f""" SELECT {", ".join(FEEDBACK_COLUMNS)} FROM feedback
+                   WHERE id > ? ORDER BY id LIMIT ?"""
+INSERT_IMPORTED_FEEDBACK = """ INSERT INTO feedback
+                   (text, predicted_distortion, user_correction, is_accepted, confidence, timestamp, used_in_training)
+                   VALUES (?,?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP),COALESCE(?, FALSE))"""
+SELECT_TRAINING_FEEDBACK = """ SELECT text, user_correction FROM feedback WHERE is_accepted IS FALSE AND used_in_training IS FALSE"""
+SELECT_TRAINING_FEEDBACK_WITH_IDS = """ SELECT id, text, user_correction FROM feedback WHERE is_accepted IS FALSE AND used_in_training IS FALSE"""
+# written as IS FALSE so it matches the partial index on unused rows
+MARK_USED_FEEDBACK = "UPDATE feedback SET used_in_training=TRUE WHERE used_in_training IS FALSE"
+MARK_USED_FEEDBACK_ID = "UPDATE feedback SET used_in_training=TRUE WHERE id = ?"
+INSERT_MODEL_VERSION = """ INSERT INTO model_versions (version_number, training_samples, accuracy, notes)
+                   VALUES (?,?,?,?)"""
+SELECT_LATEST_VERSION = """ SELECT MAX(version_number) FROM model_versions """
+SELECT_LABEL_STATS = "SELECT label, total, accepted FROM feedback_label_stats WHERE total > 0 ORDER BY label"
+SELECT_CONFUSION = "SELECT predicted, actual, count FROM feedback_confusion WHERE count > 0 ORDER BY predicted, actual"
+
+# the label a piece of feedback says is right: the prediction if it was accepted,
+# otherwise the user's correction (NULL when they rejected it without one)
+_ACTUAL_LABEL = "CASE WHEN {row}.is_accepted THEN {row}.predicted_distortion ELSE {row}.user_correction END"
+
+# trigger bodies that add a row to, or take it out of, the aggregate tables
+_ADD_TO_STATS = f"""
+    INSERT INTO feedback_label_stats (label, total, accepted)
+        SELECT {{row}}.predicted_distortion, 1, CASE WHEN {{row}}.is_accepted THEN 1 ELSE 0 END
+        WHERE {{row}}.predicted_distortion IS NOT NULL
+        ON CONFLICT(label) DO UPDATE SET total = total + 1, accepted = accepted + excluded.accepted;
+    INSERT INTO feedback_confusion (predicted, actual, count)
+        SELECT {{row}}.predicted_distortion, {_ACTUAL_LABEL}, 1
+        WHERE {{row}}.predicted_distortion IS NOT NULL AND ({_ACTUAL_LABEL}) IS NOT NULL
+        ON CONFLICT(predicted, actual) DO UPDATE SET count = count + 1;"""
+_REMOVE_FROM_STATS = f"""
+    UPDATE feedback_label_stats
+        SET total = total - 1, accepted = accepted - CASE WHEN {{row}}.is_accepted THEN 1 ELSE 0 END
+        WHERE label = {{row}}.predicted_distortion;
+    UPDATE feedback_confusion SET count = count - 1
+        WHERE predicted = {{row}}.predicted_distortion AND actual = ({_ACTUAL_LABEL});"""
+
+# partial index over the rows not yet trained on; mark_used_feedback flips all of
+# them, so it only ever holds the feedback since the last training run. It also
+# covers get_training_feedback, which then never touches the table
+CREATE_UNUSED_INDEX = """ CREATE INDEX IF NOT EXISTS idx_feedback_unused
+                   ON feedback (is_accepted, text, user_correction, used_in_training)
+                   WHERE used_in_training IS FALSE"""
+DROP_UNUSED_INDEX = "DROP INDEX IF EXISTS idx_feedback_unused"
+
+# per predicted label counts and the predicted vs actual matrix, kept up to date by
+# triggers so /feedback/stats never scans the feedback table
+CREATE_LABEL_STATS_TABLE = """ CREATE TABLE IF NOT EXISTS feedback_label_stats (
+                   label TEXT PRIMARY KEY,
+                   total INTEGER NOT NULL DEFAULT 0,
+                   accepted INTEGER NOT NULL DEFAULT 0)"""
+CREATE_CONFUSION_TABLE = """ CREATE TABLE IF NOT EXISTS feedback_confusion (
+                   predicted TEXT NOT NULL,
+                   actual TEXT NOT NULL,
+                   count INTEGER NOT NULL DEFAULT 0,
+                   PRIMARY KEY (predicted, actual))"""
+CREATE_STATS_TRIGGERS = [
+    f""" CREATE TRIGGER IF NOT EXISTS feedback_stats_insert AFTER INSERT ON feedback
+                   BEGIN {_ADD_TO_STATS.format(row="NEW")}
+                   END""",
+    f""" CREATE TRIGGER IF NOT EXISTS feedback_stats_delete AFTER DELETE ON feedback
+                   BEGIN {_REMOVE_FROM_STATS.format(row="OLD")}
+                   END""",
+    f""" CREATE TRIGGER IF NOT EXISTS feedback_stats_update
+                   AFTER UPDATE OF predicted_distortion, user_correction, is_accepted ON feedback
+                   BEGIN {_REMOVE_FROM_STATS.format(row="OLD")} {_ADD_TO_STATS.format(row="NEW")}
+                   END""",
+]
+DROP_STATS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS feedback_stats_insert",
+    "DROP TRIGGER IF EXISTS feedback_stats_delete",
+    "DROP TRIGGER IF EXISTS feedback_stats_update",
+]
+# recompute the aggregates from scratch with one pass over feedback
+REBUILD_STATS = [
+    "DELETE FROM feedback_label_stats",
+    "DELETE FROM feedback_confusion",
+    """ INSERT INTO feedback_label_stats (label, total, accepted)
+                   SELECT predicted_distortion, COUNT(*), SUM(CASE WHEN is_accepted THEN 1 ELSE 0 END)
+                   FROM feedback WHERE predicted_distortion IS NOT NULL GROUP BY predicted_distortion""",
+    f""" INSERT INTO feedback_confusion (predicted, actual, count)
+                   SELECT predicted_distortion, {_ACTUAL_LABEL.format(row="feedback")}, COUNT(*)
+                   FROM feedback
+                   WHERE predicted_distortion IS NOT NULL AND ({_ACTUAL_LABEL.format(row="feedback")}) IS NOT NULL
+                   GROUP BY 1, 2""",
+]
+
+# schema changes after the original two tables, applied in order by init_db; the
+# database's PRAGMA user_version records how many of them have run
+MIGRATIONS = [
+    # indexes for the training queries, and the stats aggregates (backfilled from
+    # the rows written before this migration)
+    [CREATE_UNUSED_INDEX, CREATE_LABEL_STATS_TABLE, CREATE_CONFUSION_TABLE, *CREATE_STATS_TRIGGERS, *REBUILD_STATS],
+]
+
+
+class FeedbackStore:
+    # keeps one long-lived connection per thread (instead of connecting for every
+    # statement), with WAL so readers don't block the writer
+
+    def __init__(self, path=DATABASE_PATH, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        # a connection inherited from the gunicorn master must not be used after fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                cached_statements=128,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            # with WAL, NORMAL only syncs at checkpoints and is still crash safe
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a transaction never fails
+        # halfway through trying to upgrade a read lock; nested calls join the outer one
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        # timed from BEGIN (including any wait for the write lock) to COMMIT
+        with stage("db_transaction"):
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.depth = 1
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+            finally:
+                self._local.depth = 0
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_db(self):
+        with self.transaction() as conn:
+            conn.execute(CREATE_FEEDBACK_TABLE)
+            conn.execute(CREATE_MODEL_VERSIONS_TABLE)
+            self.migrate()
+
+    def migrate(self):
+        # runs every migration this database hasn't seen yet; BEGIN IMMEDIATE means two
+        # workers starting at once can't both apply the same one
+        with self.transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={number}")
+
+    def save_feedback(self, text, predicted_distortion, user_correction, is_accepted, confidence) -> int:
+        with self.transaction() as conn:
+            cursor = conn.execute(INSERT_FEEDBACK, (text, predicted_distortion, user_correction, is_accepted, confidence))
+            return cursor.lastrowid
+
+    def reserve_feedback_ids(self, count):
+        # hands out a block of ids by moving the AUTOINCREMENT counter forward, so
+        # write-behind rows can be given their id before they are inserted without
+        # clashing with other processes or with plain inserts
+        with self.transaction() as conn:
+            row = conn.execute(SELECT_FEEDBACK_SEQUENCE).fetchone()
+            if row is None:
+                # sqlite only creates the counter on the table's first insert
+                last = conn.execute(SELECT_MAX_FEEDBACK_ID).fetchone()[0]
+                conn.execute(INSERT_FEEDBACK_SEQUENCE, (last + count,))
+            else:
+                last = row[0]
+                conn.execute(UPDATE_FEEDBACK_SEQUENCE, (last + count,))
+        return range(last + 1, last + count + 1)
+
+    def save_feedback_batch(self, rows):
+        # rows are (id, text, predicted_distortion, user_correction, is_accepted, confidence)
+        with self.transaction() as conn:
+            conn.executemany(INSERT_FEEDBACK_WITH_ID, rows)
+
+    def retrieve_feedback(self):
+        return self.connection().execute(SELECT_FEEDBACK).fetchall()
+
+    def iter_feedback_pages(self, page_size=1000, after_id=0):
+        # yields lists of at most page_size rows (in FEEDBACK_COLUMNS order), holding
+        # only one page in memory at a time
+        conn = self.connection()
+        while True:
+            page = conn.execute(SELECT_FEEDBACK_PAGE, (after_id, page_size)).fetchall()
+            if not page:
+                return
+            yield page
+            after_id = page[-1][0]
+
+    def import_feedback_batch(self, rows):
+        # rows are (text, predicted_distortion, user_correction, is_accepted, confidence,
+        # timestamp, used_in_training); imported rows get new ids in this database
+        with self.transaction() as conn:
+            conn.executemany(INSERT_IMPORTED_FEEDBACK, rows)
+
+    @contextmanager
+    def deferred_maintenance(self):
+        # drops the partial index and the stats triggers for a bulk import, then
+        # rebuilds both with a single pass over the table; writers from a running app
+        # during this window would be left out of the stats until the rebuild
+        with self.transaction() as conn:
+            conn.execute(DROP_UNUSED_INDEX)
+            for statement in DROP_STATS_TRIGGERS:
+                conn.execute(statement)
+        try:
+            yield
+        finally:
+            with self.transaction() as conn:
+                conn.execute(CREATE_UNUSED_INDEX)
+                for statement in CREATE_STATS_TRIGGERS + REBUILD_STATS:
+                    conn.execute(statement)
+
+    def get_training_feedback(self):
+        return self.connection().execute(SELECT_TRAINING_FEEDBACK).fetchall()
+
+    def mark_used_feedback(self):
+        with self.transaction() as conn:
+            conn.execute(MARK_USED_FEEDBACK)
+
+    def get_training_feedback_with_ids(self):
+        return self.connection().execute(SELECT_TRAINING_FEEDBACK_WITH_IDS).fetchall()
+
+    def mark_used_feedback_ids(self, ids):
+        # only the rows a training run actually used, the rest stay unused
+        with self.transaction() as conn:
+            conn.executemany(MARK_USED_FEEDBACK_ID, [(feedback_id,) for feedback_id in ids])
+
+    def save_model_version(self, version_number, training_samples, accuracy, notes):
+        with self.transaction() as conn:
+            cursor = conn.execute(INSERT_MODEL_VERSION, (version_number, training_samples, accuracy, notes))
+            return cursor.lastrowid
+
+    def feedback_stats(self):
+        # acceptance rate per predicted label and the predicted vs actual confusion
+        # matrix, read from the trigger-maintained aggregate tables
+        conn = self.connection()
+        labels = [
+            {"label": label, "total": total, "accepted": accepted, "acceptance_rate": round(accepted / total, 3)}
+            for label, total, accepted in conn.execute(SELECT_LABEL_STATS)
+        ]
+        confusion = {}
+        for predicted, actual, count in conn.execute(SELECT_CONFUSION):
+            confusion.setdefault(predicted, {})[actual] = count
+        return {"labels": labels, "confusion": confusion}
+
+    def get_latest_version(self):
+        version_number = self.connection().execute(SELECT_LATEST_VERSION).fetchone()
+        if version_number[0] is None:
+            return 1
+        else:
+            return version_number[0]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=DATABASE_PATH):
+    # one store (and so one connection per thread) for each database file
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = FeedbackStore(path)
+        return store
+
+
+# the functions below keep the original module API as thin wrappers around the store
 
-    # close the connection
-    conn.close()
+def init_db(path=DATABASE_PATH):
+    get_store(path).init_db()
 
 
 def save_feedback(text, predicted_distortion, user_correction, is_accepted, confidence, path=DATABASE_PATH) -> int:
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-
-    # add data point to feedback table
-    cursor.execute(
-        """ INSERT INTO feedback (text, predicted_distortion, user_correction, is_accepted, confidence)
-                   VALUES (?,?,?,?,?)""",
-        (text, predicted_distortion, user_correction, is_accepted, confidence),
-    )
-
-    # save changes
-    conn.commit()
-
-    # get the most recent row of feedback id
-    feedback_id = cursor.lastrowid
-
-    conn.close()
-
-    return feedback_id
+    return get_store(path).save_feedback(text, predicted_distortion, user_correction, is_accepted, confidence)
 
 
 def retrieve_feedback(path=DATABASE_PATH):
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-
-    cursor.execute(""" SELECT * FROM feedback """)
-
-    table = cursor.fetchall()
-
-    conn.close()
-
-    return table
+    return get_store(path).retrieve_feedback()
 
 
 def get_training_feedback(path=DATABASE_PATH):
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-    cursor.execute(
-        """ SELECT text, user_correction FROM feedback WHERE is_accepted IS FALSE AND used_in_training IS FALSE"""
-    )
-
-    table = cursor.fetchall()
-
-    conn.close()
-
-    return table
+    return get_store(path).get_training_feedback()
 
 
 def mark_used_feedback(path=DATABASE_PATH):
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE feedback SET used_in_training=TRUE WHERE used_in_training=FALSE"
-    )
-    conn.commit()
-    conn.close()
+    get_store(path).mark_used_feedback()
 
 
-def save_model_version(version_number, training_samples, accuracy, notes, path=DATABASE_PATH):
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-
-    # add new version to model_versions table
-    cursor.execute(
-        """ INSERT INTO model_versions (version_number, training_samples, accuracy, notes)
-                   VALUES (?,?,?,?)""",
-        (version_number, training_samples, accuracy, notes),
-    )
+def get_training_feedback_with_ids(path=DATABASE_PATH):
+    return get_store(path).get_training_feedback_with_ids()
 
-    # save changes
-    conn.commit()
 
-    # get the most recent row of model_versions
-    model_version_id = cursor.lastrowid
+def mark_used_feedback_ids(ids, path=DATABASE_PATH):
+    get_store(path).mark_used_feedback_ids(ids)
 
-    conn.close()
 
-    return model_version_id
+def save_model_version(version_number, training_samples, accuracy, notes, path=DATABASE_PATH):
+    return get_store(path).save_model_version(version_number, training_samples, accuracy, notes)
 
 
 def get_latest_version(path=DATABASE_PATH):
-    conn = sqlite3.connect(path)
-    cursor = conn.cursor()
-    cursor.execute(""" SELECT MAX(version_number) FROM model_versions """)
-    version_number = cursor.fetchone()
-    conn.close()
-    if version_number[0] is None:
-        return 1
-    else:
-        return version_number[0]
+    return get_store(path).get_latest_version()
+
+
+def get_feedback_stats(path=DATABASE_PATH):
+    return get_store(path).feedback_stats()
 
 if __name__ == "__main__":
     print("Initializing database...")
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from classifier import SENTENCE_BOUNDARY
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+KAGGLE_PATH = os.path.join(BACKEND_DIR, "cognitive_distortion_dataset.csv")
+AUGMENTED_PATH = os.path.join(BACKEND_DIR, "augmented_data.csv")
+CACHE_DIR = os.path.join(BACKEND_DIR, "dataset_cache")
+
+# Downsample "No Distortion" to ~400 to mitigate class imbalance
+NO_DISTORTION_SAMPLES = 400
+RANDOM_STATE = 42
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_training_frame(kaggle_path=KAGGLE_PATH, augmented_path=AUGMENTED_PATH,
+                         no_distortion_samples=NO_DISTORTION_SAMPLES, random_state=RANDOM_STATE):
+    # Load Kaggle dataset
+    kaggle_df = pd.read_csv(kaggle_path)
+
+    # Drop empty rows and any without a dominant distortion label
+    kaggle_df = kaggle_df.dropna(subset=["Patient Question", "Dominant Distortion"])
+
+    # load augmented data (AI-genereated)
+    augmented_df = pd.read_csv(augmented_path)
+
+    # Split into no distortion vs distortion
+    no_distortion = kaggle_df[kaggle_df["Dominant Distortion"] == "No Distortion"]
+    has_distortion = kaggle_df[kaggle_df["Dominant Distortion"] != "No Distortion"]
+
+    # for distortion rows, just grab the distorted sentence
+    has_distortion_clean = has_distortion[["Distorted part", "Dominant Distortion"]]
+    has_distortion_clean.columns = ["text", "label"]
+
+    # for no distortion, split each paragraph into sentences with vectorized string
+    # ops (split + explode) instead of a python loop over iterrows()
+    sentences = (
+        no_distortion["Patient Question"]
+        .str.strip()
+        .str.split(SENTENCE_BOUNDARY)
+        .explode()
+        .str.strip()
+    )
+    sentences = sentences[sentences.str.len() > 0].reset_index(drop=True)
+    no_distortion_clean = pd.DataFrame({"text": sentences, "label": "No Distortion"})
+
+    no_distortion_downsampled = no_distortion_clean.sample(n=no_distortion_samples, random_state=random_state)
+
+    # Store this downsample + rest of data in the primary df, combined with augmented data
+    df = pd.concat([has_distortion_clean, no_distortion_downsampled, augmented_df])
+    return df.reset_index(drop=True)
+
+
+def load_training_frame(kaggle_path=KAGGLE_PATH, augmented_path=AUGMENTED_PATH,
+                        no_distortion_samples=NO_DISTORTION_SAMPLES, random_state=RANDOM_STATE,
+                        cache_dir=CACHE_DIR):
+    # the cleaned, downsampled frame (without user feedback, which changes between
+    # runs) cached as parquet, keyed by the source files' contents and the parameters
+    key = hashlib.sha256(json.dumps({
+        "kaggle": _file_hash(kaggle_path),
+        "augmented": _file_hash(augmented_path),
+        "no_distortion_samples": no_distortion_samples,
+        "random_state": random_state,
+    }, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"training-{key}.parquet")
+
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    df = build_training_frame(kaggle_path, augmented_path, no_distortion_samples, random_state)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return df
+
+
+def held_out_split(split_path=None):
+    # exactly the rows train_model.py held out (saved with its split, along with their
+    # embeddings), so cascade.py and tune_model.py score on the same held-out set as
+    # training did, feedback rows included, and never on sentences the model was trained
+    # on; everything else in the dataset is left to train on. (Re-splitting can't give
+    # the same rows: train_model.py splits after adding feedback that is then marked used.)
+    # Returns (train texts, held-out texts, train labels, held-out labels, held-out embeddings)
+    from model_artifacts import TRAINING_SPLIT_PATH, load_held_out_texts, load_training_split
+
+    split_path = split_path or TRAINING_SPLIT_PATH
+    if not os.path.exists(split_path) or load_held_out_texts(split_path) is None:
+        raise SystemExit(f"{split_path} is missing or has no held-out texts, run train_model.py first")
+    texts_test = load_held_out_texts(split_path)
+    _, _, X_test_embedded, y_test = load_training_split(split_path)
+
+    df = load_training_frame()
+    train = df[~df["text"].isin(set(texts_test))]
+    return train["text"].tolist(), texts_test.tolist(), train["label"].to_numpy().astype(str), y_test, X_test_embedded
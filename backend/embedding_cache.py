@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import stage
+
+DEFAULT_MAX_SIZE = 10000
+
+
+def normalize_sentence(sentence):
+    # small edits like extra spaces shouldn't cause a cache miss
+    return " ".join(sentence.split())
+
+
+class EmbeddingCache:
+    # bounded LRU cache in front of the sentence encoder, so only sentences
+    # we haven't seen before are sent through MiniLM
+
+    def __init__(self, encoder, max_size=DEFAULT_MAX_SIZE):
+        self.encoder = encoder
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def encode(self, sentences):
+        keys = [normalize_sentence(s) for s in sentences]
+        found = {}
+        missing = {}
+        with stage("cache_lookup"), self._lock:
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                vector = self._entries.get(key)
+                if vector is None:
+                    missing[key] = None
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            # per unique sentence, so a repeat within one call isn't counted as a hit
+            self.hits += len(found)
+            self.misses += len(missing)
+        missing = list(missing)
+
+        # run the encoder outside the lock so other requests aren't blocked on it
+        if missing:
+            with stage("encoder"):
+                vectors = self.encoder.encode(missing)
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._entries[key] = vector
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        if not keys:
+            return np.empty((0, 0))
+        return np.stack([found[key] for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
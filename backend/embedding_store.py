@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), "embedding_store")
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest().encode("ascii")
+
+
+def weights_fingerprint(encoder):
+    # hash of every parameter and buffer of a torch encoder, so retrained or swapped
+    # weights under an unchanged config don't reuse stale embeddings
+    digest = hashlib.sha256()
+    for name, tensor in sorted(encoder.state_dict().items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def encoder_identity(name, encoder):
+    # the model name, output size, a fingerprint of the loaded modules (their config)
+    # and one of the weights themselves; a change to any of them invalidates every
+    # stored embedding
+    config = hashlib.sha256(repr(encoder).encode("utf-8")).hexdigest()[:16]
+    return f"{name}:{encoder.get_sentence_embedding_dimension()}:{config}:{weights_fingerprint(encoder)}"
+
+
+class EmbeddingStore:
+    # on-disk, content-addressed cache of sentence embeddings for the training scripts.
+    # Every run appends the embeddings it had to compute as a new segment
+    # (seg-N.npy + seg-N.keys.npy); segments are memory-mapped on load, so texts
+    # seen before cost a page-in instead of a forward pass.
+
+    def __init__(self, directory=STORE_DIR, encoder_id=""):
+        self.directory = directory
+        self.encoder_id = encoder_id
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        meta = self._read_meta()
+        if meta is None or meta["encoder"] != encoder_id:
+            # a different encoder produced these vectors, none of them can be reused
+            self.clear()
+            meta = {"encoder": encoder_id, "segments": [], "next_segment": 1}
+            self._write_meta(meta)
+        self.meta = meta
+        self._load_segments()
+
+    def _read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        # write + rename so a crash never leaves a half-written index behind
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _segment_paths(self, segment):
+        base = os.path.join(self.directory, segment)
+        return base + ".npy", base + ".keys.npy"
+
+    def _load_segments(self):
+        self.vectors = []
+        self.index = {}
+        for number, segment in enumerate(self.meta["segments"]):
+            vectors_path, keys_path = self._segment_paths(segment)
+            self.vectors.append(np.load(vectors_path, mmap_mode="r"))
+            for row, key in enumerate(np.load(keys_path)):
+                self.index[bytes(key)] = (number, row)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, text):
+        return text_key(text) in self.index
+
+    def _append_segment(self, keys, vectors):
+        segment = f"seg-{self.meta['next_segment']:05d}"
+        vectors_path, keys_path = self._segment_paths(segment)
+        np.save(vectors_path, np.ascontiguousarray(vectors, dtype=np.float32))
+        np.save(keys_path, np.array(keys, dtype="S64"))
+        self.meta["segments"].append(segment)
+        self.meta["next_segment"] += 1
+        self._write_meta(self.meta)
+        self._load_segments()
+
+    def encode(self, texts, encoder, **encode_kwargs):
+        # same contract as encoder.encode(texts), but only texts missing from the
+        # store are sent to the encoder
+        keys = [text_key(t) for t in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.index and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = encoder.encode(list(missing.values()), **encode_kwargs)
+            self._append_segment(list(missing), vectors)
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        locations = np.array([self.index[key] for key in keys])
+        result = np.empty((len(keys), self.vectors[0].shape[1]), dtype=np.float32)
+        for number in np.unique(locations[:, 0]):
+            rows = np.flatnonzero(locations[:, 0] == number)
+            result[rows] = self.vectors[number][locations[rows, 1]]
+        return result
+
+    def compact(self, keep_texts=None):
+        # merge every segment into one, optionally dropping texts no longer in use
+        keep = None if keep_texts is None else {text_key(t) for t in keep_texts}
+        keys = [key for key in self.index if keep is None or key in keep]
+        if not keys:
+            self.clear()
+            self.meta = {"encoder": self.encoder_id, "segments": [], "next_segment": 1}
+            self._write_meta(self.meta)
+            self._load_segments()
+            return 0
+
+        vectors = np.stack([self.vectors[number][row] for number, row in (self.index[key] for key in keys)])
+        old_segments = list(self.meta["segments"])
+        self.meta["segments"] = []
+        self._append_segment(keys, vectors)
+        for segment in old_segments:
+            for path in self._segment_paths(segment):
+                os.remove(path)
+        return len(keys)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the training embedding store")
+    parser.add_argument("command", choices=["stats", "compact", "clear"])
+    parser.add_argument("--directory", default=STORE_DIR)
+    args = parser.parse_args()
+
+    meta_path = os.path.join(args.directory, "meta.json")
+    if not os.path.exists(meta_path):
+        raise SystemExit(f"No embedding store at {args.directory}")
+    with open(meta_path) as f:
+        store = EmbeddingStore(args.directory, json.load(f)["encoder"])
+
+    if args.command == "stats":
+        print(f"{len(store)} embeddings in {len(store.meta['segments'])} segments for {store.encoder_id}")
+    elif args.command == "compact":
+        print(f"Compacted to {store.compact()} embeddings in one segment")
+    else:
+        store.clear()
+        print("Cleared the embedding store")
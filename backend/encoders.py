@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "models/all-MiniLM-L6-v2")
+
+# "torch" is the original SentenceTransformer path, the onnx backends run the
+# same network under ONNX Runtime on CPU (optionally with int8 weights)
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+
+ONNX_FILENAMES = {
+    "onnx": "model.onnx",
+    "onnx-int8": "model-int8.onnx",
+}
+
+
+def onnx_path(model_dir, backend):
+    return os.path.join(model_dir, "onnx", ONNX_FILENAMES[backend])
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def pool(hidden_states, attention_mask, pooling_config):
+    # reproduces sentence_transformers.models.Pooling for the modes in 1_Pooling/config.json
+    mask = attention_mask[..., None].astype(hidden_states.dtype)
+    token_counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    pooled = []
+    if pooling_config.get("pooling_mode_cls_token"):
+        pooled.append(hidden_states[:, 0])
+    if pooling_config.get("pooling_mode_max_tokens"):
+        pooled.append(np.where(mask > 0, hidden_states, -1e9).max(axis=1))
+    if pooling_config.get("pooling_mode_mean_tokens"):
+        pooled.append((hidden_states * mask).sum(axis=1) / token_counts)
+    if pooling_config.get("pooling_mode_mean_sqrt_len_tokens"):
+        pooled.append((hidden_states * mask).sum(axis=1) / np.sqrt(token_counts))
+    return np.concatenate(pooled, axis=1)
+
+
+def normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-12, None)
+
+
+class OnnxEncoder:
+    # drop-in replacement for SentenceTransformer.encode that runs the exported
+    # transformer under ONNX Runtime, using the model's own tokenizer.json and
+    # pooling / normalize modules so the embeddings match the torch path
+
+    def __init__(self, model_dir, model_path, batch_size=32, num_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        self.pooling_config = _read_json(os.path.join(model_dir, "1_Pooling", "config.json"))
+        modules = _read_json(os.path.join(model_dir, "modules.json"))
+        self.normalize = any(m["type"].endswith("Normalize") for m in modules)
+        max_seq_length = _read_json(os.path.join(model_dir, "sentence_bert_config.json"))["max_seq_length"]
+        special_tokens = _read_json(os.path.join(model_dir, "special_tokens_map.json"))
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        pad_token = special_tokens.get("pad_token", "[PAD]")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=None, **kwargs):
+        sentences = list(sentences)
+        batch_size = batch_size or self.batch_size
+        if not sentences:
+            return np.empty((0, self.pooling_config["word_embedding_dimension"]), dtype=np.float32)
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(sentences[start:start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            inputs = {name: value for name, value in inputs.items() if name in self.input_names}
+            hidden_states = self.session.run(None, inputs)[0]
+            embeddings = pool(hidden_states, inputs["attention_mask"], self.pooling_config)
+            if self.normalize:
+                embeddings = normalize(embeddings)
+            batches.append(embeddings.astype(np.float32))
+        return np.concatenate(batches)
+
+
+def export_onnx(model_dir=MODEL_DIR, quantize=False):
+    # export the transformer part of the local model to ONNX; pooling and
+    # normalization stay in numpy so the graph is just the encoder
+    import torch
+    from transformers import AutoModel
+
+    output_path = onnx_path(model_dir, "onnx")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    model = AutoModel.from_pretrained(model_dir)
+    model.eval()
+    dummy = {
+        "input_ids": torch.ones((1, 8), dtype=torch.long),
+        "attention_mask": torch.ones((1, 8), dtype=torch.long),
+        "token_type_ids": torch.zeros((1, 8), dtype=torch.long),
+    }
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in dummy}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy,),
+            output_path,
+            input_names=list(dummy),
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = onnx_path(model_dir, "onnx-int8")
+        quantize_dynamic(output_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+    return output_path
+
+
+def load_encoder(backend=None, model_dir=MODEL_DIR):
+    backend = backend or os.environ.get("ENCODER_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_dir)
+
+    path = onnx_path(model_dir, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} does not exist, run `python encoders.py export{' --quantize' if backend == 'onnx-int8' else ''}` first"
+        )
+    return OnnxEncoder(model_dir, path)
+
+
+def check_parity(backend, sentences, model=None, model_dir=MODEL_DIR):
+    # compare a backend's embeddings (and the classifier's predictions on them)
+    # against the reference torch encoder
+    reference = load_encoder("torch", model_dir).encode(sentences)
+    candidate = load_encoder(backend, model_dir).encode(sentences)
+
+    cosine = (normalize(reference) * normalize(candidate)).sum(axis=1)
+    report = {
+        "backend": backend,
+        "sentences": len(sentences),
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+    }
+    if model is not None:
+        agreement = model.predict(reference) == model.predict(candidate)
+        report["prediction_agreement"] = float(agreement.mean())
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and verify ONNX encoder backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the local model to ONNX")
+    export_parser.add_argument("--quantize", action="store_true", help="also write a dynamic int8 quantized model")
+
+    parity_parser = commands.add_parser("parity", help="compare a backend against the torch encoder")
+    parity_parser.add_argument("--backend", default="onnx", choices=BACKENDS[1:])
+    parity_parser.add_argument("--samples", type=int, default=500)
+    parity_parser.add_argument("--min-cosine", type=float, default=0.99)
+    parity_parser.add_argument("--min-agreement", type=float, default=0.98)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Exported {export_onnx(quantize=args.quantize)}")
+    else:
+        import joblib
+        import pandas as pd
+        from dataset import AUGMENTED_PATH
+        from model_artifacts import MODEL_PATH
+
+        # paths next to this file, so the check runs from any directory
+        sentences = pd.read_csv(AUGMENTED_PATH)["text"].dropna().head(args.samples).tolist()
+        model = joblib.load(MODEL_PATH)
+        report = check_parity(args.backend, sentences, model=model)
+        print(json.dumps(report, indent=2))
+        if report["min_cosine"] < args.min_cosine or report["prediction_agreement"] < args.min_agreement:
+            raise SystemExit("Parity check failed")
+        print("Parity check passed")
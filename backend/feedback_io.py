@@ -0,0 +1,134 @@
+import argparse
+import json
+import time
+
+from database import DATABASE_PATH, FEEDBACK_COLUMNS, get_store, init_db
+
+DEFAULT_PAGE_SIZE = 5000
+DEFAULT_IMPORT_BATCH_SIZE = 20000
+# columns an import reads, in the order import_feedback_batch takes them
+IMPORT_COLUMNS = FEEDBACK_COLUMNS[1:]
+
+
+def _export_row(row):
+    record = dict(zip(FEEDBACK_COLUMNS, row))
+    # sqlite hands booleans back as 0/1
+    for column in ("is_accepted", "used_in_training"):
+        if record[column] is not None:
+            record[column] = bool(record[column])
+    return record
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()),
+        ("text", pa.string()),
+        ("predicted_distortion", pa.string()),
+        ("user_correction", pa.string()),
+        ("is_accepted", pa.bool_()),
+        ("confidence", pa.float64()),
+        ("timestamp", pa.string()),
+        ("used_in_training", pa.bool_()),
+    ])
+
+
+def export_feedback(path, db_path=DATABASE_PATH, page_size=DEFAULT_PAGE_SIZE):
+    # streams the feedback table to .jsonl or .parquet one keyset page at a time
+    # (one parquet row group per page); returns the number of rows written
+    pages = get_store(db_path).iter_feedback_pages(page_size)
+    count = 0
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _parquet_schema()
+        with pq.ParquetWriter(path, schema) as writer:
+            for page in pages:
+                records = [_export_row(row) for row in page]
+                writer.write_table(pa.Table.from_pylist(records, schema=schema))
+                count += len(records)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for page in pages:
+                f.writelines(json.dumps(_export_row(row), ensure_ascii=False) + "\n" for row in page)
+                count += len(page)
+    return count
+
+
+def read_records(path, batch_size=DEFAULT_IMPORT_BATCH_SIZE):
+    # yields lists of at most batch_size records from a .jsonl or .parquet export
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+        return
+
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def import_feedback(path, db_path=DATABASE_PATH, batch_size=DEFAULT_IMPORT_BATCH_SIZE, defer_indexes=False):
+    # inserts every record of an export, batch_size rows per transaction; ids from the
+    # source are not kept, so exports from other deployments can't collide with ours
+    init_db(db_path)
+    store = get_store(db_path)
+
+    def load():
+        count = 0
+        for records in read_records(path, batch_size):
+            rows = []
+            for record in records:
+                if not record.get("text"):
+                    raise ValueError(f"Feedback record without text: {record}")
+                rows.append(tuple(record.get(column) for column in IMPORT_COLUMNS))
+            store.import_feedback_batch(rows)
+            count += len(rows)
+        return count
+
+    if defer_indexes:
+        with store.deferred_maintenance():
+            return load()
+    return load()
+
+
+def report(action, count, elapsed):
+    rate = count / elapsed if elapsed else float("inf")
+    print(f"{action} {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or bulk import feedback as .jsonl or .parquet")
+    parser.add_argument("--db", default=DATABASE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="stream the feedback table to a file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+
+    import_parser = subparsers.add_parser("import", help="insert the rows of an export")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_IMPORT_BATCH_SIZE)
+    import_parser.add_argument(
+        "--defer-indexes", action="store_true",
+        help="drop the feedback index and stats triggers during the import and rebuild them after "
+             "(faster for large imports, run it while the app isn't writing feedback)",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        count = export_feedback(args.path, args.db, args.page_size)
+        report("Exported", count, time.perf_counter() - start)
+    else:
+        count = import_feedback(args.path, args.db, args.batch_size, args.defer_indexes)
+        report("Imported", count, time.perf_counter() - start)
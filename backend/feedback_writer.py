@@ -0,0 +1,158 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import FEEDBACK_ROWS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_MAX_QUEUED_ROWS = 10000
+# ids reserved from the database at a time; unused ids are simply skipped
+ID_BLOCK_SIZE = 100
+FLUSH_RETRIES = 3
+
+
+class FeedbackWriter:
+    # write-behind queue for /feedback: the request only validates, gets an id and
+    # enqueues the row, and a background thread inserts queued rows with executemany
+    # in one transaction whenever batch_size rows are waiting or flush_interval_ms passes
+
+    def __init__(
+        self,
+        store,
+        batch_size=DEFAULT_FLUSH_BATCH_SIZE,
+        flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS,
+        max_queue=DEFAULT_MAX_QUEUED_ROWS,
+        enqueue_timeout=0.05,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._ids = iter(())
+        self._worker = None
+        self._owner_pid = None
+        self._stopping = threading.Event()
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    def submit(self, text, predicted_distortion, user_correction, is_accepted, confidence) -> int:
+        # raises queue.Full when the writer can't keep up, so the caller can shed load
+        self._ensure_worker()
+        feedback_id = self._next_id()
+        row = (feedback_id, text, predicted_distortion, user_correction, is_accepted, confidence)
+        self._queue.put(row, timeout=self.enqueue_timeout)
+        return feedback_id
+
+    def _next_id(self):
+        with self._lock:
+            feedback_id = next(self._ids, None)
+            if feedback_id is None:
+                self._ids = iter(self.store.reserve_feedback_ids(ID_BLOCK_SIZE))
+                feedback_id = next(self._ids)
+            return feedback_id
+
+    def _ensure_worker(self):
+        # started lazily (and again after a fork) so every gunicorn worker has its own
+        # writer thread and its own block of ids
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._ids = iter(())
+                self._worker = None
+                self._owner_pid = os.getpid()
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                self._worker.start()
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(FLUSH_RETRIES):
+            try:
+                self.store.save_feedback_batch(batch)
+                with self._lock:
+                    self.written += len(batch)
+                    self.flushes += 1
+                return
+            except Exception:
+                logger.exception("Flushing %d feedback rows failed (attempt %d of %d)", len(batch), attempt + 1, FLUSH_RETRIES)
+                time.sleep(0.1 * (attempt + 1))
+        # one bad row fails the whole executemany, so fall back to one row at a time and
+        # only lose the rows that can't be written
+        written = 0
+        for row in batch:
+            try:
+                self.store.save_feedback_batch([row])
+                written += 1
+            except Exception:
+                logger.exception("Feedback row %s could not be written", row[0])
+        dropped = len(batch) - written
+        with self._lock:
+            self.written += written
+            self.flushes += 1
+            self.dropped += dropped
+        if dropped:
+            # the rows are lost: make it loud in the logs and visible on /metrics
+            FEEDBACK_ROWS_DROPPED.inc(dropped)
+            logger.error("Dropped %d of %d feedback rows after %d failed flushes", dropped, len(batch), FLUSH_RETRIES)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        # write everything queued so far from the calling thread
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=10):
+        # graceful shutdown: let the writer drain the queue, then flush anything left
+        self._stopping.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive() and self._owner_pid == os.getpid():
+            worker.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "written": self.written,
+                "flushes": self.flushes,
+                "dropped": self.dropped,
+            }
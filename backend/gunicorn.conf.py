@@ -0,0 +1,32 @@
+import gc
+import os
+
+from memory import format_usage, process_memory
+
+# PRELOAD_MODELS=1 imports the app (and loads the model + encoder) once in the
+# master before forking, so workers share those pages copy-on-write instead of
+# each loading a private copy
+preload_app = os.environ.get("PRELOAD_MODELS", "").lower() in ("1", "true", "yes")
+
+if preload_app:
+    # a background warmup thread wouldn't survive the fork, so load everything
+    # while the app is being imported in the master
+    os.environ.setdefault("WARMUP", "eager")
+    # memory-mapped coefficient arrays are shared through the page cache as well
+    os.environ.setdefault("MODEL_FORMAT", "npy")
+
+
+def when_ready(server):
+    if preload_app:
+        # move everything allocated so far out of the garbage collector's reach,
+        # otherwise the first collection in each worker touches (and copies) it
+        gc.freeze()
+    usage = process_memory()
+    if usage is not None:
+        server.log.info("master %s", format_usage(os.getpid(), usage))
+
+
+def post_worker_init(worker):
+    usage = process_memory()
+    if usage is not None:
+        worker.log.info("worker %s", format_usage(worker.pid, usage))
@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from classifier import split_sentence_spans
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_DOCUMENTS = 1000
+
+
+class RevisionConflict(Exception):
+    # the client's base revision doesn't match what we have (or we've forgotten the
+    # document), so it has to resend the full text without a base revision
+    def __init__(self, revision):
+        super().__init__("Document revision is out of date, please resend the full text")
+        self.revision = revision
+
+
+class _Document:
+    def __init__(self):
+        # revisions start at a random number rather than 0, so a stale copy of the
+        # document in another worker can't match the client's base revision by accident
+        # (both would otherwise be at revision 1 after a full resend)
+        self.revision = random.getrandbits(40)
+        self.sentences = []
+        self.next_id = 0
+        self.touched = time.monotonic()
+
+
+def _sentence(sentence_id, text, start, end, prediction, confidence, keep):
+    return {
+        "id": sentence_id,
+        "input": text,
+        "start": start,
+        "end": end,
+        # sentences under the confidence threshold are tracked but not highlighted
+        "prediction": str(prediction) if keep else None,
+        "confidence": round(float(confidence), 3) if keep else None,
+    }
+
+
+class DocumentStore:
+    # short-lived, per-process state of each document's sentence spans and results,
+    # so live analysis only has to classify the sentences that were edited. With several
+    # workers, an edit that lands on a worker without the document (or with an older
+    # copy of it) is a RevisionConflict and the client resends the full text, so results
+    # stay correct but only sticky routing (or one worker) keeps the savings
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_documents=DEFAULT_MAX_DOCUMENTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, document_id):
+        now = time.monotonic()
+        # drop documents nobody has edited for a while
+        while self._documents:
+            oldest_id, oldest = next(iter(self._documents.items()))
+            if now - oldest.touched <= self.ttl_seconds:
+                break
+            del self._documents[oldest_id]
+        document = self._documents.get(document_id)
+        if document is not None:
+            self._documents.move_to_end(document_id)
+        return document
+
+    def _put(self, document_id, document):
+        document.touched = time.monotonic()
+        self._documents[document_id] = document
+        self._documents.move_to_end(document_id)
+        while len(self._documents) > self.max_documents:
+            self._documents.popitem(last=False)
+
+    def update(self, document_id, base_revision, text, classify):
+        # classify(sentences) -> (predictions, confidences, keep) for just the sentences
+        # it is given; returns the delta between the stored revision and the new text
+        with self._lock:
+            document = self._get(document_id)
+            if base_revision is None:
+                document = _Document()
+            elif document is None or document.revision != base_revision:
+                raise RevisionConflict(document.revision if document else None)
+            old = document.sentences
+            read_revision = document.revision
+
+        spans = split_sentence_spans(text)
+        matcher = SequenceMatcher(None, [s["input"] for s in old], [sentence for sentence, _, _ in spans], autojunk=False)
+        opcodes = matcher.get_opcodes()
+
+        # only sentences that are new or whose text changed go through the model
+        to_classify = [j for tag, _, _, j1, j2 in opcodes if tag != "equal" for j in range(j1, j2)]
+        predictions, confidences, keep = classify([spans[j][0] for j in to_classify])
+        scored = {j: (predictions[k], confidences[k], keep[k]) for k, j in enumerate(to_classify)}
+
+        with self._lock:
+            # another request may have moved the document on while we were classifying
+            if document.revision != read_revision:
+                raise RevisionConflict(document.revision)
+            next_id = document.next_id
+            sentences = []
+            delta = {"added": [], "removed": [], "changed": [], "moved": []}
+            for tag, i1, i2, j1, j2 in opcodes:
+                if tag == "equal":
+                    for i, j in zip(range(i1, i2), range(j1, j2)):
+                        _, start, end = spans[j]
+                        sentence = dict(old[i], start=start, end=end)
+                        if (start, end) != (old[i]["start"], old[i]["end"]):
+                            delta["moved"].append({"id": sentence["id"], "start": start, "end": end})
+                        sentences.append(sentence)
+                    continue
+
+                # a replaced block reuses the old ids in order (a "changed" sentence),
+                # anything left over on either side was inserted or deleted
+                reused = [old[i]["id"] for i in range(i1, i2)]
+                for j in range(j1, j2):
+                    if reused:
+                        sentence_id = reused.pop(0)
+                        kind = "changed"
+                    else:
+                        sentence_id = next_id
+                        next_id += 1
+                        kind = "added"
+                    sentence = _sentence(sentence_id, *spans[j], *scored[j])
+                    delta[kind].append(sentence)
+                    sentences.append(sentence)
+                delta["removed"].extend(reused)
+
+            document.sentences = sentences
+            document.next_id = next_id
+            document.revision += 1
+            self._put(document_id, document)
+            delta["revision"] = document.revision
+            delta["full"] = base_revision is None
+            return delta
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
@@ -0,0 +1,288 @@
+import asyncio
+import os
+import threading
+import time
+
+GEMINI_MODEL = "gemini-3-flash-preview"
+BACKENDS = ("gemini", "stub")
+
+# bump whenever the prompt below changes, so cached rewrites from the old prompt
+# are not served for the new one
+PROMPT_VERSION = 1
+
+# seconds to wait for the model before giving up
+DEFAULT_TIMEOUT = 30
+
+
+def build_rewrite_prompt(text, distortions):
+    distortion_lines = "\n".join(
+        f'"{d["input"]}" → {d["prediction"]} ({d["confidence"]})'
+        for d in distortions
+    )
+    return f""" You are a therapist specializing in cognitive behavioral therapy.
+        The following journal entry has been analyzed for cognitive distortions.
+
+        Original entry:
+        {text}
+
+        Detected distortions by sentence:
+        {distortion_lines}
+
+        Rewrite the full journal entry with healthier thought patterns, preserving the original meaning and tone.
+        Return only the rewritten entry, with no explanation or commentary."""
+
+
+def _stop_stream(response):
+    # written against google-generativeai 0.8.6, which has no public way to stop a
+    # streamed response early: GenerateContentResponse keeps the gRPC stream (api_core's
+    # _StreamingResponseIterator, with cancel()) in its private _iterator. If a later
+    # SDK renames or wraps it, close whatever iterator is there instead, and if there
+    # is none the stream is simply left to finish (or time out) upstream
+    stream = getattr(response, "_iterator", None)
+    for name in ("cancel", "close"):
+        stop = getattr(stream, name, None)
+        if callable(stop):
+            stop()
+            return
+
+
+class GeminiClient:
+    # one GenerativeModel shared by every request instead of building a new one per call
+
+    def __init__(self, model_name=GEMINI_MODEL, timeout=DEFAULT_TIMEOUT):
+        # google.generativeai is only needed once the first rewrite comes in
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+        self.model_name = model_name
+        self.timeout = timeout
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout=None):
+        from google.api_core import exceptions
+
+        try:
+            response = self._model.generate_content(
+                prompt, request_options={"timeout": timeout or self.timeout}
+            )
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+        return response.text
+
+    async def agenerate(self, prompt, timeout=None):
+        # same as generate(), awaiting the response on the event loop (asgi.py)
+        from google.api_core import exceptions
+
+        try:
+            response = await self._model.generate_content_async(
+                prompt, request_options={"timeout": timeout or self.timeout}
+            )
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+        return response.text
+
+    async def astream(self, prompt, timeout=None):
+        from google.api_core import exceptions
+
+        try:
+            response = await self._model.generate_content_async(
+                prompt, stream=True, request_options={"timeout": timeout or self.timeout}
+            )
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+
+    def stream(self, prompt, timeout=None):
+        # yields text chunks as Gemini generates them; closing the generator (the
+        # client went away) stops reading and cancels the upstream stream
+        from google.api_core import exceptions
+
+        try:
+            response = self._model.generate_content(
+                prompt, stream=True, request_options={"timeout": timeout or self.timeout}
+            )
+            try:
+                for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+            finally:
+                _stop_stream(response)
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+
+    def chat(self, messages, tools, timeout=None):
+        # one function-calling turn; messages and the reply use the provider-neutral
+        # format of agent.py ({"role", "content", "tool_calls"}, tool results as role "tool")
+        from google.api_core import exceptions
+
+        try:
+            response = self._model.generate_content(
+                self._chat_contents(messages),
+                tools=[{"function_declarations": tools}],
+                request_options={"timeout": timeout or self.timeout},
+            )
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+        return self._chat_reply(response)
+
+    async def achat(self, messages, tools, timeout=None):
+        from google.api_core import exceptions
+
+        try:
+            response = await self._model.generate_content_async(
+                self._chat_contents(messages),
+                tools=[{"function_declarations": tools}],
+                request_options={"timeout": timeout or self.timeout},
+            )
+        except exceptions.DeadlineExceeded as e:
+            raise TimeoutError(f"{self.model_name} did not answer in time") from e
+        return self._chat_reply(response)
+
+    @staticmethod
+    def _chat_contents(messages):
+        contents = []
+        for message in messages:
+            if message["role"] == "user":
+                contents.append({"role": "user", "parts": [{"text": message["content"]}]})
+            elif message["role"] == "model":
+                parts = [{"text": message["content"]}] if message.get("content") else []
+                parts += [
+                    {"function_call": {"name": call["name"], "args": call.get("arguments", {})}}
+                    for call in message.get("tool_calls", [])
+                ]
+                contents.append({"role": "model", "parts": parts})
+            elif message["role"] == "tool":
+                contents.append({"role": "user", "parts": [
+                    {"function_response": {"name": message["name"], "response": {"result": message["content"]}}}
+                ]})
+        return contents
+
+    @staticmethod
+    def _chat_reply(response):
+        text, tool_calls = [], []
+        for part in response.candidates[0].content.parts:
+            if part.function_call and part.function_call.name:
+                args = type(part.function_call).to_dict(part.function_call).get("args", {})
+                tool_calls.append({"id": f"call-{len(tool_calls)}", "name": part.function_call.name, "arguments": args})
+            elif part.text:
+                text.append(part.text)
+        return {"text": "".join(text), "tool_calls": tool_calls}
+
+
+class StubClient:
+    # local stand-in for Gemini, for tests and benchmarks (LLM_BACKEND=stub): answers
+    # after a fixed delay with a deterministic rewrite and counts the calls it served
+
+    def __init__(self, model_name="stub", delay=0.0, timeout=DEFAULT_TIMEOUT):
+        self.model_name = model_name
+        self.delay = delay
+        self.timeout = timeout
+        self.calls = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, timeout=None):
+        with self._lock:
+            self.calls += 1
+        timeout = timeout or self.timeout
+        if self.delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{self.model_name} did not answer in time")
+        time.sleep(self.delay)
+        return self._rewrite(prompt)
+
+    async def agenerate(self, prompt, timeout=None):
+        with self._lock:
+            self.calls += 1
+        await asyncio.wait_for(asyncio.sleep(self.delay), timeout or self.timeout)
+        return self._rewrite(prompt)
+
+    def stream(self, prompt, timeout=None):
+        # same rewrite as generate(), one word at a time, with the delay spread over
+        # the words; counts streams that were closed before the last word
+        with self._lock:
+            self.calls += 1
+        tokens = self._rewrite(prompt).split(" ")
+        token_delay = self.delay / len(tokens)
+        try:
+            for i, token in enumerate(tokens):
+                time.sleep(token_delay)
+                yield token if i == 0 else " " + token
+        except GeneratorExit:
+            with self._lock:
+                self.cancelled += 1
+            raise
+
+    async def astream(self, prompt, timeout=None):
+        with self._lock:
+            self.calls += 1
+        tokens = self._rewrite(prompt).split(" ")
+        token_delay = self.delay / len(tokens)
+        try:
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(token_delay)
+                yield token if i == 0 else " " + token
+        except (GeneratorExit, asyncio.CancelledError):
+            with self._lock:
+                self.cancelled += 1
+            raise
+
+    def chat(self, messages, tools, timeout=None):
+        # a fixed agent policy: analyze the user's entry, then rewrite it with the
+        # distortions that came back, then answer with the rewrite
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self._next_turn(messages)
+
+    async def achat(self, messages, tools, timeout=None):
+        with self._lock:
+            self.calls += 1
+        await asyncio.wait_for(asyncio.sleep(self.delay), timeout or self.timeout)
+        return self._next_turn(messages)
+
+    @staticmethod
+    def _next_turn(messages):
+        last = max(i for i, m in enumerate(messages) if m["role"] == "user")
+        entry = messages[last]["content"]
+        results = {m["name"]: m["content"] for m in messages[last:] if m["role"] == "tool"}
+        if "analyze_text" not in results:
+            return {"text": "", "tool_calls": [{"id": "call-0", "name": "analyze_text", "arguments": {"text": entry}}]}
+        if "rewrite_text" not in results:
+            distortions = results["analyze_text"].get("results", [])
+            arguments = {"text": entry, "distortions": distortions}
+            return {"text": "", "tool_calls": [{"id": "call-0", "name": "rewrite_text", "arguments": arguments}]}
+        return {"text": results["rewrite_text"].get("rewritten", ""), "tool_calls": []}
+
+    def _rewrite(self, prompt):
+        entry = prompt.split("Original entry:", 1)[-1].split("Detected distortions", 1)[0].strip()
+        return f"Rewritten: {entry}"
+
+
+class ScriptedClient:
+    # replays a fixed list of chat() replies, for testing the agent loop offline;
+    # keeps the messages it was shown on every turn
+
+    def __init__(self, replies, model_name="scripted"):
+        self.model_name = model_name
+        self.replies = list(replies)
+        self.seen = []
+
+    def chat(self, messages, tools, timeout=None):
+        self.seen.append(list(messages))
+        if not self.replies:
+            raise RuntimeError("Scripted LLM has no replies left")
+        return self.replies.pop(0)
+
+    async def achat(self, messages, tools, timeout=None):
+        return self.chat(messages, tools, timeout)
+
+
+def load_llm(backend=None, timeout=DEFAULT_TIMEOUT):
+    backend = backend or os.environ.get("LLM_BACKEND", "gemini")
+    if backend == "gemini":
+        return GeminiClient(os.environ.get("GEMINI_MODEL", GEMINI_MODEL), timeout=timeout)
+    if backend == "stub":
+        return StubClient(delay=float(os.environ.get("STUB_LLM_DELAY_MS", 0)) / 1000, timeout=timeout)
+    raise ValueError(f"Unknown LLM backend {backend!r}, expected one of {', '.join(BACKENDS)}")
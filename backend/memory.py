@@ -0,0 +1,55 @@
+import os
+import sys
+
+# fields of /proc/<pid>/smaps_rollup that tell us how much of a worker's RSS is
+# private to it and how much it shares with the gunicorn master and its siblings
+SMAPS_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def process_memory(pid="self"):
+    # returns None on platforms without /proc (e.g. macOS during local development)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    usage = {}
+    for line in lines:
+        field, _, value = line.partition(":")
+        if field in SMAPS_FIELDS:
+            usage[SMAPS_FIELDS[field]] = round(int(value.split()[0]) / 1024, 1)
+    usage["shared_mb"] = round(usage.get("shared_clean_mb", 0) + usage.get("shared_dirty_mb", 0), 1)
+    usage["private_mb"] = round(usage.get("private_clean_mb", 0) + usage.get("private_dirty_mb", 0), 1)
+    return usage
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def format_usage(pid, usage):
+    return (
+        f"pid {pid}: rss {usage['rss_mb']} MB, shared {usage['shared_mb']} MB, "
+        f"private {usage['private_mb']} MB, pss {usage.get('pss_mb', 0)} MB"
+    )
+
+
+if __name__ == "__main__":
+    # usage: python memory.py <gunicorn master pid>
+    master = int(sys.argv[1]) if len(sys.argv) > 1 else os.getpid()
+    for pid in [master] + child_pids(master):
+        usage = process_memory(pid)
+        if usage is not None:
+            print(format_usage(pid, usage))
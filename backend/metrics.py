@@ -0,0 +1,192 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets in seconds, from a cache hit up to a slow Gemini call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SENTENCE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# stage timings of the request being handled, for the Server-Timing header
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    # cumulative buckets are only built when /metrics is scraped; observe() is a
+    # bisect and three additions under a lock, cheap enough for every request
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket plus +Inf, then the sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                labels = _label_text(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    # read from a callback at scrape time, so it never touches the request path
+    def __init__(self, name, help, read, labelnames=()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        values = self.read()
+        if values is None:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, read, labelnames=()):
+        return self.register(Gauge(name, help, read, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# metrics live in each worker process; with several gunicorn workers, every scrape
+# reports the worker that answered it
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "reframe_stage_seconds", "Time spent in each stage of a request", ("stage",)
+)
+REQUESTS = registry.counter(
+    "reframe_requests_total", "Requests handled, by endpoint and status", ("endpoint", "method", "status")
+)
+REQUEST_SECONDS = registry.histogram(
+    "reframe_request_seconds", "End to end request latency", ("endpoint",)
+)
+SENTENCES = registry.histogram(
+    "reframe_sentences_per_request", "Sentences classified per request", ("endpoint",), buckets=SENTENCE_BUCKETS
+)
+CASCADE_SENTENCES = registry.counter(
+    "reframe_cascade_sentences_total", "Sentences answered by the TF-IDF gate or escalated to the encoder", ("path",)
+)
+FEEDBACK_ROWS_DROPPED = registry.counter(
+    "reframe_feedback_rows_dropped_total", "Feedback rows the write-behind queue gave up on after repeated failed flushes"
+)
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def start_request():
+    # collect this request's stages so they can be sent back in Server-Timing
+    return _request_stages.set([])
+
+
+def finish_request(token):
+    stages = _request_stages.get() or []
+    _request_stages.reset(token)
+    return stages
+
+
+def server_timing(stages, total=None):
+    # repeated stages (e.g. a cache lookup per streamed chunk) are added together
+    durations = {}
+    for name, elapsed in stages:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={elapsed * 1000:.2f}" for name, elapsed in durations.items())
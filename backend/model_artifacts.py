@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "distortion_model.pkl")
+# raw coefficient arrays written next to the pickle by train_model.py
+ARRAYS_DIR = os.path.join(os.path.dirname(__file__), "distortion_model")
+# embedded train / held-out split of the last training run, reused by train_incremental.py
+TRAINING_SPLIT_PATH = os.path.join(os.path.dirname(__file__), "training_split.npz")
+# a copy of the last few published models, by version, so every worker can roll back
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), "model_history")
+HISTORY_SIZE = 3
+# written by a rollback: every worker serves this version from HISTORY_DIR until the
+# next model is published
+PIN_PATH = os.path.join(os.path.dirname(__file__), "model_pin.json")
+
+
+class LinearModel:
+    # the parts of a fitted LogisticRegression that serving needs, backed by
+    # read-only memory-mapped .npy files so every gunicorn worker shares the
+    # same pages instead of unpickling a private copy
+
+    def __init__(self, classes, coef, intercept, model_version=None):
+        self.classes_ = classes
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.model_version_ = model_version
+
+    def decision_function(self, X):
+        return np.asarray(X) @ self.coef_.T + self.intercept_
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if self.coef_.shape[0] == 1:
+            # binary LogisticRegression stores a single row of weights
+            positive = 1 / (1 + np.exp(-scores[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        scores = scores - scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _replace_atomically(path, write):
+    # write next to the target and rename over it, so a running app that reloads the
+    # model never sees a half-written file (and existing memory maps keep the old inode)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_array(path, array):
+    # np.save appends .npy to names that don't end in it, so hand it a file object
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+    _replace_atomically(path, write)
+
+
+def _array_digest(array):
+    return hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def export_arrays(model, directory=ARRAYS_DIR):
+    # each file is replaced atomically but the set isn't, so manifest.json, written
+    # last, records a checksum of every array of this export
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        "classes.npy": np.asarray(model.classes_).astype(str),
+        "coef.npy": np.ascontiguousarray(model.coef_),
+        "intercept.npy": np.ascontiguousarray(model.intercept_),
+    }
+    version = artifact_version(model)
+    if version is not None:
+        arrays["version.npy"] = np.asarray(version, dtype=np.int64)
+    for name, array in arrays.items():
+        _save_array(os.path.join(directory, name), array)
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump({name: _array_digest(array) for name, array in arrays.items()}, f)
+    _replace_atomically(os.path.join(directory, "manifest.json"), write)
+
+
+def load_arrays(directory=ARRAYS_DIR):
+    # refuses a mix of two exports (e.g. the new coef.npy next to the old intercept.npy
+    # while save_model is still writing); the reloader tries again on its next poll
+    manifest_path = os.path.join(directory, "manifest.json")
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    names = ["classes.npy", "coef.npy", "intercept.npy"]
+    # exports from before the manifest have no checksums; a version.npy left over from an
+    # earlier export doesn't belong to a manifest that doesn't list it
+    if manifest is not None:
+        has_version = "version.npy" in manifest
+    else:
+        has_version = os.path.exists(os.path.join(directory, "version.npy"))
+    if has_version:
+        names.append("version.npy")
+    arrays = {
+        name: np.load(os.path.join(directory, name), mmap_mode=None if name == "classes.npy" else "r")
+        for name in names
+    }
+    if manifest is not None:
+        torn = [name for name in names if _array_digest(arrays[name]) != manifest.get(name)]
+        if torn:
+            raise ValueError(f"{', '.join(torn)} in {directory} don't match manifest.json, the arrays are mid-update")
+    return LinearModel(
+        arrays["classes.npy"],
+        arrays["coef.npy"],
+        arrays["intercept.npy"],
+        int(arrays["version.npy"]) if has_version else None,
+    )
+
+
+def artifact_version(model):
+    # the model version an artifact was published as (None for artifacts saved
+    # before versions were stored with them)
+    return getattr(model, "model_version_", None)
+
+
+def save_training_split(X_train, y_train, X_test, y_test, path=TRAINING_SPLIT_PATH, texts_test=None):
+    # texts_test are the held-out sentences themselves, which cascade.py calibrates on
+    arrays = dict(
+        X_train=np.asarray(X_train, dtype=np.float32),
+        y_train=np.asarray(y_train).astype(str),
+        X_test=np.asarray(X_test, dtype=np.float32),
+        y_test=np.asarray(y_test).astype(str),
+    )
+    if texts_test is not None:
+        arrays["texts_test"] = np.asarray(texts_test).astype(str)
+    np.savez(path, **arrays)
+
+
+def load_training_split(path=TRAINING_SPLIT_PATH):
+    with np.load(path) as split:
+        return split["X_train"], split["y_train"], split["X_test"], split["y_test"]
+
+
+def load_held_out_texts(path=TRAINING_SPLIT_PATH):
+    # None for splits saved before the texts were kept
+    with np.load(path) as split:
+        return split["texts_test"] if "texts_test" in split.files else None
+
+
+def artifact_paths(path=MODEL_PATH, arrays_dir=ARRAYS_DIR, pin_path=PIN_PATH):
+    # the files the app watches for a new model (or a rollback)
+    names = ("classes.npy", "coef.npy", "intercept.npy", "version.npy", "manifest.json")
+    return [path] + [os.path.join(arrays_dir, name) for name in names] + [pin_path]
+
+
+def history_path(version, history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, f"distortion_model-v{version}.pkl")
+
+
+def save_model(model, path=MODEL_PATH, arrays_dir=ARRAYS_DIR, version=None,
+               history_dir=HISTORY_DIR, pin_path=PIN_PATH):
+    # publishes a model; with a version it is stored inside the artifacts (so the app
+    # never pairs new weights with an old version number), kept in history_dir for
+    # rollbacks and unpins any rolled back version
+    if version is not None:
+        model.model_version_ = int(version)
+    _replace_atomically(path, lambda tmp_path: joblib.dump(model, tmp_path))
+    # also write the raw coefficient arrays, which the app can memory-map (MODEL_FORMAT=npy)
+    export_arrays(model, arrays_dir)
+    if version is None:
+        return
+
+    os.makedirs(history_dir, exist_ok=True)
+    _replace_atomically(history_path(version, history_dir), lambda tmp_path: joblib.dump(model, tmp_path))
+    for old in history_versions(history_dir)[:-HISTORY_SIZE]:
+        os.remove(history_path(old, history_dir))
+    if os.path.exists(pin_path):
+        os.remove(pin_path)
+
+
+def history_versions(history_dir=HISTORY_DIR):
+    if not os.path.isdir(history_dir):
+        return []
+    versions = []
+    for name in os.listdir(history_dir):
+        if name.startswith("distortion_model-v") and name.endswith(".pkl"):
+            versions.append(int(name[len("distortion_model-v"):-len(".pkl")]))
+    return sorted(versions)
+
+
+def pin_version(version, history_dir=HISTORY_DIR, pin_path=PIN_PATH):
+    # rolls every worker back to an earlier published version
+    if not os.path.exists(history_path(version, history_dir)):
+        raise ValueError(f"Model version {version} is not in {history_dir}")
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump({"version": int(version)}, f)
+    _replace_atomically(pin_path, write)
+
+
+def pinned_version(pin_path=PIN_PATH):
+    try:
+        with open(pin_path) as f:
+            return json.load(f)["version"]
+    except FileNotFoundError:
+        return None
+
+
+def load_served_model(path=MODEL_PATH, arrays_dir=ARRAYS_DIR, model_format=None,
+                      history_dir=HISTORY_DIR, pin_path=PIN_PATH):
+    # the pinned version from history_dir after a rollback, the published artifacts otherwise
+    version = pinned_version(pin_path)
+    if version is not None:
+        return joblib.load(history_path(version, history_dir), mmap_mode="r")
+    return load_model(path, arrays_dir, model_format)
+
+
+def save_gate(gate, path):
+    # the cascade's TF-IDF gate, swapped in atomically like the model
+    _replace_atomically(path, lambda tmp_path: joblib.dump(gate, tmp_path))
+
+
+def save_band(band, path):
+    # the cascade's calibrated band, which running workers reload (see cascade.CascadeReloader)
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(band, f, indent=2)
+    _replace_atomically(path, write)
+
+
+def load_model(path=MODEL_PATH, arrays_dir=ARRAYS_DIR, model_format=None):
+    # MODEL_FORMAT=npy serves from the memory-mapped coefficient arrays,
+    # the default keeps loading the pickle (with its numpy arrays memory-mapped)
+    model_format = model_format or os.environ.get("MODEL_FORMAT", "pickle")
+    if model_format == "npy":
+        return load_arrays(arrays_dir)
+    return joblib.load(path, mmap_mode="r")
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+
+# how many earlier models are kept in memory for rollback
+HISTORY_SIZE = 3
+
+
+class ServedModel:
+    # a loaded classifier together with the model version it was trained as;
+    # routes grab one of these once per request so a swap never mixes versions
+
+    def __init__(self, estimator, version):
+        self.estimator = estimator
+        self.version = version
+        self.classes_ = estimator.classes_
+
+    def predict_proba(self, X):
+        return self.estimator.predict_proba(X)
+
+    def predict(self, X):
+        return self.estimator.predict(X)
+
+
+def validate_model(estimator, probe):
+    # a new artifact has to produce a sane probability row for a real embedding
+    # before it is allowed to serve traffic
+    if len(estimator.classes_) < 2:
+        raise ValueError("Model has fewer than two classes")
+    probs = np.asarray(estimator.predict_proba(np.asarray(probe).reshape(1, -1)))
+    if probs.shape != (1, len(estimator.classes_)) or not np.isfinite(probs).all():
+        raise ValueError(f"Model returned unexpected probabilities with shape {probs.shape}")
+    if not np.isclose(probs.sum(), 1.0, atol=1e-3):
+        raise ValueError("Model probabilities don't sum to one")
+
+
+def file_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class ModelReloader:
+    # watches the model artifacts from a background thread; a changed artifact is
+    # loaded and validated off the request path and then swapped in with a single
+    # assignment through on_swap. The version served is the one stored in the
+    # artifact, get_version (the latest model_versions row) is only a fallback for
+    # artifacts saved without one. pin makes a rollback visible to every worker, and
+    # also_check are other reloaders (e.g. the cascade's) polled on the same thread
+
+    def __init__(self, load, get_version, validate, on_swap, watched_paths, poll_interval=30, pin=None,
+                 also_check=()):
+        self.load = load
+        self.get_version = get_version
+        self.validate = validate
+        self.on_swap = on_swap
+        self.watched_paths = watched_paths
+        self.poll_interval = poll_interval
+        self.pin = pin
+        self.also_check = list(also_check)
+        self.current = None
+        self.history = []
+        self.last_error = None
+        self._seen = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._owner_pid = None
+
+    def _load(self):
+        estimator = self.load()
+        version = getattr(estimator, "model_version_", None)
+        return ServedModel(estimator, version if version is not None else self.get_version())
+
+    def load_current(self):
+        # initial load, done by the app's warmup
+        with self._lock:
+            signature = file_signature(self.watched_paths)
+            served = self._load()
+            self.validate(served.estimator)
+            self._swap(served)
+            self._seen = signature
+            return served
+
+    def _swap(self, served):
+        if self.current is not None:
+            self.history.append(self.current)
+            del self.history[:-HISTORY_SIZE]
+        self.current = served
+        self.on_swap(served)
+
+    def check(self):
+        # returns True if a new model was swapped in
+        with self._lock:
+            if self.current is None:
+                # warmup hasn't loaded the first model (or the probe embedding that
+                # validation needs) yet; load_current picks up the latest artifacts anyway
+                return False
+            signature = file_signature(self.watched_paths)
+            if signature == self._seen:
+                return False
+            try:
+                served = self._load()
+                self.validate(served.estimator)
+            except Exception as e:
+                # leave the current model serving; a half-written artifact will be
+                # retried on the next poll once its signature settles
+                traceback.print_exc()
+                self.last_error = str(e)
+                return False
+            self._seen = signature
+            self.last_error = None
+            self._swap(served)
+            return True
+
+    def rollback(self):
+        # go back to the previously served model; pin records it where the other
+        # workers' pollers (and restarted workers) pick it up, and it stays pinned
+        # until the next model is published
+        with self._lock:
+            if not self.history:
+                raise ValueError("No earlier model to roll back to")
+            previous = self.history[-1]
+            if self.pin is not None:
+                self.pin(previous.version)
+            self.history.pop()
+            # this worker swaps straight away instead of reloading its own pin
+            self._seen = file_signature(self.watched_paths)
+            self.current = previous
+            self.on_swap(previous)
+            return previous
+
+    def ensure_started(self):
+        # polling thread is started lazily so it also runs in forked gunicorn workers
+        if self.poll_interval <= 0 or (self._owner_pid == os.getpid() and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._owner_pid != os.getpid() or not self._thread.is_alive():
+                self._owner_pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="model-reloader", daemon=True)
+                self._thread.start()
+
+    def poll(self):
+        try:
+            if self.check():
+                print(f"Reloaded model, now serving version {self.current.version}")
+        except Exception:
+            traceback.print_exc()
+        for check in self.also_check:
+            try:
+                check()
+            except Exception:
+                traceback.print_exc()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.poll()
+
+    def status(self):
+        return {
+            "version": self.current.version if self.current else None,
+            "history": [served.version for served in self.history],
+            "last_error": self.last_error,
+        }
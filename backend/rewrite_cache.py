@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_SIZE = 1000
+
+
+def rewrite_key(text, distortions, model_name, prompt_version):
+    payload = json.dumps([text, distortions, model_name, prompt_version], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RewriteCache:
+    # TTL + LRU cache of finished rewrites, which also coalesces identical requests
+    # that arrive while the first one is still waiting on the model: they all wait on
+    # the same Future instead of each making their own upstream call
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_size=DEFAULT_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        # asyncio tasks of the rewrites asgi.py is waiting on
+        self._async_in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute, timeout=None):
+        # raises TimeoutError if the result isn't ready within timeout seconds; the
+        # upstream call keeps running and still fills the cache for the next request
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                owner = True
+
+        if owner:
+            self._compute(key, compute, future)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError as e:
+            # only an alias of TimeoutError from 3.11 on
+            raise TimeoutError("Rewrite wasn't ready in time") from e
+
+    async def aget_or_compute(self, key, compute, timeout=None):
+        # asyncio version of get_or_compute for the event loop: compute is a coroutine
+        # function, run once as a task that every identical request awaits; a waiter
+        # timing out doesn't cancel the task, so its result still gets cached
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            task = self._async_in_flight.get(key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                task = self._async_in_flight[key] = asyncio.ensure_future(self._acompute(key, compute))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError as e:
+            raise TimeoutError("Rewrite wasn't ready in time") from e
+
+    async def _acompute(self, key, compute):
+        try:
+            value = await compute()
+        finally:
+            with self._lock:
+                del self._async_in_flight[key]
+        with self._lock:
+            self._store(key, value)
+        return value
+
+    def get(self, key):
+        # a cached rewrite, or None; doesn't wait for a call in flight
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _compute(self, key, compute, future):
+        try:
+            value = compute()
+        except BaseException as e:
+            # failures are handed to everyone waiting but never cached
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            del self._in_flight[key]
+            self._store(key, value)
+        future.set_result(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "in_flight": len(self._in_flight) + len(self._async_in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
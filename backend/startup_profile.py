@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# measures how long `import app` takes and which packages it spends that time on,
+# using python's -X importtime output, plus how long the background warmup takes
+# to make the app ready
+
+PROBE = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+ready = app.wait_until_ready()
+print("STARTUP_JSON " + __import__("json").dumps({
+    "import_seconds": round(imported, 3),
+    "ready": ready,
+    "ready_seconds": round(time.perf_counter() - start, 3),
+    "warmup": app.warmup_state,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    # each line looks like "import time:  self [us] | cumulative | imported package";
+    # self times are summed per top-level package so submodules count towards it
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        package = parts[2].strip().split(".")[0]
+        packages[package] += int(parts[0])
+    return dict(packages)
+
+
+def profile(top=15):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr[-2000:])
+
+    summary = next(
+        json.loads(line[len("STARTUP_JSON "):]) for line in result.stdout.splitlines() if line.startswith("STARTUP_JSON ")
+    )
+    packages = parse_importtime(result.stderr)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    summary["imports"] = [{"package": name, "seconds": round(us / 1e6, 3)} for name, us in slowest]
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Break down the backend's cold start time")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = profile(args.top)
+    print(f"import app: {report['import_seconds']}s, ready after {report['ready_seconds']}s")
+    for stage, seconds in report["warmup"]["timings"].items():
+        print(f"  warmup {stage:<16} {seconds}s")
+    print("Slowest packages (self time, summed per top-level package):")
+    for row in report["imports"]:
+        print(f"  {row['package']:<30} {row['seconds']}s")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
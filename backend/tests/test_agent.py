@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from agent import Agent, SessionStore
+from llm import ScriptedClient, StubClient
+
+
+def call(name, **arguments):
+    return {"id": f"{name}-call", "name": name, "arguments": arguments}
+
+def make_agent(llm, tools, max_steps=5):
+    return Agent(llm, tools, ThreadPoolExecutor(max_workers=4), max_steps=max_steps)
+
+def test_tool_results_are_fed_back_until_the_model_answers():
+    llm = ScriptedClient([
+        {"text": "", "tool_calls": [call("analyze_text", text="I always fail.")]},
+        {"text": "You labelled one sentence as overgeneralization.", "tool_calls": []},
+    ])
+    tools = {"analyze_text": lambda text: {"results": [{"input": text, "prediction": "Overgeneralization"}]}}
+    result = make_agent(llm, tools).run(SessionStore().get("s"), "Analyze my entry")
+    assert result["finished"] is True
+    assert result["reply"] == "You labelled one sentence as overgeneralization."
+    assert result["steps"] == [{"tool": "analyze_text", "arguments": {"text": "I always fail."}, "cached": False}]
+    tool_message = llm.seen[1][-1]
+    assert tool_message["role"] == "tool" and tool_message["content"]["results"][0]["prediction"] == "Overgeneralization"
+
+def test_calls_in_one_turn_run_concurrently():
+    running = []
+    overlap = threading.Event()
+
+    def slow(text):
+        running.append(text)
+        if len(running) == 2:
+            overlap.set()
+        # only returns once both calls are running at the same time
+        assert overlap.wait(1)
+        return {"text": text}
+
+    llm = ScriptedClient([
+        {"text": "", "tool_calls": [call("slow", text="a"), call("slow", text="b")]},
+        {"text": "done", "tool_calls": []},
+    ])
+    start = time.perf_counter()
+    result = make_agent(llm, {"slow": slow}).run(SessionStore().get("s"), "go")
+    assert result["reply"] == "done"
+    assert time.perf_counter() - start < 1
+    assert [m["content"] for m in llm.seen[1] if m["role"] == "tool"] == [{"text": "a"}, {"text": "b"}]
+
+def test_results_are_memoized_per_session():
+    calls = []
+    tools = {"analyze_text": lambda text: calls.append(text) or {"n": len(calls)}}
+    turn = [{"text": "", "tool_calls": [call("analyze_text", text="x"), call("analyze_text", text="x")]},
+            {"text": "ok", "tool_calls": []}]
+    sessions = SessionStore()
+    result = make_agent(ScriptedClient(turn), tools).run(sessions.get("s"), "one")
+    assert calls == ["x"]
+    assert [step["cached"] for step in result["steps"]] == [False, False]
+
+    result = make_agent(ScriptedClient(turn), tools).run(sessions.get("s"), "two")
+    assert calls == ["x"]
+    assert [step["cached"] for step in result["steps"]] == [True, True]
+
+    # a different session starts with an empty memo
+    make_agent(ScriptedClient(turn), tools).run(sessions.get("other"), "three")
+    assert calls == ["x", "x"]
+
+def test_failed_and_unknown_tools_become_error_results():
+    def broken(text):
+        raise ValueError("bad input")
+
+    llm = ScriptedClient([
+        {"text": "", "tool_calls": [call("broken", text="x"), call("missing")]},
+        {"text": "sorry", "tool_calls": []},
+    ])
+    session = SessionStore().get("s")
+    make_agent(llm, {"broken": broken}).run(session, "go")
+    assert [m["content"] for m in llm.seen[1] if m["role"] == "tool"] == [
+        {"error": "bad input"}, {"error": "Unknown tool missing"},
+    ]
+    # errors are not memoized
+    assert session.memo == {}
+
+def test_step_budget_stops_the_loop():
+    llm = ScriptedClient([{"text": "", "tool_calls": [call("echo", text=str(i))]} for i in range(10)])
+    result = make_agent(llm, {"echo": lambda text: text}, max_steps=3).run(SessionStore().get("s"), "loop")
+    assert result["finished"] is False
+    assert result["reply"] is None
+    assert len(result["steps"]) == 3
+
+def test_stub_policy_analyzes_then_rewrites():
+    tools = {
+        "analyze_text": lambda text: {"results": [{"input": text, "prediction": "Labeling", "confidence": 0.9}]},
+        "rewrite_text": lambda text, distortions: {"rewritten": f"{text} ({len(distortions)})"},
+    }
+    result = make_agent(StubClient(), tools).run(SessionStore().get("s"), "I am a failure.")
+    assert result["reply"] == "I am a failure. (1)"
+    assert [step["tool"] for step in result["steps"]] == ["analyze_text", "rewrite_text"]
+
+def test_sessions_expire():
+    sessions = SessionStore(ttl_seconds=0.01)
+    session = sessions.get("s")
+    session.memo["k"] = 1
+    time.sleep(0.02)
+    assert sessions.get("s").memo == {}
+
+def test_failed_turn_is_taken_back_out_of_the_session():
+    session = SessionStore().get("s")
+    make_agent(ScriptedClient([{"text": "hi", "tool_calls": []}]), {}).run(session, "first")
+    before = list(session.messages)
+    # the model asks for a tool, then the LLM fails on the follow-up call
+    llm = ScriptedClient([{"text": "", "tool_calls": [call("echo", text="x")]}])
+
+    with pytest.raises(RuntimeError):
+        make_agent(llm, {"echo": lambda text: text}).run(session, "second")
+    assert session.messages == before
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_agent(ScriptedClient([]), {}).arun(session, "third"))
+    assert session.messages == before
+
+def test_history_is_capped_at_whole_turns():
+    session = SessionStore().get("s")
+    turn = [{"text": "", "tool_calls": [call("echo", text="x")]}, {"text": "ok", "tool_calls": []}]
+    agent = Agent(ScriptedClient(turn * 10), {"echo": lambda text: text}, ThreadPoolExecutor(max_workers=1), max_messages=10)
+
+    for i in range(10):
+        agent.run(session, f"turn {i}")
+
+    # four messages per turn, so the two latest turns fit
+    assert len(session.messages) == 8
+    assert session.messages[0] == {"role": "user", "content": "turn 8"}
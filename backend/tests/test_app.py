@@ -1,3 +1,4 @@
+import json
 import pytest
 import os
 import sys
@@ -7,7 +8,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 os.environ["API_KEY"] = "test-key"  # set before app loads                                                                                           
                                                                                                                                                        
-from app import app                                                                                                                                  
+from app import app, limiter                                                                                                                                  
                   
 @pytest.fixture
 def client():
@@ -64,9 +65,18 @@ def test_feedbacK_text_too_long(client):
     assert response.status_code == 400
     assert result["error"] == "Sentence is too long for feedback"
 
+def test_feedback_without_text_is_rejected(client):
+    # more posts than /feedback's rate limit allows, so don't count them against the other tests
+    limiter.reset()
+    for payload in ({"predicted_distortion": "Labeling"}, {"text": None}, {"text": "  "}, {"text": 5},
+                    {"text": "I always fail", "confidence": "high"}, {"text": "I always fail", "is_accepted": "yes"}, ["I always fail"]):
+        response = client.post("/feedback", json=payload, headers={"X-API-Key": "test-key"})
+        assert response.status_code == 400, payload
+    limiter.reset()
+
 def test_predict_model_error(client):
     with patch('app.model') as mock_model:
-        mock_model.predict.side_effect = Exception("Model Crashed")
+        mock_model.predict_proba.side_effect = Exception("Model Crashed")
         response = client.post("/predict", json={"text": "sample sentence"})
         assert response.status_code == 500
 
@@ -75,4 +85,181 @@ def test_feedback_model_error(client):
         mock_save_feedback.side_effect = Exception("Model Crashed")
         response = client.post("/feedback",   json={"text": "I always fail", "predicted_distortion": "Overgeneralization", "is_accepted": True, "confidence": 0.8},
         headers={"X-API-Key": "test-key"}  )
-        assert response.status_code == 500
\ No newline at end of file
+        assert response.status_code == 500
+
+def test_predict_batch_returns_results_per_entry(client):
+    response = client.post(
+        "/predict/batch",
+        json={"entries": ["I always fail at everything I do.", "Nobody likes me. I will never succeed."]}
+    )
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert len(result["results"]) == 2
+
+def test_predict_batch_missing_entries_returns_400(client):
+    response = client.post("/predict/batch", json={"entries": []})
+
+    assert response.status_code == 400
+
+def test_predict_batch_text_too_long_returns_400(client):
+    response = client.post("/predict/batch", json={"entries": ["fine", "a" * 5001]})
+    result = response.get_json()
+
+    assert response.status_code == 400
+    assert result["error"] == "Text is too long, please enter a shorter message"
+
+def test_livez_returns_ok(client):
+    response = client.get("/livez")
+
+    assert response.status_code == 200
+
+def test_readyz_reports_warmup_timings_once_ready(client):
+    client.get("/health")
+    response = client.get("/readyz")
+    result = response.get_json()
+
+    assert response.status_code == 200
+    assert result["status"] == "ready"
+    assert "encoder_load" in result["timings"]
+
+def test_predict_stream_sends_one_line_per_sentence_with_offsets(client):
+    text = "I always fail at everything I do. Nobody will ever love me."
+    response = client.post("/predict/stream", json={"text": text})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert lines[-1] == {"done": True, "sentences": 2, "model_version": client.get("/model").get_json()["version"]}
+    for line in lines[:-1]:
+        assert text[line["start"]:line["end"]] == line["input"]
+
+def test_predict_stream_missing_text_returns_400(client):
+    response = client.post("/predict/stream", json={"text": ""})
+
+    assert response.status_code == 400
+
+def test_predict_incremental_returns_delta_and_conflicts_on_stale_revision(client):
+    first = client.post("/predict/incremental", json={"document_id": "entry-1", "base_revision": None, "text": "I failed. It rained."})
+    assert first.status_code == 200
+    revision = first.get_json()["revision"]
+
+    second = client.post("/predict/incremental", json={"document_id": "entry-1", "base_revision": revision, "text": "I failed. It snowed."})
+    assert second.status_code == 200
+    assert [s["input"] for s in second.get_json()["changed"]] == ["It snowed."]
+
+    stale = client.post("/predict/incremental", json={"document_id": "entry-1", "base_revision": revision, "text": "I failed."})
+    assert stale.status_code == 409
+    assert stale.get_json()["revision"] == revision + 1
+
+def test_predict_reports_the_serving_model_version(client):
+    response = client.post("/predict", json={"text": "I always fail at everything I do."})
+    status = client.get("/model").get_json()
+
+    assert response.get_json()["model_version"] == status["version"]
+
+def test_model_rollback_requires_api_key(client):
+    response = client.post("/model/rollback")
+
+    assert response.status_code == 401
+
+def test_metrics_endpoint_prometheus_format(client):
+    client.get("/livez")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE reframe_requests_total counter" in text
+    assert 'reframe_requests_total{endpoint="/livez",method="GET",status="200"}' in text
+
+def test_server_timing_header(client):
+    with patch("app.SERVER_TIMING", True):
+        response = client.get("/livez")
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+def test_rewrite_is_cached_with_the_stub_llm(client):
+    from llm import StubClient
+    import app as app_module
+    stub = StubClient()
+    app_module.rewrite_cache.clear()
+    payload = {
+        "text": "I always fail.",
+        "distortions": [{"input": "I always fail.", "prediction": "Overgeneralization", "confidence": 0.8}],
+    }
+    with patch("app.llm", stub):
+        first = client.post("/rewrite", json=payload)
+        second = client.post("/rewrite", json=payload)
+    assert first.status_code == 200
+    assert first.get_json() == second.get_json() == {"rewritten": "Rewritten: I always fail."}
+    assert stub.calls == 1
+
+def test_rewrite_timeout_returns_504(client):
+    from llm import StubClient
+    import app as app_module
+    app_module.rewrite_cache.clear()
+    with patch("app.llm", StubClient(delay=1)), patch("app.REWRITE_TIMEOUT", 0.01):
+        response = client.post("/rewrite", json={"text": "slow", "distortions": []})
+    assert response.status_code == 504
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_rewrite_stream_sends_tokens_then_done(client):
+    from llm import StubClient
+    import app as app_module
+    app_module.rewrite_cache.clear()
+    payload = {"text": "I always fail at everything.", "distortions": []}
+    with patch("app.llm", StubClient()):
+        response = client.post("/rewrite/stream", json=payload)
+        assert response.mimetype == "text/event-stream"
+        events = parse_events(response.get_data(as_text=True))
+        # the finished rewrite is cached, so a repeat is answered without the model
+        cached = parse_events(client.post("/rewrite/stream", json=payload).get_data(as_text=True))
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert len(tokens) == 6
+    assert events[-1] == ("done", {"rewritten": "".join(tokens)})
+    assert "".join(tokens) == "Rewritten: I always fail at everything."
+    assert cached[-1] == ("done", {"rewritten": "".join(tokens), "cached": True})
+
+def test_rewrite_stream_cancels_upstream_on_disconnect(client):
+    from llm import StubClient
+    import app as app_module
+    app_module.rewrite_cache.clear()
+    stub = StubClient()
+    with patch("app.llm", stub):
+        response = client.post("/rewrite/stream", json={"text": "one two three four", "distortions": []}, buffered=False)
+        next(iter(response.response))
+        response.close()
+    assert stub.cancelled == 1
+    assert app_module.rewrite_cache.stats()["size"] == 0
+
+def test_agent_runs_tools_in_process(client):
+    from llm import StubClient
+    analyzed = []
+    tools = {
+        "analyze_text": lambda text: analyzed.append(text) or {"results": [{"input": text, "prediction": "Labeling", "confidence": 0.9}]},
+        "rewrite_text": lambda text, distortions: {"rewritten": "I made a mistake."},
+    }
+    with patch("app.llm", StubClient()), patch.dict("app.AGENT_TOOLS", tools):
+        response = client.post("/agent", json={"message": "I am a failure."})
+        result = response.get_json()
+        again = client.post("/agent", json={"message": "I am a failure.", "session_id": result["session_id"]}).get_json()
+    assert response.status_code == 200
+    assert result["reply"] == "I made a mistake."
+    assert result["finished"] is True
+    assert [step["cached"] for step in again["steps"]] == [True, True]
+    assert analyzed == ["I am a failure."]
+
+def test_agent_missing_message_returns_400(client):
+    response = client.post("/agent", json={"message": ""})
+    assert response.status_code == 400
+
+def test_feedback_stats_requires_api_key(client):
+    assert client.get("/feedback/stats").status_code == 401
+    response = client.get("/feedback/stats", headers={"X-API-Key": "test-key"})
+    assert response.status_code == 200
+    assert set(response.get_json()) == {"labels", "confusion"}
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import sys
+import os
+from unittest.mock import patch
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["API_KEY"] = "test-key"
+
+import httpx
+import pytest
+import asgi
+from llm import StubClient
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    asgi.wsgi.rewrite_cache.clear()
+
+def run(requests):
+    # sends requests concurrently to the ASGI app in-process
+    async def send():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.request(method, url, **kwargs) for method, url, kwargs in requests))
+    return asyncio.run(send())
+
+def rewrite_payload(text):
+    return {"text": text, "distortions": [{"input": text, "prediction": "Labeling", "confidence": 0.9}]}
+
+def test_rewrites_wait_on_the_event_loop_concurrently():
+    stub = StubClient(delay=0.3)
+    with patch("app.llm", stub):
+        start = time.perf_counter()
+        responses = run([("POST", "/rewrite", {"json": rewrite_payload(f"entry {i}")}) for i in range(20)])
+        elapsed = time.perf_counter() - start
+    assert [r.status_code for r in responses] == [200] * 20
+    assert responses[3].json() == {"rewritten": "Rewritten: entry 3"}
+    # twenty 300ms calls finish together instead of one after another
+    assert elapsed < 1.5
+    assert stub.calls == 20
+
+def test_identical_async_rewrites_share_one_call():
+    stub = StubClient(delay=0.1)
+    with patch("app.llm", stub):
+        responses = run([("POST", "/rewrite", {"json": rewrite_payload("same")})] * 5)
+        cached = run([("POST", "/rewrite", {"json": rewrite_payload("same")})])
+    assert {r.json()["rewritten"] for r in responses + cached} == {"Rewritten: same"}
+    assert stub.calls == 1
+
+def test_rewrite_timeout_returns_504():
+    with patch("app.llm", StubClient(delay=1)), patch("app.REWRITE_TIMEOUT", 0.05):
+        response, = run([("POST", "/rewrite", {"json": rewrite_payload("slow")})])
+    assert response.status_code == 504
+
+def test_rewrite_stream_events():
+    with patch("app.llm", StubClient()):
+        response, = run([("POST", "/rewrite/stream", {"json": rewrite_payload("one two")})])
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'event: done\ndata: {"rewritten": "Rewritten: one two"}' in response.text
+
+def test_other_routes_go_to_flask():
+    response, = run([("GET", "/livez", {})])
+    assert response.json() == {"status": "ok"}
+    response, = run([("POST", "/feedback", {"json": {}})])
+    assert response.status_code == 401
+
+def test_cors_matches_the_flask_app():
+    headers = {"Origin": "http://localhost:3000", "Access-Control-Request-Method": "POST"}
+    async_preflight, flask_preflight = run([("OPTIONS", "/rewrite", {"headers": headers}), ("OPTIONS", "/predict", {"headers": headers})])
+    assert async_preflight.headers["access-control-allow-origin"] == "http://localhost:3000"
+    assert flask_preflight.headers["access-control-allow-origin"] == "http://localhost:3000"
+    denied, = run([("OPTIONS", "/rewrite", {"headers": {**headers, "Origin": "https://example.com"}})])
+    assert "access-control-allow-origin" not in denied.headers
+
+def test_agent_runs_on_the_event_loop_and_is_rate_limited():
+    tools = {
+        "analyze_text": lambda text: {"results": [{"input": text, "prediction": "Labeling", "confidence": 0.9}]},
+        "rewrite_text": asgi.arewrite_text,
+    }
+    asgi.rate_limiter.storage.reset()
+    with patch("app.llm", StubClient()), patch.dict("asgi.AGENT_TOOLS", tools):
+        responses = run([("POST", "/agent", {"json": {"message": f"I am a failure {i}."}}) for i in range(11)])
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [200] * 10 + [429]
+    ok = next(r.json() for r in responses if r.status_code == 200)
+    assert ok["finished"] is True and ok["reply"].startswith("Rewritten: I am a failure")
+
+def test_oversized_bodies_are_refused_like_the_flask_app():
+    asgi.rate_limiter.storage.reset()
+    oversized = rewrite_payload("x" * (asgi.wsgi.app.config["MAX_CONTENT_LENGTH"] + 1))
+    oversized["message"] = oversized["text"]
+
+    async def chunked():
+        # no content-length, so the limit has to hold while the body is read
+        yield b'{"text": "'
+        for _ in range(20):
+            yield b"x" * 1024
+        yield b'"}'
+
+    with patch("app.llm", StubClient()):
+        responses = run([("POST", path, {"json": oversized}) for path in ("/rewrite", "/rewrite/stream", "/agent")])
+        streamed, = run([("POST", "/rewrite", {"content": chunked()})])
+        flask, = run([("POST", "/predict", {"json": oversized})])
+    for response in responses + [streamed, flask]:
+        assert response.status_code == 413
+        assert response.json() == {"error": "Request is too large"}
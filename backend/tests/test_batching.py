@@ -0,0 +1,56 @@
+import threading
+import numpy as np
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from batching import EncoderBatcher
+
+
+class RecordingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, sentences):
+        self.calls.append(list(sentences))
+        return np.array([[len(s)] for s in sentences])
+
+
+def test_concurrent_requests_share_one_encode_call():
+    encoder = RecordingEncoder()
+    batcher = EncoderBatcher(encoder, max_batch_size=100, max_wait_ms=200)
+    requests = [["a"], ["bb", "ccc"], ["dddd"]]
+    results = [None] * len(requests)
+
+    def send(i):
+        results[i] = batcher.encode(requests[i])
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(requests))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(encoder.calls) == 1
+    for sentences, embeddings in zip(requests, results):
+        assert [row[0] for row in embeddings] == [len(s) for s in sentences]
+    assert batcher.stats()["largest_batch"] == 4
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    encoder = RecordingEncoder()
+    batcher = EncoderBatcher(encoder, max_batch_size=2, max_wait_ms=10000)
+
+    embeddings = batcher.encode(["one", "two"])
+
+    assert len(embeddings) == 2
+    assert batcher.stats()["batches"] == 1
+
+def test_encoder_errors_are_raised_in_the_caller():
+    class BrokenEncoder:
+        def encode(self, sentences):
+            raise RuntimeError("encoder crashed")
+
+    batcher = EncoderBatcher(BrokenEncoder(), max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        batcher.encode(["anything"])
@@ -0,0 +1,25 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+from run_benchmarks import compare, make_sentences, missing_baselines, summarize
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    result = summarize([0.001] * 98 + [0.010, 0.020], items_per_call=10)
+    assert result["runs"] == 100
+    assert result["p50_ms"] == 1.0
+    assert result["p99_ms"] > result["p95_ms"] >= result["p50_ms"]
+    assert result["per_sec"] == round(1000 / 0.128, 1)
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baselines = {"predict_10_sentences": {"p95_ms": 10.0, "per_sec": 1000.0}}
+    within = {"predict_10_sentences": {"p95_ms": 12.0, "per_sec": 850.0}}
+    slower = {"predict_10_sentences": {"p95_ms": 13.0, "per_sec": 700.0}}
+    assert compare(within, baselines, 0.25) == []
+    assert len(compare(slower, baselines, 0.25)) == 2
+    # benchmarks without a stored baseline can't regress, main() fails the run on them instead
+    assert compare({"save_feedback": {"p95_ms": 99.0, "per_sec": 1.0}}, baselines, 0.25) == []
+    assert missing_baselines({"save_feedback": {}, "predict_10_sentences": {}}, baselines) == ["save_feedback"]
+
+def test_two_hundred_sentences_fit_predict_limit():
+    assert len(" ".join(make_sentences(200))) <= 5000
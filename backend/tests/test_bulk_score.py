@@ -0,0 +1,140 @@
+import json
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pandas as pd
+import pytest
+from bulk_score import read_entries, length_sorted_batches, score_file
+
+
+class FakeEncoder:
+    batches = []
+
+    def encode(self, sentences, batch_size=None):
+        FakeEncoder.batches.append(list(sentences))
+        return np.array([[len(s)] for s in sentences], dtype=float)
+
+
+class FakeModel:
+    classes_ = np.array(["Labeling", "No Distortion"])
+
+    def predict_proba(self, X):
+        # long sentences are "Labeling", short ones "No Distortion"
+        long = (np.asarray(X)[:, 0] > 10).astype(float)
+        return np.column_stack([0.1 + 0.8 * long, 0.9 - 0.8 * long])
+
+
+def fake_models():
+    return FakeEncoder(), FakeModel(), None
+
+
+def versioned_models(version):
+    def load():
+        encoder, model, cascade = fake_models()
+        model.model_version_ = version
+        return encoder, model, cascade
+    return load
+
+
+def write_jsonl(path, texts):
+    with open(path, "w") as f:
+        for i, text in enumerate(texts):
+            f.write(json.dumps({"id": f"e{i}", "text": text}) + "\n")
+
+
+ENTRIES = ["I always fail at everything. Ok.", "", "Nobody likes me. Fine. I am a total loser here.", "Hi."]
+
+
+def test_read_entries_chunks_csv_and_jsonl(tmp_path):
+    csv_path = str(tmp_path / "entries.csv")
+    pd.DataFrame({"text": ENTRIES}).to_csv(csv_path, index=False)
+    jsonl_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(jsonl_path, ENTRIES)
+
+    assert list(read_entries(csv_path, chunk_size=3)) == [
+        [("0", ENTRIES[0]), ("1", ""), ("2", ENTRIES[2])], [("3", ENTRIES[3])]
+    ]
+    assert [len(chunk) for chunk in read_entries(jsonl_path, id_column="id", chunk_size=3)] == [3, 1]
+    assert next(read_entries(jsonl_path, id_column="id"))[2] == ("e2", ENTRIES[2])
+
+def test_length_sorted_batches_group_similar_lengths():
+    sentences = ["a", "aaaa", "aa", "aaaaa", "aaa"]
+
+    batches = length_sorted_batches(sentences, 2)
+
+    assert [[sentences[i] for i in batch] for batch in batches] == [["aaaaa", "aaaa"], ["aaa", "aa"], ["a"]]
+
+def test_score_file_writes_one_row_per_sentence(tmp_path):
+    input_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(input_path, ENTRIES)
+    FakeEncoder.batches = []
+
+    result = score_file(input_path, str(tmp_path / "out"), workers=0, chunk_size=2, batch_size=2,
+                        id_column="id", model_version=7, loader=fake_models, progress=lambda message: None)
+
+    scores = pd.read_parquet(str(tmp_path / "out"))
+    assert result["entries"] == 4 and result["sentences"] == len(scores) == 6
+    assert scores["entry_id"].tolist() == ["e0", "e0", "e2", "e2", "e2", "e3"]
+    assert scores["sentence"].tolist() == [
+        "I always fail at everything.", "Ok.", "Nobody likes me.", "Fine.", "I am a total loser here.", "Hi."
+    ]
+    assert scores["prediction"].tolist() == ["Labeling", "No Distortion", "Labeling", "No Distortion", "Labeling", "No Distortion"]
+    assert (scores["model_version"] == 7).all()
+    assert all(len(batch) <= 2 for batch in FakeEncoder.batches)
+
+def test_score_file_resumes_after_an_interruption(tmp_path):
+    input_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(input_path, ENTRIES)
+    output_dir = str(tmp_path / "out")
+
+    def interrupt(message):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        score_file(input_path, output_dir, workers=0, chunk_size=2, loader=fake_models, progress=interrupt)
+    assert sorted(os.listdir(output_dir)) == ["_checkpoint.json", "part-00000.parquet"]
+
+    FakeEncoder.batches = []
+    messages = []
+    result = score_file(input_path, output_dir, workers=0, chunk_size=2, loader=fake_models, progress=messages.append)
+
+    assert messages[0].startswith("Resuming after chunk 1")
+    # only the second chunk's sentences were encoded again
+    assert sorted(s for batch in FakeEncoder.batches for s in batch) == sorted(["Nobody likes me.", "Fine.", "I am a total loser here.", "Hi."])
+    assert result["chunks_done"] == 2 and result["sentences"] == len(pd.read_parquet(output_dir)) == 6
+
+def test_score_file_refuses_a_checkpoint_from_another_model(tmp_path):
+    input_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(input_path, ENTRIES)
+    output_dir = str(tmp_path / "out")
+    score_file(input_path, output_dir, workers=0, model_version=1, loader=fake_models, progress=lambda message: None)
+
+    with pytest.raises(ValueError):
+        score_file(input_path, output_dir, workers=0, model_version=2, loader=fake_models)
+    result = score_file(input_path, output_dir, workers=0, model_version=2, loader=fake_models,
+                        restart=True, progress=lambda message: None)
+    assert result["model_version"] == 2 and result["sentences"] == 6
+
+def test_score_file_with_worker_processes(tmp_path):
+    input_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(input_path, ENTRIES * 5)
+
+    in_process = score_file(input_path, str(tmp_path / "a"), workers=0, chunk_size=7, batch_size=3,
+                            loader=fake_models, progress=lambda message: None)
+    pooled = score_file(input_path, str(tmp_path / "b"), workers=2, chunk_size=7, batch_size=3,
+                        loader=fake_models, progress=lambda message: None)
+
+    assert pooled["sentences"] == in_process["sentences"] == 30
+    pd.testing.assert_frame_equal(pd.read_parquet(str(tmp_path / "a")), pd.read_parquet(str(tmp_path / "b")))
+
+def test_score_file_refuses_a_model_published_after_the_run_started(tmp_path):
+    input_path = str(tmp_path / "entries.jsonl")
+    write_jsonl(input_path, ENTRIES)
+
+    with pytest.raises(RuntimeError):
+        score_file(input_path, str(tmp_path / "a"), workers=0, model_version=7,
+                   loader=versioned_models(8), progress=lambda message: None)
+    result = score_file(input_path, str(tmp_path / "b"), workers=0, model_version=8,
+                        loader=versioned_models(8), progress=lambda message: None)
+    assert (pd.read_parquet(str(tmp_path / "b"))["model_version"] == 8).all() and result["sentences"] == 6
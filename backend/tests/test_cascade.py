@@ -0,0 +1,186 @@
+import json
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import joblib
+import pytest
+from sklearn.linear_model import LogisticRegression
+from cascade import CascadeClassifier, CascadeReloader, load_cascade, calibrate_band, evaluate_band
+from classifier import classify_entries
+from metrics import CASCADE_SENTENCES
+from model_artifacts import artifact_paths, load_model, save_gate, save_model
+from model_reloader import ModelReloader, validate_model
+
+
+class FakeGate:
+    # top class probability per sentence, read from a lookup table
+    classes_ = np.array(["Labeling", "No Distortion", "Overgeneralization"])
+
+    def __init__(self, confidences):
+        self.confidences = confidences
+
+    def predict_proba(self, sentences):
+        # "Labeling" wins with the looked up probability, the rest is split evenly
+        top = np.array([self.confidences[s] for s in sentences])
+        return np.column_stack([top, (1 - top) / 2, (1 - top) / 2])
+
+
+class FakeModel:
+    classes_ = np.array(["Labeling", "No Distortion"])
+
+    def predict_proba(self, X):
+        # every escalated sentence is confidently "No Distortion"
+        return np.tile([0.05, 0.95], (len(X), 1))
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, sentences):
+        self.seen.extend(sentences)
+        return np.zeros((len(sentences), 2))
+
+
+def test_only_sentences_inside_the_band_reach_the_encoder():
+    gate = FakeGate({"sure.": 0.97, "unsure.": 0.6, "noise.": 0.36})
+    encoder = FakeEncoder()
+    before = dict(CASCADE_SENTENCES._values)
+
+    predictions, confidences, keep = CascadeClassifier(gate, low=0.4, high=0.9).classify(
+        FakeModel(), encoder, ["sure.", "unsure.", "noise."], threshold=0.5
+    )
+
+    assert encoder.seen == ["unsure."]
+    assert list(predictions) == ["Labeling", "No Distortion", "Labeling"]
+    assert np.allclose(confidences, [0.97, 0.95, 0.36])
+    # below the band the gate's answer stands, and it is dropped by the threshold either way
+    assert list(keep) == [True, True, False]
+    assert CASCADE_SENTENCES._values[("gate",)] - before.get(("gate",), 0) == 2
+    assert CASCADE_SENTENCES._values[("encoder",)] - before.get(("encoder",), 0) == 1
+
+def test_cascade_skips_the_encoder_when_the_gate_is_sure_of_everything():
+    encoder = FakeEncoder()
+
+    predictions, _, _ = CascadeClassifier(FakeGate({"a.": 0.99}), high=0.9).classify(FakeModel(), encoder, ["a."])
+
+    assert encoder.seen == []
+    assert list(predictions) == ["Labeling"]
+
+def test_classify_entries_goes_through_the_cascade():
+    gate = FakeGate({"sure.": 0.97, "unsure.": 0.6})
+    encoder = FakeEncoder()
+
+    results = classify_entries(FakeModel(), encoder, ["sure. unsure.", ""], cascade=CascadeClassifier(gate, high=0.9))
+
+    assert encoder.seen == ["unsure."]
+    assert [[r["prediction"] for r in rows] for rows in results] == [["Labeling", "No Distortion"], []]
+
+def test_evaluate_band_mixes_gate_and_model_answers():
+    gate_predictions = np.array(["a", "a", "b", "b"])
+    gate_confidences = np.array([0.95, 0.5, 0.5, 0.99])
+    model_predictions = np.array(["a", "b", "b", "a"])
+    y_true = np.array(["a", "b", "b", "b"])
+
+    band = evaluate_band(gate_predictions, gate_confidences, model_predictions, y_true, 0.0, 0.9)
+
+    assert band == {"low": 0.0, "high": 0.9, "escalation_rate": 0.5, "accuracy": 1.0}
+
+def test_calibrate_band_picks_the_lowest_escalation_within_the_accuracy_budget():
+    rng = np.random.default_rng(0)
+    y_true = rng.choice(["a", "b"], size=400)
+    gate_confidences = rng.uniform(0.5, 1.0, size=400)
+    # the gate is right when it's confident and guesses below 0.8
+    gate_right = (gate_confidences >= 0.8) | (rng.uniform(size=400) < 0.5)
+    gate_predictions = np.where(gate_right, y_true, np.where(y_true == "a", "b", "a"))
+    model_predictions = y_true.copy()
+
+    best, candidates = calibrate_band(gate_predictions, gate_confidences, model_predictions, y_true, max_accuracy_drop=0.0)
+
+    assert best["accuracy"] == 1.0
+    assert best["high"] == 0.8
+    assert best["escalation_rate"] == pytest.approx((gate_confidences < 0.8).mean(), abs=1e-4)
+    assert all(c["escalation_rate"] >= best["escalation_rate"] for c in candidates if c["accuracy"] == 1.0)
+
+def test_calibrate_band_falls_back_to_escalating_everything():
+    y_true = np.array(["a", "b"])
+
+    best, _ = calibrate_band(np.array(["b", "a"]), np.array([0.99, 0.99]), y_true, y_true, max_accuracy_drop=0.0)
+
+    assert best["escalation_rate"] == 1.0
+
+def test_load_cascade_reads_the_band_and_env_override(tmp_path, monkeypatch):
+    gate_path = str(tmp_path / "gate.pkl")
+    band_path = str(tmp_path / "band.json")
+    save_gate({"stand-in": "gate"}, gate_path)
+    with open(band_path, "w") as f:
+        json.dump({"low": 0.2, "high": 0.75, "model_version": 3, "accuracy": 0.9}, f)
+
+    cascade = load_cascade(gate_path, band_path)
+    assert (cascade.low, cascade.high, cascade.model_version) == (0.2, 0.75, 3)
+    assert cascade.gate == joblib.load(gate_path)
+
+    monkeypatch.setenv("CASCADE_BAND", "0,0.5")
+    cascade = load_cascade(gate_path, band_path)
+    assert (cascade.low, cascade.high, cascade.model_version) == (0.0, 0.5, None)
+
+def test_cascade_steps_aside_for_a_model_it_was_not_calibrated_for(caplog):
+    cascade = CascadeClassifier(FakeGate({}), model_version=3)
+
+    assert cascade.serves(3)
+    assert not cascade.serves(4) and not cascade.serves(4)
+    # warned about once per version
+    assert len([r for r in caplog.records if "calibrated for model version 3" in r.getMessage()]) == 1
+    assert CascadeClassifier(FakeGate({})).serves(4)
+
+def test_recalibrating_after_a_model_reload_turns_the_cascade_back_on(tmp_path):
+    rng = np.random.RandomState(0)
+    X, y = rng.randn(40, 4), rng.choice(["Labeling", "No Distortion"], 40)
+    model_path, arrays_dir = str(tmp_path / "model.pkl"), str(tmp_path / "arrays")
+    gate_path, band_path = str(tmp_path / "gate.pkl"), str(tmp_path / "band.json")
+    history_dir, pin_path = str(tmp_path / "history"), str(tmp_path / "pin.json")
+
+    def publish(version):
+        save_model(LogisticRegression().fit(X, y), model_path, arrays_dir, version=version,
+                   history_dir=history_dir, pin_path=pin_path)
+
+    def calibrate_for(version):
+        with open(band_path, "w") as f:
+            json.dump({"low": 0.2, "high": 0.8, "model_version": version}, f)
+        # a new signature even if the rewrite lands within the same mtime tick
+        os.utime(band_path, ns=(version * 10**9, version * 10**9))
+
+    served = {}
+    publish(1)
+    save_gate({"stand-in": "gate"}, gate_path)
+    calibrate_for(1)
+    cascades = CascadeReloader(lambda cascade: served.update(cascade=cascade),
+                               load=lambda: load_cascade(gate_path, band_path),
+                               watched_paths=(gate_path, band_path))
+    models = ModelReloader(
+        load=lambda: load_model(model_path, arrays_dir, model_format="pickle"),
+        get_version=lambda: None,
+        validate=lambda estimator: validate_model(estimator, np.zeros(4)),
+        on_swap=lambda model: served.update(model=model),
+        watched_paths=artifact_paths(model_path, arrays_dir, pin_path),
+        poll_interval=0,
+        also_check=[cascades.check],
+    )
+    models.load_current()
+    cascades.load_current()
+    assert served["cascade"].serves(served["model"].version)
+
+    publish(2)
+    models.poll()
+    assert served["model"].version == 2
+    assert not served["cascade"].serves(2)
+
+    calibrate_for(2)
+    models.poll()
+    assert served["cascade"].model_version == 2 and served["cascade"].serves(2)
+
+
+def test_load_cascade_without_a_trained_gate(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_cascade(str(tmp_path / "missing.pkl"))
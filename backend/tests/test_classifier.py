@@ -0,0 +1,71 @@
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from classifier import split_sentences, split_sentence_spans, classify_embeddings, classify_sentences, classify_entries
+
+
+class FakeModel:
+    classes_ = np.array(["Labeling", "No Distortion", "Overgeneralization"])
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        # the first feature picks the winning class, the second its probability
+        X = np.asarray(X)
+        probs = np.zeros((len(X), 3))
+        probs[np.arange(len(X)), X[:, 0].astype(int)] = X[:, 1]
+        return probs
+
+
+class FakeEncoder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def encode(self, sentences):
+        self.calls += 1
+        return np.array([self.vectors[s] for s in sentences])
+
+
+def test_split_sentences_drops_empty_pieces():
+    assert split_sentences("  I failed.  Again!   Why?  ") == ["I failed.", "Again!", "Why?"]
+
+def test_split_sentence_spans_point_into_the_original_text():
+    text = "  I failed.  Again!   Why?  "
+
+    spans = split_sentence_spans(text)
+
+    assert [sentence for sentence, _, _ in spans] == split_sentences(text)
+    assert all(text[start:end] == sentence for sentence, start, end in spans)
+
+def test_classify_embeddings_uses_one_predict_proba_call():
+    model = FakeModel()
+    embeddings = np.array([[0, 0.9], [2, 0.6], [1, 0.15]])
+
+    predictions, confidences, keep = classify_embeddings(model, embeddings)
+
+    assert model.calls == 1
+    assert list(predictions) == ["Labeling", "Overgeneralization", "No Distortion"]
+    assert list(keep) == [True, True, False]
+    assert confidences[0] == 0.9
+
+def test_classify_sentences_applies_threshold():
+    results = classify_sentences(FakeModel(), ["a.", "b."], np.array([[0, 0.876543], [1, 0.1]]))
+
+    assert results == [{"input": "a.", "prediction": "Labeling", "confidence": 0.877}]
+
+def test_classify_sentences_handles_no_sentences():
+    assert classify_sentences(FakeModel(), [], np.empty((0, 2))) == []
+
+def test_classify_entries_encodes_once_and_splits_results_per_entry():
+    encoder = FakeEncoder({"I am a loser.": [0, 0.8], "It is fine.": [1, 0.9], "Always.": [2, 0.5]})
+    model = FakeModel()
+
+    results = classify_entries(model, encoder, ["I am a loser. It is fine.", "", "Always."])
+
+    assert encoder.calls == 1
+    assert model.calls == 1
+    assert [[r["input"] for r in entry] for entry in results] == [["I am a loser.", "It is fine."], [], ["Always."]]
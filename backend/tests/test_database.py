@@ -1,9 +1,12 @@
 import pytest
 import sqlite3
+import threading
 import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from database import init_db, save_feedback, get_training_feedback, mark_used_feedback
+from database import init_db, save_feedback, get_training_feedback, mark_used_feedback, retrieve_feedback, get_store
+from database import get_training_feedback_with_ids, mark_used_feedback_ids
+
 
 @pytest.fixture
 def db_path(tmp_path):
@@ -11,6 +14,7 @@ def db_path(tmp_path):
     init_db(path)
     return path
 
+
 def test_init_db_creates_tables(db_path):
     init_db(db_path)
     conn = sqlite3.connect(db_path)
@@ -24,11 +28,13 @@ def test_init_db_creates_tables(db_path):
     assert "feedback" in tables                                                                                                     
     assert "model_versions" in tables
 
+
 def test_save_feedback_returns_id(db_path):
     feedback_id = save_feedback(text="I always mess everything up", predicted_distortion="Overgeneralization", user_correction=None, is_accepted=True, confidence=0.85, path=db_path)
     assert isinstance(feedback_id, int)
     assert feedback_id > 0
 
+
 def test_get_training_feedback_returns_untrained_rows(db_path):
     save_feedback("I never do anything right", "Emotional Reasoning", "Overgeneralization", False, 0.76, path=db_path)                               
     save_feedback("Everything is fine", "No Distortion", None, True, 0.91, path=db_path)                                            
@@ -38,6 +44,7 @@ def test_get_training_feedback_returns_untrained_rows(db_path):
     assert len(results) == 1
     assert results[0][0] == "I never do anything right"
 
+
 def test_mark_used_feedback(db_path):
     save_feedback(text="I feel bad so everything is bad", predicted_distortion="Overgeneralization", user_correction="Emotional Reasoning", is_accepted=False, confidence=0.76, path=db_path)
     save_feedback(text="Nothing good ever happens to me", predicted_distortion="Overgeneralization", user_correction=None, is_accepted=True, confidence=0.76, path=db_path)
@@ -58,4 +65,113 @@ def test_mark_used_feedback(db_path):
 
     assert accepted_row[0] == 1
                                                                                   
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+
+def test_mark_used_feedback_ids_only_marks_those_rows(db_path):
+    folded = save_feedback("I never do anything right", "Emotional Reasoning", "Overgeneralization", False, 0.76, path=db_path)
+    skipped = save_feedback("They must hate me", "Labeling", "Mind Reading", False, 0.5, path=db_path)
+
+    assert [row[0] for row in get_training_feedback_with_ids(path=db_path)] == [folded, skipped]
+    mark_used_feedback_ids([folded], path=db_path)
+
+    assert get_training_feedback_with_ids(path=db_path) == [(skipped, "They must hate me", "Mind Reading")]
+
+
+def test_store_uses_wal_and_reuses_its_connection(db_path):
+    store = get_store(db_path)
+
+    assert store.connection() is store.connection()
+    assert store.connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_transaction_rolls_back_on_error(db_path):
+    store = get_store(db_path)
+
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.save_feedback("I ruin everything", "Labeling", None, True, 0.5)
+            raise RuntimeError("boom")
+
+    assert store.retrieve_feedback() == []
+
+
+def test_concurrent_writers_do_not_lock_each_other_out(db_path):
+    def write(n):
+        for i in range(25):
+            save_feedback(f"thread {n} row {i}", "Labeling", None, True, 0.5, path=db_path)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(retrieve_feedback(path=db_path)) == 100
+
+
+def test_migrations_record_user_version(db_path):
+    from database import MIGRATIONS
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
+    # running init_db again doesn't reapply anything
+    init_db(db_path)
+
+
+def test_training_queries_use_the_partial_index(db_path):
+    from database import SELECT_TRAINING_FEEDBACK, MARK_USED_FEEDBACK
+    conn = get_store(db_path).connection()
+    plan = conn.execute("EXPLAIN QUERY PLAN " + SELECT_TRAINING_FEEDBACK).fetchall()
+    assert "COVERING INDEX idx_feedback_unused" in plan[0][3]
+    plan = conn.execute("EXPLAIN QUERY PLAN " + MARK_USED_FEEDBACK).fetchall()
+    assert "idx_feedback_unused" in plan[0][3]
+
+
+def test_feedback_stats_follow_inserts_updates_and_deletes(db_path):
+    from database import get_feedback_stats
+    save_feedback("a", "Labeling", None, True, 0.9, path=db_path)
+    save_feedback("b", "Labeling", "Overgeneralization", False, 0.7, path=db_path)
+    wrong_id = save_feedback("c", "Labeling", None, False, 0.6, path=db_path)
+    save_feedback("d", "Mind Reading", None, True, 0.8, path=db_path)
+    get_store(db_path).save_feedback_batch([(1000, "e", "Mind Reading", "Labeling", False, 0.5)])
+
+    stats = get_feedback_stats(path=db_path)
+    assert stats["labels"] == [
+        {"label": "Labeling", "total": 3, "accepted": 1, "acceptance_rate": 0.333},
+        {"label": "Mind Reading", "total": 2, "accepted": 1, "acceptance_rate": 0.5},
+    ]
+    assert stats["confusion"] == {
+        "Labeling": {"Labeling": 1, "Overgeneralization": 1},
+        "Mind Reading": {"Labeling": 1, "Mind Reading": 1},
+    }
+
+    with get_store(db_path).transaction() as conn:
+        conn.execute("UPDATE feedback SET user_correction='Mind Reading' WHERE id=?", (wrong_id,))
+        conn.execute("DELETE FROM feedback WHERE text='d'")
+    # marking rows as used doesn't touch the aggregates
+    mark_used_feedback(path=db_path)
+    stats = get_feedback_stats(path=db_path)
+    assert stats["labels"][1] == {"label": "Mind Reading", "total": 1, "accepted": 0, "acceptance_rate": 0.0}
+    assert stats["confusion"] == {
+        "Labeling": {"Labeling": 1, "Mind Reading": 1, "Overgeneralization": 1},
+        "Mind Reading": {"Labeling": 1},
+    }
+
+
+def test_migration_backfills_existing_rows(tmp_path):
+    from database import get_feedback_stats
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    from database import CREATE_FEEDBACK_TABLE, CREATE_MODEL_VERSIONS_TABLE
+    conn.execute(CREATE_FEEDBACK_TABLE)
+    conn.execute(CREATE_MODEL_VERSIONS_TABLE)
+    conn.execute("INSERT INTO feedback (text, predicted_distortion, user_correction, is_accepted, confidence) VALUES ('a', 'Labeling', NULL, 1, 0.9)")
+    conn.execute("INSERT INTO feedback (text, predicted_distortion, user_correction, is_accepted, confidence) VALUES ('b', 'Labeling', 'Mind Reading', 0, 0.9)")
+    conn.commit()
+    conn.close()
+
+    init_db(path)
+    stats = get_feedback_stats(path=path)
+    assert stats["labels"] == [{"label": "Labeling", "total": 2, "accepted": 1, "acceptance_rate": 0.5}]
+    assert stats["confusion"] == {"Labeling": {"Labeling": 1, "Mind Reading": 1}}
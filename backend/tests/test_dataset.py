@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import numpy as np
+import dataset
+from dataset import build_training_frame, held_out_split, load_training_frame
+from model_artifacts import save_training_split
+
+
+@pytest.fixture
+def sources(tmp_path):
+    kaggle_path, augmented_path = str(tmp_path / "kaggle.csv"), str(tmp_path / "augmented.csv")
+    pd.DataFrame({
+        "Patient Question": ["I went for a walk.  It was nice!  ", "Everyone hates me. Always.", None, "Fine. Good?"],
+        "Distorted part": [None, "Everyone hates me.", "x", None],
+        "Dominant Distortion": ["No Distortion", "Overgeneralization", "Labeling", "No Distortion"],
+    }).to_csv(kaggle_path, index=False)
+    pd.DataFrame({"text": ["I am a failure."], "label": ["Labeling"]}).to_csv(augmented_path, index=False)
+    return kaggle_path, augmented_path
+
+def test_no_distortion_paragraphs_are_exploded_into_sentences(sources):
+    df = build_training_frame(*sources, no_distortion_samples=4)
+
+    assert sorted(df[df["label"] == "No Distortion"]["text"]) == ["Fine.", "Good?", "I went for a walk.", "It was nice!"]
+    assert list(df[df["label"] != "No Distortion"]["text"]) == ["Everyone hates me.", "I am a failure."]
+
+def test_prepared_frame_is_cached_until_a_source_changes(sources, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = load_training_frame(*sources, no_distortion_samples=2, cache_dir=cache_dir)
+    again = load_training_frame(*sources, no_distortion_samples=2, cache_dir=cache_dir)
+
+    assert again.equals(first)
+    assert len(os.listdir(cache_dir)) == 1
+
+    load_training_frame(*sources, no_distortion_samples=3, cache_dir=cache_dir)
+    with open(sources[1], "a") as f:
+        f.write("I should be better.,Should statements\n")
+    updated = load_training_frame(*sources, no_distortion_samples=2, cache_dir=cache_dir)
+
+    assert len(os.listdir(cache_dir)) == 3
+    assert "I should be better." in set(updated["text"])
+
+def test_held_out_split_uses_the_rows_train_model_held_out(tmp_path, monkeypatch):
+    split_path = str(tmp_path / "split.npz")
+    monkeypatch.setattr(dataset, "load_training_frame", lambda: pd.DataFrame(
+        {"text": ["a.", "b.", "c.", "d."], "label": ["Labeling", "No Distortion", "Labeling", "No Distortion"]}
+    ))
+    save_training_split(np.zeros((2, 2)), ["Labeling", "No Distortion"], np.ones((2, 2)),
+                        ["No Distortion", "Labeling"], split_path, texts_test=["d.", "feedback."])
+
+    X_train, X_test, y_train, y_test, X_test_embedded = held_out_split(split_path)
+
+    assert X_train == ["a.", "b.", "c."] and list(y_train) == ["Labeling", "No Distortion", "Labeling"]
+    assert X_test == ["d.", "feedback."] and list(y_test) == ["No Distortion", "Labeling"]
+    assert np.array_equal(X_test_embedded, np.ones((2, 2)))
+
+def test_held_out_split_needs_the_saved_texts(tmp_path):
+    split_path = str(tmp_path / "split.npz")
+    save_training_split(np.zeros((1, 2)), ["a"], np.zeros((1, 2)), ["a"], split_path)
+
+    with pytest.raises(SystemExit):
+        held_out_split(split_path)
+    with pytest.raises(SystemExit):
+        held_out_split(str(tmp_path / "missing.npz"))
@@ -0,0 +1,63 @@
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, sentences):
+        self.encoded.append(list(sentences))
+        return np.array([[len(s), 1.0] for s in sentences])
+
+
+def test_only_unseen_sentences_reach_the_encoder():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(encoder)
+
+    cache.encode(["I failed.", "It is fine."])
+    embeddings = cache.encode(["I failed.", "Everyone hates me."])
+
+    assert encoder.encoded == [["I failed.", "It is fine."], ["Everyone hates me."]]
+    assert embeddings.shape == (2, 2)
+    assert embeddings[1][0] == len("Everyone hates me.")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+def test_sentences_are_normalized_before_lookup():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(encoder)
+
+    cache.encode(["I  failed  again."])
+    cache.encode([" I failed again. "])
+
+    assert len(encoder.encoded) == 1
+
+def test_duplicate_sentences_in_one_call_are_encoded_once():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(encoder)
+
+    embeddings = cache.encode(["Same.", "Same."])
+    cache.encode(["Same.", "Same."])
+
+    assert encoder.encoded == [["Same."]]
+    assert len(embeddings) == 2
+    # one miss, then one hit: repeats within a call are counted once
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+def test_least_recently_used_entries_are_evicted():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(encoder, max_size=2)
+
+    cache.encode(["a", "b"])
+    cache.encode(["a"])
+    cache.encode(["c"])
+    cache.encode(["a"])
+    cache.encode(["b"])
+
+    assert encoder.encoded == [["a", "b"], ["c"], ["b"]]
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 2
@@ -0,0 +1,90 @@
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from embedding_store import EmbeddingStore, encoder_identity
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(t), t.count(" ")] for t in texts], dtype=np.float32)
+
+
+def test_only_new_texts_are_encoded_across_runs(tmp_path):
+    encoder = CountingEncoder()
+    first = EmbeddingStore(str(tmp_path), "encoder-a").encode(["I failed.", "It rained today."], encoder)
+
+    encoder.encoded.clear()
+    store = EmbeddingStore(str(tmp_path), "encoder-a")
+    second = store.encode(["It rained today.", "Nobody likes me.", "I failed."], encoder)
+
+    assert encoder.encoded == ["Nobody likes me."]
+    assert np.array_equal(second[[2, 0]], first)
+    assert second[1].tolist() == [16, 2]
+    assert len(store.meta["segments"]) == 2
+
+def test_changing_the_encoder_invalidates_the_store(tmp_path):
+    encoder = CountingEncoder()
+    EmbeddingStore(str(tmp_path), "encoder-a").encode(["I failed."], encoder)
+
+    store = EmbeddingStore(str(tmp_path), "encoder-b")
+
+    assert len(store) == 0
+    assert "I failed." not in store
+
+def test_compaction_merges_segments_and_drops_unused_texts(tmp_path):
+    encoder = CountingEncoder()
+    store = EmbeddingStore(str(tmp_path), "encoder-a")
+    store.encode(["a b", "c"], encoder)
+    store.encode(["d e f"], encoder)
+
+    kept = store.compact(keep_texts=["a b", "d e f"])
+
+    reopened = EmbeddingStore(str(tmp_path), "encoder-a")
+    assert kept == 2
+    assert len(reopened.meta["segments"]) == 1
+    assert "c" not in reopened
+    assert reopened.encode(["d e f"], encoder).tolist() == [[5, 2]]
+    assert sorted(os.listdir(tmp_path)) == ["meta.json", "seg-00003.keys.npy", "seg-00003.npy"]
+
+class FakeTensor:
+    # the bits of torch.Tensor weights_fingerprint uses
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def detach(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def contiguous(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class FakeSentenceTransformer:
+    def __init__(self, weights):
+        self.weights = weights
+
+    def __repr__(self):
+        return "FakeSentenceTransformer(pooling=mean)"
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def state_dict(self):
+        return {"layer.weight": FakeTensor(self.weights)}
+
+
+def test_encoder_identity_changes_with_the_weights_under_the_same_config():
+    original = encoder_identity("mini", FakeSentenceTransformer([1.0, 2.0]))
+
+    assert encoder_identity("mini", FakeSentenceTransformer([1.0, 2.0])) == original
+    assert encoder_identity("mini", FakeSentenceTransformer([1.0, 2.5])) != original
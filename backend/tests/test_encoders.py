@@ -0,0 +1,68 @@
+import shutil
+import numpy as np
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from encoders import MODEL_DIR, OnnxEncoder, load_encoder, pool
+
+
+MEAN_POOLING = {"word_embedding_dimension": 2, "pooling_mode_mean_tokens": True}
+
+def test_mean_pooling_ignores_padding():
+    hidden_states = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]])
+    attention_mask = np.array([[1, 1, 0]])
+
+    pooled = pool(hidden_states, attention_mask, MEAN_POOLING)
+
+    assert pooled.tolist() == [[2.0, 3.0]]
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        load_encoder("tensorflow")
+
+def test_missing_onnx_model_points_at_the_export_command(tmp_path):
+    with pytest.raises(FileNotFoundError, match="export --quantize"):
+        load_encoder("onnx-int8", model_dir=str(tmp_path))
+
+def test_onnx_encoder_tokenizes_pools_and_normalizes(tmp_path):
+    pytest.importorskip("onnxruntime")
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    # copy the real tokenizer + pooling config next to a tiny graph that turns
+    # every token id into a 2-d "hidden state" of [id, 1]
+    model_dir = tmp_path / "model"
+    shutil.copytree(MODEL_DIR, model_dir)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Cast", ["input_ids"], ["ids"], to=TensorProto.FLOAT),
+            helper.make_node("Unsqueeze", ["ids", "axis"], ["ids_3d"]),
+            helper.make_node("Mul", ["ids_3d", "zero"], ["zeros"]),
+            helper.make_node("Add", ["zeros", "one"], ["ones"]),
+            helper.make_node("Concat", ["ids_3d", "ones"], ["last_hidden_state"], axis=2),
+        ],
+        "fake-encoder",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 2])],
+        initializer=[
+            helper.make_tensor("axis", TensorProto.INT64, [1], [2]),
+            helper.make_tensor("zero", TensorProto.FLOAT, [], [0.0]),
+            helper.make_tensor("one", TensorProto.FLOAT, [], [1.0]),
+        ],
+    )
+    model_path = str(tmp_path / "fake.onnx")
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8), model_path)
+
+    encoder = OnnxEncoder(str(model_dir), model_path, batch_size=2)
+    embeddings = encoder.encode(["Hello.", "A much longer sentence than the first one.", "Hi"])
+
+    assert embeddings.shape == (3, 2)
+    assert embeddings.dtype == np.float32
+    # modules.json includes Normalize, so every embedding has unit length
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0)
+    # padding in the second batch must not change the first sentence's embedding
+    assert np.allclose(encoder.encode(["Hello."]), embeddings[:1])
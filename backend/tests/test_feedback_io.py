@@ -0,0 +1,62 @@
+import sqlite3
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from database import init_db, save_feedback, get_store, get_feedback_stats, get_training_feedback, mark_used_feedback
+from feedback_io import export_feedback, import_feedback
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    init_db(path)
+    save_feedback("I always fail", "Overgeneralization", None, True, 0.9, path=path)
+    mark_used_feedback(path=path)
+    save_feedback("They think I'm stupid", "Mind Reading", "Labeling", False, 0.6, path=path)
+    save_feedback("Ünïcode stays intact", "Labeling", None, False, None, path=path)
+    return path
+
+def test_pages_are_keyset_ranges(source):
+    pages = list(get_store(source).iter_feedback_pages(page_size=2))
+    assert [[row[0] for row in page] for page in pages] == [[1, 2], [3]]
+    assert list(get_store(source).iter_feedback_pages(page_size=2, after_id=2)) == [pages[1]]
+
+@pytest.mark.parametrize("extension", ["jsonl", "parquet"])
+@pytest.mark.parametrize("defer_indexes", [False, True])
+def test_export_import_round_trip(source, tmp_path, extension, defer_indexes):
+    export_path = str(tmp_path / f"feedback.{extension}")
+    assert export_feedback(export_path, source, page_size=2) == 3
+
+    target = str(tmp_path / "target.db")
+    init_db(target)
+    save_feedback("already here", "Labeling", None, True, 0.5, path=target)
+    assert import_feedback(export_path, target, batch_size=2, defer_indexes=defer_indexes) == 3
+
+    rows = get_store(target).retrieve_feedback()
+    # imported rows get new ids after the existing ones
+    assert [row[0] for row in rows] == [1, 2, 3, 4]
+    source_rows = get_store(source).retrieve_feedback()
+    assert [row[1:] for row in rows[1:]] == [row[1:] for row in source_rows]
+
+    assert sorted(get_training_feedback(path=target)) == [("They think I'm stupid", "Labeling"), ("Ünïcode stays intact", None)]
+    stats = get_feedback_stats(path=target)
+    assert {label["label"]: label["total"] for label in stats["labels"]} == {
+        "Labeling": 2, "Mind Reading": 1, "Overgeneralization": 1,
+    }
+    # the index and triggers are back after a deferred import
+    conn = sqlite3.connect(target)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    conn.close()
+    assert {"idx_feedback_unused", "feedback_stats_insert", "feedback_stats_update", "feedback_stats_delete"} <= names
+
+def test_failed_deferred_import_restores_indexes(source, tmp_path):
+    export_path = str(tmp_path / "bad.jsonl")
+    with open(export_path, "w") as f:
+        f.write('{"text": "fine", "predicted_distortion": "Labeling"}\n{"predicted_distortion": "Labeling"}\n')
+    target = str(tmp_path / "target.db")
+    with pytest.raises(ValueError):
+        import_feedback(export_path, target, defer_indexes=True)
+    conn = sqlite3.connect(target)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    conn.close()
+    assert "idx_feedback_unused" in names and "feedback_stats_insert" in names
@@ -0,0 +1,97 @@
+import queue
+import threading
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from database import init_db, get_store, retrieve_feedback, save_feedback
+import feedback_writer
+from feedback_writer import FeedbackWriter, FLUSH_RETRIES
+from metrics import FEEDBACK_ROWS_DROPPED
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    init_db(path)
+    return path
+
+def test_queued_rows_are_written_with_the_ids_handed_out(db_path):
+    writer = FeedbackWriter(get_store(db_path), batch_size=10, flush_interval_ms=20)
+
+    ids = [writer.submit(f"I always fail {i}", "Overgeneralization", None, True, 0.8) for i in range(25)]
+    writer.close()
+
+    rows = retrieve_feedback(path=db_path)
+    assert sorted(row[0] for row in rows) == sorted(ids)
+    assert len(set(ids)) == 25
+    assert writer.stats()["written"] == 25
+
+def test_reserved_ids_do_not_clash_with_direct_inserts(db_path):
+    writer = FeedbackWriter(get_store(db_path), flush_interval_ms=20)
+
+    queued_id = writer.submit("queued", "Labeling", None, True, 0.5)
+    direct_id = save_feedback("direct", "Labeling", None, True, 0.5, path=db_path)
+    writer.close()
+
+    assert direct_id != queued_id
+    assert len(retrieve_feedback(path=db_path)) == 2
+
+def test_full_queue_pushes_back_on_the_caller():
+    release = threading.Event()
+    writing = threading.Event()
+
+    class StalledStore:
+        def reserve_feedback_ids(self, count):
+            return range(1, count + 1)
+
+        def save_feedback_batch(self, rows):
+            writing.set()
+            release.wait()
+
+    writer = FeedbackWriter(StalledStore(), batch_size=1, flush_interval_ms=10, max_queue=2, enqueue_timeout=0.01)
+    writer.submit("a", None, None, True, 0.5)
+    writing.wait(5)
+    writer.submit("b", None, None, True, 0.5)
+    writer.submit("c", None, None, True, 0.5)
+
+    with pytest.raises(queue.Full):
+        writer.submit("d", None, None, True, 0.5)
+
+    release.set()
+    writer.close()
+    assert writer.stats()["written"] == 3
+
+def test_rows_are_dropped_loudly_after_repeated_failed_flushes(monkeypatch, caplog):
+    monkeypatch.setattr(feedback_writer.time, "sleep", lambda seconds: None)
+
+    class BrokenStore:
+        attempts = 0
+
+        def reserve_feedback_ids(self, count):
+            return range(1, count + 1)
+
+        def save_feedback_batch(self, rows):
+            BrokenStore.attempts += 1
+            raise OSError("disk full")
+
+    before = FEEDBACK_ROWS_DROPPED._values.get((), 0)
+    writer = FeedbackWriter(BrokenStore(), flush_interval_ms=10)
+    writer.submit("a", None, None, True, 0.5)
+    writer.close()
+
+    # the batch attempts, then the row on its own
+    assert writer.stats()["dropped"] == 1 and BrokenStore.attempts == FLUSH_RETRIES + 1
+    assert FEEDBACK_ROWS_DROPPED._values[()] - before == 1
+    assert len([r for r in caplog.records if r.exc_info]) == FLUSH_RETRIES + 1
+    assert "Dropped 1 of 1 feedback rows" in caplog.text
+
+def test_a_bad_row_only_drops_itself(db_path, monkeypatch):
+    monkeypatch.setattr(feedback_writer.time, "sleep", lambda seconds: None)
+    writer = FeedbackWriter(get_store(db_path), batch_size=20, flush_interval_ms=20)
+
+    ids = [writer.submit(f"I always fail {i}", "Overgeneralization", None, True, 0.8) for i in range(8)]
+    writer.submit(None, "Labeling", None, True, 0.5)
+    writer.close()
+
+    assert sorted(row[0] for row in retrieve_feedback(path=db_path)) == sorted(ids)
+    assert (writer.stats()["written"], writer.stats()["dropped"]) == (8, 1)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from incremental import DocumentStore, RevisionConflict
+
+
+class FakeClassifier:
+    # labels every sentence "Labeling" with confidence 0.9, and records what it saw
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, sentences):
+        self.seen.append(list(sentences))
+        n = len(sentences)
+        return np.array(["Labeling"] * n), np.full(n, 0.9), np.ones(n, dtype=bool)
+
+
+@pytest.fixture
+def store():
+    return DocumentStore()
+
+def test_first_revision_classifies_every_sentence(store):
+    classify = FakeClassifier()
+
+    delta = store.update("doc", None, "I failed. I am a loser.", classify)
+
+    assert isinstance(delta["revision"], int)
+    assert delta["full"] is True
+    assert [s["input"] for s in delta["added"]] == ["I failed.", "I am a loser."]
+    assert classify.seen == [["I failed.", "I am a loser."]]
+
+def test_only_edited_sentences_are_classified(store):
+    classify = FakeClassifier()
+    first = store.update("doc", None, "I failed. I am a loser. It rained.", classify)
+    loser_id = first["added"][1]["id"]
+
+    delta = store.update("doc", first["revision"], "I failed. I am a winner. It rained. The end.", classify)
+
+    assert classify.seen[-1] == ["I am a winner.", "The end."]
+    assert [(s["id"], s["input"]) for s in delta["changed"]] == [(loser_id, "I am a winner.")]
+    assert [s["input"] for s in delta["added"]] == ["The end."]
+    assert delta["removed"] == []
+    assert delta["revision"] == first["revision"] + 1
+
+def test_removed_sentences_and_shifted_offsets_are_reported(store):
+    classify = FakeClassifier()
+    first = store.update("doc", None, "Intro. I failed. It rained.", classify)
+    intro_id, _, rained_id = [s["id"] for s in first["added"]]
+
+    delta = store.update("doc", first["revision"], "I failed. It rained.", classify)
+
+    assert delta["removed"] == [intro_id]
+    assert classify.seen[-1] == []
+    moved = {m["id"]: (m["start"], m["end"]) for m in delta["moved"]}
+    assert moved[rained_id] == (10, 20)
+
+def test_stale_or_unknown_revision_is_a_conflict(store):
+    classify = FakeClassifier()
+    first = store.update("doc", None, "I failed.", classify)
+
+    with pytest.raises(RevisionConflict) as conflict:
+        store.update("doc", first["revision"] + 5, "I failed again.", classify)
+    assert conflict.value.revision == first["revision"]
+
+    with pytest.raises(RevisionConflict):
+        store.update("other", first["revision"], "Hello.", classify)
+
+def test_expired_documents_are_forgotten():
+    store = DocumentStore(ttl_seconds=0)
+    first = store.update("doc", None, "I failed.", FakeClassifier())
+
+    with pytest.raises(RevisionConflict):
+        store.update("doc", first["revision"], "I failed again.", FakeClassifier())
+
+def test_a_worker_without_the_document_falls_back_to_a_full_rescore():
+    # two gunicorn workers, each with its own store; the client's edits alternate between them
+    worker_a, worker_b = DocumentStore(), DocumentStore()
+    classify = FakeClassifier()
+    first = worker_a.update("doc", None, "I failed. It rained.", classify)
+
+    with pytest.raises(RevisionConflict) as conflict:
+        worker_b.update("doc", first["revision"], "I failed. It snowed.", classify)
+    assert conflict.value.revision is None
+    resent = worker_b.update("doc", None, "I failed. It snowed.", classify)
+    assert resent["full"] is True
+    assert [(s["input"], s["prediction"]) for s in resent["added"]] == [("I failed.", "Labeling"), ("It snowed.", "Labeling")]
+
+    # worker A's copy is a revision behind, and its numbering can't line up with worker B's
+    with pytest.raises(RevisionConflict):
+        worker_a.update("doc", resent["revision"], "I failed. It snowed. Again.", classify)
+    delta = worker_b.update("doc", resent["revision"], "I failed. It snowed. Again.", classify)
+    assert [s["input"] for s in delta["added"]] == ["Again."]
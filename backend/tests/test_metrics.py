@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from metrics import Registry, finish_request, server_timing, stage, start_request
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "Test latency", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage="encode")
+    text = registry.render()
+    assert 'test_seconds_bucket{stage="encode",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{stage="encode",le="1"} 3' in text
+    assert 'test_seconds_bucket{stage="encode",le="+Inf"} 4' in text
+    assert 'test_seconds_count{stage="encode"} 4' in text
+    assert 'test_seconds_sum{stage="encode"} 3.65' in text
+
+def test_counter_and_gauge_render_labels():
+    registry = Registry()
+    counter = registry.counter("test_requests_total", "Requests", ("endpoint", "status"))
+    counter.inc(endpoint="/predict", status=200)
+    counter.inc(endpoint="/predict", status=200)
+    registry.gauge("test_cache", "Cache", lambda: {"hits": 3, "misses": 1}, labelnames=("stat",))
+    registry.gauge("test_missing", "Not loaded yet", lambda: None)
+    text = registry.render()
+    assert 'test_requests_total{endpoint="/predict",status="200"} 2' in text
+    assert 'test_cache{stat="hits"} 3' in text
+    assert "# TYPE test_missing gauge" in text
+
+def test_stages_are_collected_per_request():
+    token = start_request()
+    with stage("encode"):
+        pass
+    with stage("encode"):
+        pass
+    with stage("classify"):
+        pass
+    stages = finish_request(token)
+    assert [name for name, _ in stages] == ["encode", "encode", "classify"]
+    # outside a request, stages only go to the histogram
+    with stage("encode"):
+        pass
+    assert finish_request(start_request()) == []
+
+def test_server_timing_sums_repeated_stages():
+    header = server_timing([("encode", 0.001), ("classify", 0.002), ("encode", 0.003)], total=0.01)
+    assert header == "encode;dur=4.00, classify;dur=2.00, total;dur=10.00"
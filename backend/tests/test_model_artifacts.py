@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sklearn.linear_model import LogisticRegression
+import shutil
+from model_artifacts import export_arrays, load_model
+from memory import process_memory
+
+
+@pytest.fixture
+def fitted_model():
+    rng = np.random.RandomState(0)
+    X = rng.randn(60, 8)
+    y = np.array(["Labeling", "No Distortion", "Overgeneralization"])[rng.randint(0, 3, 60)]
+    return LogisticRegression(max_iter=1000).fit(X, y), X
+
+def test_memory_mapped_arrays_match_the_pickled_model(fitted_model, tmp_path):
+    model, X = fitted_model
+    export_arrays(model, str(tmp_path))
+
+    loaded = load_model(arrays_dir=str(tmp_path), model_format="npy")
+
+    assert isinstance(loaded.coef_, np.memmap)
+    assert np.allclose(loaded.predict_proba(X), model.predict_proba(X))
+    assert list(loaded.predict(X)) == list(model.predict(X))
+
+def test_binary_model_arrays_match_the_pickled_model(tmp_path):
+    rng = np.random.RandomState(1)
+    X = rng.randn(40, 4)
+    model = LogisticRegression().fit(X, np.where(X[:, 0] > 0, "No Distortion", "Labeling"))
+    export_arrays(model, str(tmp_path))
+
+    loaded = load_model(arrays_dir=str(tmp_path), model_format="npy")
+
+    assert np.allclose(loaded.predict_proba(X), model.predict_proba(X))
+
+def test_a_half_replaced_set_of_arrays_is_refused(fitted_model, tmp_path):
+    model, X = fitted_model
+    old, new = str(tmp_path / "old"), str(tmp_path / "new")
+    model.model_version_ = 1
+    export_arrays(model, old)
+    retrained = LogisticRegression(max_iter=1000).fit(X * 2, model.predict(X))
+    retrained.model_version_ = 2
+    export_arrays(retrained, new)
+
+    # save_model has replaced coef.npy but not yet the rest
+    shutil.copy(os.path.join(new, "coef.npy"), os.path.join(old, "coef.npy"))
+    with pytest.raises(ValueError):
+        load_model(arrays_dir=old, model_format="npy")
+
+    for name in ("intercept.npy", "version.npy", "manifest.json"):
+        shutil.copy(os.path.join(new, name), os.path.join(old, name))
+    loaded = load_model(arrays_dir=old, model_format="npy")
+    assert loaded.model_version_ == 2 and np.allclose(loaded.coef_, retrained.coef_)
+
+def test_process_memory_reports_shared_and_private_pages():
+    usage = process_memory()
+    if usage is None:
+        pytest.skip("/proc is not available on this platform")
+
+    assert usage["rss_mb"] > 0
+    assert usage["shared_mb"] + usage["private_mb"] == pytest.approx(usage["rss_mb"], abs=1)
@@ -0,0 +1,184 @@
+import numpy as np
+import pytest
+import shutil
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sklearn.linear_model import LogisticRegression
+from model_artifacts import artifact_paths, load_model, load_served_model, pin_version, pinned_version, save_model
+from model_reloader import ModelReloader, validate_model
+
+
+def fit(seed, classes=("Labeling", "No Distortion", "Overgeneralization")):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(60, 4)
+    return LogisticRegression().fit(X, np.array(classes)[rng.randint(0, len(classes), 60)])
+
+@pytest.fixture
+def artifacts(tmp_path):
+    path, arrays_dir = str(tmp_path / "model.pkl"), str(tmp_path / "arrays")
+    save_model(fit(0), path, arrays_dir)
+    return path, arrays_dir
+
+def make_reloader(artifacts, version):
+    path, arrays_dir = artifacts
+    served = []
+    reloader = ModelReloader(
+        load=lambda: load_model(path, arrays_dir, model_format="pickle"),
+        get_version=lambda: version["number"],
+        validate=lambda estimator: validate_model(estimator, np.zeros(4)),
+        on_swap=served.append,
+        watched_paths=artifact_paths(path, arrays_dir),
+        poll_interval=0,
+    )
+    return reloader, served
+
+def test_new_artifact_is_swapped_in_with_its_version(artifacts):
+    version = {"number": 1}
+    reloader, served = make_reloader(artifacts, version)
+    reloader.load_current()
+
+    assert reloader.check() is False
+
+    save_model(fit(1), *artifacts)
+    version["number"] = 2
+
+    assert reloader.check() is True
+    assert served[-1].version == 2
+    assert reloader.status() == {"version": 2, "history": [1], "last_error": None}
+
+def test_invalid_artifact_keeps_the_current_model(artifacts):
+    version = {"number": 1}
+    reloader, served = make_reloader(artifacts, version)
+    reloader.load_current()
+
+    with open(artifacts[0], "wb") as f:
+        f.write(b"not a pickle")
+
+    assert reloader.check() is False
+    assert served[-1].version == 1
+    assert reloader.status()["last_error"]
+
+def test_npy_arrays_are_only_swapped_in_once_the_whole_set_is_written(artifacts, tmp_path):
+    path, arrays_dir = artifacts
+    served = []
+    reloader = ModelReloader(
+        load=lambda: load_model(path, arrays_dir, model_format="npy"),
+        get_version=lambda: None,
+        validate=lambda estimator: validate_model(estimator, np.zeros(4)),
+        on_swap=served.append,
+        watched_paths=artifact_paths(path, arrays_dir),
+        poll_interval=0,
+    )
+    history = dict(history_dir=str(tmp_path / "history"), pin_path=str(tmp_path / "pin.json"))
+    save_model(fit(0), path, arrays_dir, version=1, **history)
+    reloader.load_current()
+
+    # a poll lands while save_model has only written the new coef.npy
+    staging = str(tmp_path / "staging")
+    save_model(fit(1), str(tmp_path / "staging.pkl"), staging, version=2, **history)
+    shutil.copy(os.path.join(staging, "coef.npy"), os.path.join(arrays_dir, "coef.npy"))
+    assert reloader.check() is False
+    assert served[-1].version == 1
+
+    for name in ("intercept.npy", "version.npy", "manifest.json"):
+        shutil.copy(os.path.join(staging, name), os.path.join(arrays_dir, name))
+    assert reloader.check() is True
+    assert served[-1].version == 2
+
+def test_rollback_restores_the_previous_model(artifacts):
+    version = {"number": 1}
+    reloader, served = make_reloader(artifacts, version)
+    first = reloader.load_current()
+    save_model(fit(1), *artifacts)
+    version["number"] = 2
+    reloader.check()
+
+    assert reloader.rollback() is first
+    assert served[-1] is first
+    # rolled back models stay pinned until the artifacts change again
+    assert reloader.check() is False
+    with pytest.raises(ValueError):
+        reloader.rollback()
+
+def test_validation_rejects_a_model_for_a_different_embedding_size():
+    with pytest.raises(ValueError):
+        validate_model(fit(0), np.zeros(8))
+
+def make_published(tmp_path):
+    paths = {
+        "path": str(tmp_path / "model.pkl"),
+        "arrays_dir": str(tmp_path / "arrays"),
+        "history_dir": str(tmp_path / "history"),
+        "pin_path": str(tmp_path / "pin.json"),
+    }
+    return paths, lambda model, version: save_model(model, version=version, **paths)
+
+def make_worker(paths, db_version=99):
+    served = []
+    reloader = ModelReloader(
+        load=lambda: load_served_model(model_format="pickle", **paths),
+        get_version=lambda: db_version,
+        validate=lambda estimator: validate_model(estimator, np.zeros(4)),
+        on_swap=served.append,
+        watched_paths=artifact_paths(paths["path"], paths["arrays_dir"], paths["pin_path"]),
+        poll_interval=0,
+        pin=lambda version: pin_version(version, paths["history_dir"], paths["pin_path"]),
+    )
+    return reloader, served
+
+def test_served_version_comes_from_the_artifact_not_the_database(tmp_path):
+    paths, publish = make_published(tmp_path)
+    publish(fit(0), 3)
+    # the model_versions row for version 4 isn't written yet when the worker polls
+    reloader, served = make_worker(paths, db_version=3)
+    reloader.load_current()
+    publish(fit(1), 4)
+
+    assert reloader.check() is True
+    assert served[-1].version == 4
+    assert load_model(arrays_dir=paths["arrays_dir"], model_format="npy").model_version_ == 4
+
+def test_rollback_is_pinned_for_every_worker(tmp_path):
+    paths, publish = make_published(tmp_path)
+    publish(fit(0), 1)
+    first, _ = make_worker(paths)
+    second, second_served = make_worker(paths)
+    first.load_current()
+    second.load_current()
+    publish(fit(1), 2)
+    first.check()
+    second.check()
+
+    assert first.rollback().version == 1
+    assert pinned_version(paths["pin_path"]) == 1
+    # the other worker picks the pin up on its next poll, a restarted one at startup
+    assert second.check() is True
+    assert second_served[-1].version == 1
+    restarted, _ = make_worker(paths)
+    assert restarted.load_current().version == 1
+
+    # publishing the next model unpins the rollback
+    publish(fit(2), 3)
+    assert pinned_version(paths["pin_path"]) is None
+    assert second.check() is True
+    assert second_served[-1].version == 3
+
+def test_polls_before_warmup_are_skipped(artifacts):
+    path, arrays_dir = artifacts
+    probe = {"embedding": None}
+    reloader = ModelReloader(
+        load=lambda: load_model(path, arrays_dir, model_format="pickle"),
+        get_version=lambda: 1,
+        validate=lambda estimator: validate_model(estimator, probe["embedding"]),
+        on_swap=lambda served: None,
+        watched_paths=artifact_paths(path, arrays_dir),
+        poll_interval=0,
+    )
+
+    # the poller can fire while warmup is still loading the encoder
+    assert reloader.check() is False
+    assert reloader.status()["last_error"] is None
+
+    probe["embedding"] = np.zeros(4)
+    assert reloader.load_current().version == 1
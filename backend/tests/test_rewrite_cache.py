@@ -0,0 +1,96 @@
+import threading
+import time
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from llm import StubClient, build_rewrite_prompt
+from rewrite_cache import RewriteCache, rewrite_key
+
+DISTORTIONS = [{"input": "I always fail.", "prediction": "Overgeneralization", "confidence": 0.8}]
+
+
+def test_key_depends_on_every_part():
+    key = rewrite_key("I always fail.", DISTORTIONS, "gemini", 1)
+    assert key == rewrite_key("I always fail.", DISTORTIONS, "gemini", 1)
+    assert key != rewrite_key("I always fail!", DISTORTIONS, "gemini", 1)
+    assert key != rewrite_key("I always fail.", [], "gemini", 1)
+    assert key != rewrite_key("I always fail.", DISTORTIONS, "stub", 1)
+    assert key != rewrite_key("I always fail.", DISTORTIONS, "gemini", 2)
+
+def test_cached_until_ttl_expires():
+    cache = RewriteCache(ttl_seconds=0.05)
+    calls = []
+    compute = lambda: calls.append(1) or f"rewrite {len(calls)}"
+    assert cache.get_or_compute("a", compute) == "rewrite 1"
+    assert cache.get_or_compute("a", compute) == "rewrite 1"
+    time.sleep(0.06)
+    assert cache.get_or_compute("a", compute) == "rewrite 2"
+    assert cache.stats()["hits"] == 1
+
+def test_least_recently_used_is_evicted():
+    cache = RewriteCache(max_size=2)
+    for key in ("a", "b"):
+        cache.get_or_compute(key, lambda: key)
+    cache.get_or_compute("a", lambda: "unused")
+    cache.get_or_compute("c", lambda: "c")
+    assert cache.get_or_compute("a", lambda: "unused") == "a"
+    assert cache.get_or_compute("b", lambda: "recomputed") == "recomputed"
+    assert cache.stats()["evictions"] == 2
+
+def test_concurrent_identical_requests_share_one_call():
+    cache = RewriteCache()
+    stub = StubClient(delay=0.1)
+    prompt = build_rewrite_prompt("I always fail.", DISTORTIONS)
+    results = []
+
+    def request():
+        results.append(cache.get_or_compute("key", lambda: stub.generate(prompt)))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub.calls == 1
+    assert results == ["Rewritten: I always fail."] * 8
+    assert cache.stats()["coalesced"] == 7
+
+def test_failures_reach_waiters_and_are_not_cached():
+    cache = RewriteCache()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_compute("key", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    owner = threading.Thread(target=request)
+    owner.start()
+    started.wait()
+    request()
+    owner.join()
+    assert errors == ["upstream down", "upstream down"]
+    assert cache.get_or_compute("key", lambda: "ok") == "ok"
+
+def test_waiters_time_out():
+    cache = RewriteCache()
+    stub = StubClient(delay=0.2)
+    owner = threading.Thread(target=lambda: cache.get_or_compute("key", lambda: stub.generate("")))
+    owner.start()
+    time.sleep(0.02)
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute("key", lambda: "unused", timeout=0.01)
+    owner.join()
+
+def test_stub_times_out_past_its_timeout():
+    with pytest.raises(TimeoutError):
+        StubClient(delay=1).generate("", timeout=0.01)
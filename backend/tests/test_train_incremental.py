@@ -0,0 +1,48 @@
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sklearn.linear_model import LogisticRegression
+import pytest
+import train_incremental
+from train_incremental import incremental_update
+
+
+def make_data(rng, n):
+    X = rng.randn(n, 6)
+    y = np.array(["Labeling", "No Distortion", "Overgeneralization"])[np.argmax(X[:, :3], axis=1)]
+    return X, y
+
+def test_incremental_update_warm_starts_and_keeps_the_original_model():
+    rng = np.random.RandomState(0)
+    X_train, y_train = make_data(rng, 200)
+    X_new, y_new = make_data(rng, 20)
+    model = LogisticRegression(max_iter=1000).fit(X_train, y_train)
+    original_coef = model.coef_.copy()
+
+    updated, used_X, used_y = incremental_update(model, X_train, y_train, X_new, y_new)
+
+    assert np.array_equal(model.coef_, original_coef)
+    assert not np.array_equal(updated.coef_, original_coef)
+    assert updated.warm_start is False
+    assert len(used_y) == 20
+    full = LogisticRegression(max_iter=1000).fit(np.vstack([X_train, X_new]), np.concatenate([y_train, y_new]))
+    assert np.allclose(updated.predict_proba(X_new), full.predict_proba(X_new), atol=1e-2)
+
+def test_feedback_with_unknown_labels_is_skipped():
+    rng = np.random.RandomState(1)
+    X_train, y_train = make_data(rng, 100)
+    model = LogisticRegression(max_iter=1000).fit(X_train, y_train)
+    X_new = rng.randn(2, 6)
+    y_new = np.array(["Labeling", "Mind Reading"])
+
+    updated, used_X, used_y = incremental_update(model, X_train, y_train, X_new, y_new)
+
+    assert list(used_y) == ["Labeling"]
+    assert list(updated.classes_) == list(model.classes_)
+
+def test_main_without_a_training_split_explains_what_to_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(train_incremental, "TRAINING_SPLIT_PATH", str(tmp_path / "missing.npz"))
+
+    with pytest.raises(SystemExit, match="train_model.py"):
+        train_incremental.main(tolerance=0.01, force=False)
@@ -0,0 +1,35 @@
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sklearn.linear_model import LogisticRegression
+from tune_model import make_search, results_table
+
+
+def make_data():
+    rng = np.random.RandomState(0)
+    X = rng.randn(300, 5)
+    y = np.array(["Labeling", "No Distortion", "Overgeneralization"])[np.argmax(X[:, :3], axis=1)]
+    return X, y
+
+def test_halving_search_drops_candidates_between_rounds():
+    X, y = make_data()
+    search = make_search(LogisticRegression(max_iter=200), {"C": [0.001, 0.01, 0.1, 1.0, 10.0, 100.0]}, "halving", n_jobs=2)
+    search.fit(X, y)
+
+    table = results_table(search)
+
+    rounds = table.groupby("iter").size()
+    assert table["iter"].iloc[0] == table["iter"].max()
+    assert rounds.iloc[-1] < rounds.iloc[0]
+    assert {"mean_fit_time", "mean_test_score", "n_resources"} <= set(table.columns)
+
+def test_grid_search_results_are_ranked():
+    X, y = make_data()
+    search = make_search(LogisticRegression(max_iter=200), {"C": [0.01, 1.0]}, "grid", n_jobs=2)
+    search.fit(X, y)
+
+    table = results_table(search)
+
+    assert list(table["rank_test_score"]) == sorted(table["rank_test_score"])
+    assert len(table) == 2
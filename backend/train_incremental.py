@@ -0,0 +1,110 @@
+import argparse
+import copy
+import os
+
+import joblib
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+from database import (
+    get_training_feedback_with_ids,
+    mark_used_feedback_ids,
+    save_model_version,
+    get_latest_version,
+)
+from model_artifacts import (
+    MODEL_PATH, ARRAYS_DIR, TRAINING_SPLIT_PATH, load_held_out_texts, load_training_split, save_model, save_training_split,
+)
+
+# a warm-started lbfgs only needs a few iterations to move from the current
+# weights to the optimum with the new rows included
+INCREMENTAL_MAX_ITER = 100
+
+
+def incremental_update(model, X_train, y_train, X_new, y_new, max_iter=INCREMENTAL_MAX_ITER):
+    # returns a copy of the fitted LogisticRegression refit on the cached training
+    # rows + the new feedback rows, starting from the current coefficients.
+    # This is still a refit over the whole training set: every lbfgs iteration reads
+    # all of X_train, so its cost grows with the training set, not with the feedback.
+    # What it saves over train_model.py is rebuilding the dataset, re-encoding
+    # anything but the new texts, and most of the solver iterations (thanks to the
+    # warm start); it gives the same model a full refit would
+    known = np.isin(y_new, model.classes_)
+    if not known.all():
+        # warm starting can't add classes, new labels need a full train_model.py run
+        print(f"Skipping {int((~known).sum())} feedback rows with labels the model doesn't know")
+    X_new, y_new = X_new[known], y_new[known]
+
+    updated = copy.deepcopy(model)
+    updated.set_params(warm_start=True, max_iter=max_iter)
+    updated.fit(np.vstack([X_train, X_new]), np.concatenate([y_train, y_new]))
+    updated.set_params(warm_start=False, max_iter=model.max_iter)
+    return updated, X_new, y_new
+
+
+def main(tolerance, force):
+    if not os.path.exists(TRAINING_SPLIT_PATH):
+        raise SystemExit(f"No cached training split at {TRAINING_SPLIT_PATH}, run train_model.py first")
+
+    feedback_data = get_training_feedback_with_ids()
+    if len(feedback_data) == 0:
+        print("No new feedback to train on")
+        return
+
+    from sentence_transformers import SentenceTransformer
+    from embedding_store import EmbeddingStore, encoder_identity
+
+    model = joblib.load(MODEL_PATH)
+    X_train, y_train, X_test, y_test = load_training_split(TRAINING_SPLIT_PATH)
+
+    # same encoder + store as train_model.py, so only the new feedback texts are encoded
+    encoder = SentenceTransformer("all-MiniLM-L6-v2")
+    embedding_store = EmbeddingStore(encoder_id=encoder_identity("all-MiniLM-L6-v2", encoder))
+    texts = [text for _, text, _ in feedback_data]
+    X_new = embedding_store.encode(texts, encoder)
+    y_new = np.array([label for _, _, label in feedback_data]).astype(str)
+    # rows with labels the model doesn't know are skipped and stay unused for train_model.py
+    used_ids = [row[0] for row, known in zip(feedback_data, np.isin(y_new, model.classes_)) if known]
+
+    previous_accuracy = accuracy_score(y_test, model.predict(X_test))
+    updated, X_new, y_new = incremental_update(model, X_train, y_train, X_new, y_new)
+    accuracy = accuracy_score(y_test, updated.predict(X_test))
+    print(f"Held-out accuracy: {previous_accuracy:.2%} -> {accuracy:.2%} with {len(y_new)} feedback samples")
+
+    # don't ship an update that makes the held-out set noticeably worse
+    if accuracy < previous_accuracy - tolerance and not force:
+        print("Accuracy dropped more than the tolerance, keeping the current model")
+        return
+
+    new_version = get_latest_version() + 1
+    save_model(updated, MODEL_PATH, ARRAYS_DIR, version=new_version)
+    # the feedback rows become part of the cached training set for the next update
+    save_training_split(
+        np.vstack([X_train, X_new]), np.concatenate([y_train, y_new]), X_test, y_test,
+        texts_test=load_held_out_texts(TRAINING_SPLIT_PATH),
+    )
+
+    try:
+        mark_used_feedback_ids(used_ids)
+    except Exception as e:
+        print(f"Error with marking feedback as used in the database: {e}")
+
+    try:
+        save_model_version(
+            new_version,
+            len(y_train) + len(y_new),
+            accuracy,
+            f"Incremental update with {len(y_new)} new feedback samples",
+        )
+    except Exception as e:
+        print(f"Error with saving model: {e}")
+
+    print("Model successfully updated!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold unused feedback into the current model")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="largest held-out accuracy drop to accept")
+    parser.add_argument("--force", action="store_true", help="save the update even if accuracy dropped")
+    args = parser.parse_args()
+    main(args.tolerance, args.force)
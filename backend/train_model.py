@@ -3,8 +3,9 @@ from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
 from sentence_transformers import SentenceTransformer   
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
-import joblib
-import re
+from dataset import load_training_frame
+from model_artifacts import save_model, save_training_split
+from embedding_store import EmbeddingStore, encoder_identity
 
 from database import (
     get_training_feedback,
@@ -13,40 +14,12 @@ from database import (
     get_latest_version,
 )
 
-# Load Kaggle dataset
-kaggle_df = pd.read_csv("cognitive_distortion_dataset.csv")
+# compact the embedding store once it has more segments than this
+MAX_STORE_SEGMENTS = 8
 
-# Drop empty rows and any without a dominant distortion label
-kaggle_df = kaggle_df.dropna(subset=["Patient Question", "Dominant Distortion"])
-
-# load augmented data (AI-genereated)
-augmented_df = pd.read_csv("augmented_data.csv")
-
-# Split into no distortion vs distortion
-no_distortion = kaggle_df[kaggle_df["Dominant Distortion"]== "No Distortion"]
-has_distortion = kaggle_df[kaggle_df["Dominant Distortion"] != "No Distortion"]
-
-# for distortion rows, just grab the distorted sentence
-has_distortion_clean = has_distortion[["Distorted part", "Dominant Distortion"]]
-has_distortion_clean.columns = ["text", "label"]
-
-# for no distortion, split each paragraph into sentences
-no_distortion_sentences = []
-for _, row in no_distortion.iterrows():
-    sentences = re.split(r'(?<=[.!?])\s+', row["Patient Question"].strip())
-    for sentence in sentences:
-        if sentence.strip():
-            no_distortion_sentences.append({"text": sentence.strip(), "label": "No Distortion"})
-
-no_distortion_clean = pd.DataFrame(no_distortion_sentences)
-# Downsample "No Distortion" to ~400 to mitigate class imbalance
-no_distortion_downsampled = no_distortion_clean.sample(n=400, random_state=42)
-
-# Store this downsample + rest of data in the primary df
-kaggle_clean_df = pd.concat([has_distortion_clean, no_distortion_downsampled])
-
-# combine with augmented data
-df = pd.concat([kaggle_clean_df, augmented_df])
+# cleaned Kaggle + augmented training frame, shared with tune_model.py and cached
+# on disk so repeated runs skip re-reading and re-splitting the CSVs
+df = load_training_frame()
 
 # Load user feedback
 feedback_data = get_training_feedback()
@@ -63,11 +36,19 @@ y = df["label"]
 
 # load the encoder and encode everything (important for embeddings vs simple TF)
 encoder = SentenceTransformer("all-MiniLM-L6-v2")
-X_encoded = encoder.encode(X.tolist(), show_progress_bar=True)
+# texts encoded by earlier runs are loaded from the on-disk embedding store, so only
+# new texts (usually just the latest feedback) go through the encoder
+embedding_store = EmbeddingStore(encoder_id=encoder_identity("all-MiniLM-L6-v2", encoder))
+X_encoded = embedding_store.encode(X.tolist(), encoder, show_progress_bar=True)
+# every run adds a segment; fold them back into one (dropping texts we no longer train on)
+if len(embedding_store.meta["segments"]) > MAX_STORE_SEGMENTS:
+    embedding_store.compact(keep_texts=X.tolist())
 
 # Train/test split
-X_train, X_test, y_train, y_test = train_test_split(
-    X_encoded, y, test_size=0.2, random_state=42
+# the texts are split along (the shuffle only depends on random_state), so the held-out
+# sentences can be saved with the split for cascade.py's calibration
+X_train, X_test, y_train, y_test, _, texts_test = train_test_split(
+    X_encoded, y, X.tolist(), test_size=0.2, random_state=42
 )
 
 # Train a Logistic Regression classifier on top of the sentence embeddings.
@@ -117,7 +98,13 @@ print(classification_report(y_test, y_pred))
 
 # save the model to a file and essentially cache it for later use in the Flask API
 # this reduces latency for the end user since we don't have to retrain the model on every request / text that the user enters
-joblib.dump(pipeline, "distortion_model.pkl")
+# the version is stored inside the artifacts, so the app serves these weights under
+# this number even if it reloads before the model_versions row below is written
+new_version = get_latest_version() + 1
+save_model(pipeline, "distortion_model.pkl", "distortion_model", version=new_version)
+# keep the embedded split around so train_incremental.py can fold in feedback
+# without rebuilding the dataset
+save_training_split(X_train, y_train, X_test, y_test, texts_test=texts_test)
 
 try:
     if len(feedback_data) > 0:
@@ -126,7 +113,6 @@ except Exception as e:
     print(f"Error with marking feedback as used in the database: {e}")
 
 try:
-    new_version = get_latest_version() + 1
     save_model_version(
         new_version,
         len(X_train),
@@ -1,105 +1,150 @@
-from sklearn.model_selection import GridSearchCV
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
 import pandas as pd
-import re
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, StratifiedKFold
 from sklearn.pipeline import Pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
-from sklearn.model_selection import train_test_split
-
-
-# Load Kaggle dataset
-kaggle_df = pd.read_csv("cognitive_distortion_dataset.csv")
-
-# Drop empty rows and any without a dominant distortion label
-kaggle_df = kaggle_df.dropna(subset=["Patient Question", "Dominant Distortion"])
-
-# load augmented data (AI-genereated)
-augmented_df = pd.read_csv("augmented_data.csv")
-
-
-
-
-# Split into no distortion vs distortion
-no_distortion = kaggle_df[kaggle_df["Dominant Distortion"]== "No Distortion"]
-has_distortion = kaggle_df[kaggle_df["Dominant Distortion"] != "No Distortion"]
-
-# for distortion rows, just grab the distorted sentence
-has_distortion_clean = has_distortion[["Distorted part", "Dominant Distortion"]]
-has_distortion_clean.columns = ["text", "label"]
-
-# for no distortion, split each paragraph into sentences
-no_distortion_sentences = []
-for _, row in no_distortion.iterrows():
-    sentences = re.split(r'(?<=[.!?])\s+', row["Patient Question"].strip())
-    for sentence in sentences:
-        if sentence.strip():
-            no_distortion_sentences.append({"text": sentence.strip(), "label": "No Distortion"})
-
-no_distortion_clean = pd.DataFrame(no_distortion_sentences)
-# Downsample "No Distortion" to ~400 to mitigate class imbalance
-no_distortion_downsampled = no_distortion_clean.sample(n=400, random_state=42)
-
-# Store this downsample + rest of data in the primary df
-kaggle_clean_df = pd.concat([has_distortion_clean, no_distortion_downsampled])
-
-# combine with augmented data
-df = pd.concat([kaggle_clean_df, augmented_df])
-
-# Prepare features and labels
-X = df["text"]
-y = df["label"]
-
-# Train/test split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-
-# Build pipeline for ML: TF-IDF + Logistic Regression Model
-pipeline = Pipeline(
-    [
-        # first step in the pipeline is creating feature vectors using TF-IDF
-        (
-            "tfidf",
-            TfidfVectorizer(
-                stop_words="english",
-                ngram_range=(
-                    1,
-                    3,
-                ),  # only use unigrams and bigrams, which are often more informative for text classification tasks than all possible combinations of words
-                max_features=3000,  # reduce the vocabulary size, which can increase accuracy because it reduces noise from less informative words
-                min_df=2,  # skip terms that appear in less than 2 documents, since they are too rare to be useful
-                max_df=0.8,  # skip terms that appear in more than 80% of documents, since they aren't indicative of specific distortion types
+from sklearn.metrics import classification_report, accuracy_score, f1_score
+from dataset import held_out_split
+
+RESULTS_PATH = "tuning_results.csv"
+
+
+def build_tfidf_pipeline(memory=None):
+    # Build pipeline for ML: TF-IDF + Logistic Regression Model
+    return Pipeline(
+        [
+            # first step in the pipeline is creating feature vectors using TF-IDF
+            (
+                "tfidf",
+                TfidfVectorizer(
+                    stop_words="english",
+                    ngram_range=(
+                        1,
+                        3,
+                    ),  # only use unigrams and bigrams, which are often more informative for text classification tasks than all possible combinations of words
+                    max_features=3000,  # reduce the vocabulary size, which can increase accuracy because it reduces noise from less informative words
+                    min_df=2,  # skip terms that appear in less than 2 documents, since they are too rare to be useful
+                    max_df=0.8,  # skip terms that appear in more than 80% of documents, since they aren't indicative of specific distortion types
+                ),
             ),
-        ),
-        # second step in the pipeline is feeding the vectors to a Logistic Regression classifier
-        # so that we can get probability estimates on the test data
-        # we are also using class_weight='balanced' to handle any class imbalance, which occurs when classes (types of distortions) are not equally represented in the dataset
-        # this imbalance is problematic because the model may become biased towards the majority class (No Distortion in this case) and perform poorly on minority classes
-        # we are also setting max_iter to 1000 to ensure convergence, which means the model has enough iterations to find the optimal solution
-        # we are also using regularization, which reduces weights on specific words that aren't indicative of a particular distortion type
-        # lastly, we are using the lbfgs sovler to find the optimal weights for the LR model
-        (
-            "clf",
-            LogisticRegression(
-                max_iter=1000,
-                class_weight="balanced",
-                C=1.0,  # Regularization strength
-                solver="lbfgs",  # Better solver for multiclass
+            # second step in the pipeline is feeding the vectors to a Logistic Regression classifier
+            # so that we can get probability estimates on the test data
+            # we are also using class_weight='balanced' to handle any class imbalance, which occurs when classes (types of distortions) are not equally represented in the dataset
+            # this imbalance is problematic because the model may become biased towards the majority class (No Distortion in this case) and perform poorly on minority classes
+            # we are also setting max_iter to 1000 to ensure convergence, which means the model has enough iterations to find the optimal solution
+            # we are also using regularization, which reduces weights on specific words that aren't indicative of a particular distortion type
+            # lastly, we are using the lbfgs sovler to find the optimal weights for the LR model
+            (
+                "clf",
+                LogisticRegression(
+                    max_iter=1000,
+                    class_weight="balanced",
+                    C=1.0,  # Regularization strength
+                    solver="lbfgs",  # Better solver for multiclass
+                ),
             ),
-        ),
-    ]
-)
+        ],
+        memory=memory,
+    )
 
 
-param_grid = {
+# the TF-IDF + LogisticRegression experiment this script originally ran
+TFIDF_PARAM_GRID = {
     'tfidf__max_features': [3000, 5000, 10000],
     'tfidf__ngram_range': [(1,1), (1,2), (1,3)],
     'clf__C': [0.01, 0.1, 1.0, 10.0],
 }
 
-grid_search = GridSearchCV(pipeline, param_grid, cv=5, scoring='f1_macro')
-grid_search.fit(X_train, y_train)
+# the model production serves: LogisticRegression on MiniLM sentence embeddings
+EMBEDDING_PARAM_GRID = {
+    'C': list(np.logspace(-3, 2, 11)),
+    'class_weight': ["balanced", None],
+    'tol': [1e-4, 1e-3],
+}
+
 
-print(f"Best parameters: {grid_search.best_params_}")
-print(f"Best F1 score: {grid_search.best_score_:.2%}")
\ No newline at end of file
+def load_embeddings(texts):
+    # sentence embeddings come from the same on-disk store train_model.py fills,
+    # so tuning runs don't re-encode the corpus
+    from sentence_transformers import SentenceTransformer
+    from embedding_store import EmbeddingStore, encoder_identity
+
+    encoder = SentenceTransformer("all-MiniLM-L6-v2")
+    store = EmbeddingStore(encoder_id=encoder_identity("all-MiniLM-L6-v2", encoder))
+    return store.encode(texts, encoder, show_progress_bar=True)
+
+
+def make_search(estimator, param_grid, search, n_jobs, cv=5):
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=42)
+    if search == "halving":
+        # successive halving: every candidate is scored on a small sample first and
+        # only the best third move on to 3x more data, so bad settings are dropped early
+        return HalvingGridSearchCV(
+            estimator, param_grid, cv=folds, scoring='f1_macro', factor=3,
+            min_resources="exhaust", aggressive_elimination=True, n_jobs=n_jobs, random_state=42,
+        )
+    return GridSearchCV(estimator, param_grid, cv=folds, scoring='f1_macro', n_jobs=n_jobs)
+
+
+def results_table(search):
+    # one row per candidate (per halving round), best first, with fit times
+    results = pd.DataFrame(search.cv_results_)
+    columns = ["params", "mean_test_score", "std_test_score", "mean_fit_time", "std_fit_time", "mean_score_time", "rank_test_score"]
+    if "iter" in results:
+        # halving: the last round (most data) first
+        columns = ["iter", "n_resources"] + columns
+        return results[columns].sort_values(["iter", "mean_test_score"], ascending=False)
+    return results[columns].sort_values("rank_test_score")
+
+
+def main(mode, search, n_jobs, results_path):
+    # Train/test split: the held-out rows of the last train_model.py run, so the held-out
+    # scores below compare with training's
+    X_train, X_test, y_train, y_test, X_test_embedded = held_out_split()
+
+    if mode == "embeddings":
+        X_train, X_test = load_embeddings(X_train), X_test_embedded
+        estimator = LogisticRegression(max_iter=1000, solver="lbfgs")
+        param_grid = EMBEDDING_PARAM_GRID
+        cache_dir = None
+    else:
+        # cache fitted TF-IDF steps, so candidates that only differ in C reuse them
+        cache_dir = tempfile.mkdtemp(prefix="tfidf-cache-")
+        estimator = build_tfidf_pipeline(memory=cache_dir)
+        param_grid = TFIDF_PARAM_GRID
+
+    tuner = make_search(estimator, param_grid, search, n_jobs)
+    start = time.perf_counter()
+    tuner.fit(X_train, y_train)
+    elapsed = time.perf_counter() - start
+
+    table = results_table(tuner)
+    table.to_csv(results_path, index=False)
+
+    y_pred = tuner.best_estimator_.predict(X_test)
+    print(f"Scored {len(table)} candidates (across all rounds) in {elapsed:.1f}s, results written to {results_path}")
+    print(f"Best parameters: {tuner.best_params_}")
+    print(f"Best F1 score: {tuner.best_score_:.2%}")
+    print(f"Held-out accuracy: {accuracy_score(y_test, y_pred):.2%}, macro F1: {f1_score(y_test, y_pred, average='macro'):.2%}")
+    print(classification_report(y_test, y_pred))
+
+    if cache_dir:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter search for the distortion classifier")
+    parser.add_argument("--mode", choices=["embeddings", "tfidf"], default="embeddings",
+                        help="tune the served embedding model or the TF-IDF baseline")
+    parser.add_argument("--search", choices=["halving", "grid"], default="halving")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel fits (-1 uses every core)")
+    parser.add_argument("--results", default=RESULTS_PATH, help="CSV file for the results table")
+    args = parser.parse_args()
+    main(args.mode, args.search, args.n_jobs, args.results)
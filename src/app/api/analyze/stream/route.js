@@ -0,0 +1,19 @@
+// proxies the backend's NDJSON stream straight through, so each sentence's
+// result reaches the browser as soon as the backend has classified it
+
+export async function POST(request) {
+  const { text } = await request.json();
+
+  const url = `${process.env.BACKEND_URL}/predict/stream`;
+
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", },
+    body: JSON.stringify({ text }),
+  });
+
+  return new Response(response.body, {
+    status: response.status,
+    headers: { "Content-Type": response.headers.get("Content-Type") ?? "application/x-ndjson" },
+  });
+}
@@ -0,0 +1,23 @@
+// proxies the backend's server-sent events straight through, so the rewrite shows up
+// token by token; the request's signal aborts the backend call if the browser goes away
+
+export async function POST(request) {
+  const { text, distortions } = await request.json();
+
+  const url = `${process.env.BACKEND_URL}/rewrite/stream`;
+
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", },
+    body: JSON.stringify({ text, distortions }),
+    signal: request.signal,
+  });
+
+  return new Response(response.body, {
+    status: response.status,
+    headers: {
+      "Content-Type": response.headers.get("Content-Type") ?? "text/event-stream",
+      "Cache-Control": "no-cache",
+    },
+  });
+}